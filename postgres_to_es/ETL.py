@@ -2,6 +2,9 @@ import configparser
 import logging
 import os
 from functools import wraps
+from typing import Callable
+from queue import Queue
+from threading import Thread
 from time import sleep
 
 import backoff
@@ -12,8 +15,11 @@ from dotenv import load_dotenv
 from psycopg2.extras import DictCursor
 from redis import Redis
 
+from batch_size import AIMD, BatchSizeController
 from extractor.psql_extractor import PsqlExtractor
 from loader.es_loader import ESLoader
+from models import BulkOptions
+from notifier.redis_notifier import RedisNotifier
 from state_storage.base_storage import BaseStorage
 from state_storage.redis_storage import RedisStorage
 from transformer.transormer import Transformer
@@ -29,6 +35,50 @@ def coroutine(func):
     return inner
 
 
+class QueueSink:
+    """
+    Следующая стадия конвейера для корутины: пачка кладётся в очередь, а если очередь заполнена,
+    отправитель ждёт, пока в ней освободится место
+    """
+
+    def __init__(self, queue: Queue):
+        self.queue = queue
+
+    def send(self, item) -> None:
+        self.queue.put(item)
+
+
+class StageWorker(Thread):
+    """
+    Поток стадии конвейера: передаёт пачки из очереди в корутину стадии, которую создаёт make_stage
+    """
+
+    def __init__(self, queue: Queue, make_stage: Callable):
+        super().__init__(daemon=True)
+        self.queue = queue
+        self.make_stage = make_stage
+        self.stage = make_stage()
+        self.error = None
+
+    def restart(self):
+        # корутина, из которой вылетело исключение, закрыта, поэтому стадия создаётся заново
+        self.stage = self.make_stage()
+        self.error = None
+
+    def run(self):
+        while True:
+            item = self.queue.get()
+            try:
+                # после ошибки пачки только вынимаются из очереди, чтобы дальше по конвейеру не сдвинулась отметка
+                if self.error is None:
+                    self.stage.send(item)
+            except Exception as error:
+                logging.exception('ETL stage failed')
+                self.error = error
+            finally:
+                self.queue.task_done()
+
+
 def lookup_pg_max_time():
     return int(os.getenv('PG_MAX_TRIES'))
 
@@ -65,21 +115,66 @@ class ETL:
             transformer: Transformer,
             loader: ESLoader,
             limit,
-            periodic
+            periodic,
+            queue_size=0,
+            batch_size: BatchSizeController = None
     ):
         self.extractor = extractor
         self.transformer = transformer
         self.loader = loader
         self.limit = limit
         self.periodic = periodic
+        # 0 — стадии выполняются по очереди, иначе конвейером с очередями на queue_size пачек
+        self.queue_size = queue_size
+        # без контроллера LIMIT и размер bulk-чанка не меняются
+        self.batch_size = batch_size
 
     def run(self):
+        if self.queue_size:
+            self.run_pipelined()
         loader = self.loader.load()
         transformer = self.transformer.transform(loader)
         while True:
-            self.extractor.extract(transformer, limit=self.limit)
+            if self.extractor.extract(transformer, limit=self.limit):
+                self.loader.finish_run()
+            self.tune()
             sleep(self.periodic)
 
+    def run_pipelined(self):
+        """
+        Преобразование и загрузка работают в своих потоках: пока пачка N загружается в эластик,
+        пачка N+1 преобразуется, а N+2 выгружается из Postgresql. Заполненная очередь останавливает
+        предыдущую стадию. Пачки загружаются по порядку, и отметку загрузчик сохраняет только после
+        загрузки пачки, так что она не обгоняет данные в эластике
+        """
+        transform_queue, load_queue = Queue(maxsize=self.queue_size), Queue(maxsize=self.queue_size)
+        workers = [
+            StageWorker(load_queue, self.loader.load),
+            StageWorker(transform_queue, lambda: self.transformer.transform(QueueSink(load_queue))),
+        ]
+        for worker in workers:
+            worker.start()
+        while True:
+            started = self.extractor.extract(QueueSink(transform_queue), limit=self.limit)
+            # следующий запуск начнётся с сохранённой отметки, поэтому ждёт загрузки всех пачек
+            transform_queue.join()
+            load_queue.join()
+            for worker in workers:
+                if worker.error is not None:
+                    # пачки после ошибки не дошли до загрузки, отметка осталась на последней загруженной,
+                    # и следующий запуск выгрузит их снова
+                    logging.error('ETL run was interrupted by stage error: {!r}'.format(worker.error))
+                    worker.restart()
+            if started:
+                self.loader.finish_run()
+            self.tune()
+            sleep(self.periodic)
+
+    def tune(self):
+        stats = self.loader.take_stats()
+        if self.batch_size is not None:
+            self.limit, self.loader.bulk_options.chunk_size = self.batch_size.update(stats)
+
 
 if __name__ == '__main__':
     log_format = '%(asctime)s %(levelname)s: %(message)s'
@@ -92,8 +187,31 @@ if __name__ == '__main__':
     config.read('settings.ini')
 
     limit = int(os.getenv('LIMIT'))
+    extract_chunk_size = int(os.getenv('EXTRACT_CHUNK_SIZE', 0))
+    keyset_pagination = os.getenv('KEYSET_PAGINATION') == 'True'
+    pipeline_queue_size = int(os.getenv('PIPELINE_QUEUE_SIZE', 0))
     periodic_start = int(os.getenv('PERIODIC_START'))
 
+    bulk_options = BulkOptions(
+        threads=os.getenv('ES_BULK_THREADS', 1),
+        chunk_size=os.getenv('ES_BULK_CHUNK_SIZE', 500),
+        chunk_bytes=os.getenv('ES_BULK_CHUNK_BYTES', 100 * 1024 * 1024),
+        max_retries=os.getenv('ES_BULK_MAX_RETRIES', 3),
+    )
+
+    batch_size = None
+    if os.getenv('ADAPTIVE_BATCH_SIZE') == 'True':
+        batch_size = BatchSizeController(
+            limit=AIMD(limit, int(os.getenv('LIMIT_MIN', 10)), int(os.getenv('LIMIT_MAX', limit * 10))),
+            chunk_size=AIMD(
+                bulk_options.chunk_size,
+                int(os.getenv('ES_BULK_CHUNK_SIZE_MIN', 50)),
+                int(os.getenv('ES_BULK_CHUNK_SIZE_MAX', 2000))
+            ),
+            target_latency=float(os.getenv('ES_BULK_TARGET_LATENCY', 1)),
+            max_write_queue=int(os.getenv('ES_WRITE_QUEUE_MAX', 50)),
+        )
+
     dsl = {
         'dbname': os.getenv('PG_NAME'),
         'user': os.getenv('PG_USER'),
@@ -103,23 +221,32 @@ if __name__ == '__main__':
     }
 
     with PgConnector(dsl) as pg_conn:
-        redis_storage: BaseStorage = RedisStorage(
-            redis_adapter=Redis(host=os.getenv('REDIS_HOST'), port=os.getenv('REDIS_PORT'))
-        )
+        redis_adapter = Redis(host=os.getenv('REDIS_HOST'), port=os.getenv('REDIS_PORT'))
+        redis_storage: BaseStorage = RedisStorage(redis_adapter=redis_adapter)
 
         redis_storage.save_state({'can_start_ETL': 'True'})
 
-        extractor = PsqlExtractor(psql_connect=pg_conn, limit=limit, storage=redis_storage)
+        extractor = PsqlExtractor(
+            psql_connect=pg_conn,
+            limit=limit,
+            storage=redis_storage,
+            chunk_size=extract_chunk_size,
+            keyset=keyset_pagination
+        )
         loader = ESLoader(
             es_connect=elasticsearch.Elasticsearch(hosts=[os.getenv('ES_HOST')]),
-            storage=redis_storage
+            storage=redis_storage,
+            notifier=RedisNotifier(redis_adapter, channel=os.getenv('CACHE_INVALIDATION_CHANNEL')),
+            bulk_options=bulk_options
         )
         etl_process = ETL(
             extractor=extractor,
             transformer=Transformer(),
             loader=loader,
             limit=limit,
-            periodic=periodic_start
+            periodic=periodic_start,
+            queue_size=pipeline_queue_size,
+            batch_size=batch_size
         )
 
         etl_process.run()
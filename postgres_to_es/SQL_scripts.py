@@ -105,7 +105,71 @@ GET_UPDATED_PERSONS_INFO = '''
                 INNER JOIN content.person p ON fp.person_id = p.id
             WHERE tuf.changed_parameter = 'change person'
             GROUP BY p.id, p.full_name, fp.role
-            ORDER BY p.full_name;
+            ORDER BY p.full_name, p.id;
+            '''
+
+# выгрузка по курсорам (updated_at, id): изменённые строки таблицы читаются диапазоном по индексу (updated_at, id)
+GET_CHANGED_ROWS = '''
+            SELECT id, updated_at FROM content.{table}
+            WHERE (updated_at, id) > (%s, %s)
+            ORDER BY updated_at, id
+            LIMIT %s;
+            '''
+
+# фильмы, которые затрагивают изменённые строки таблицы
+CHANGED_FILMS = {
+    'film': 'SELECT unnest(%s::uuid[])',
+    'genre': 'SELECT gfw.film_id FROM content.film_genre gfw WHERE gfw.genre_id = ANY(%s::uuid[])',
+    'person': 'SELECT pfw.film_id FROM content.film_person pfw WHERE pfw.person_id = ANY(%s::uuid[])',
+}
+
+GET_FILMS_INFO = '''
+            SELECT * FROM (
+                SELECT
+                    fw.id as film_id,
+                    fw.title as title,
+                    fw.description as description,
+                    fw.rating as rating,
+                    (SELECT string_agg(g.name, ',')
+                     FROM content.film_genre gfw
+                        INNER JOIN content.genre g ON gfw.genre_id = g.id
+                     WHERE gfw.film_id = fw.id) as genre,
+                    (SELECT '[' || string_agg('{{"id":"' || cast(p.id as varchar) || '", "name":"'
+                     || p.full_name || '", "role":"' || pfw.role || '"}}', ',') || ']'
+                     FROM content.film_person pfw
+                        INNER JOIN content.person p ON pfw.person_id = p.id
+                     WHERE pfw.film_id = fw.id) as jsonify_persons
+                FROM content.film fw
+                WHERE fw.id IN ({films})
+            ) films
+            -- как и при выгрузке по last_update, фильмы без жанров или персон не загружаются
+            WHERE genre IS NOT NULL AND jsonify_persons IS NOT NULL
+            ORDER BY film_id;
+            '''
+
+GET_GENRES_INFO = '''
+            SELECT
+                g.id as genre_id,
+                g.name as genre_name,
+                g.description as genre_description,
+                coalesce(string_agg(DISTINCT (cast(gfw.film_id as VARCHAR)), ', '), '') as genre_films
+            FROM content.genre g
+                LEFT JOIN content.film_genre gfw ON g.id = gfw.genre_id
+            WHERE g.id = ANY(%s::uuid[])
+            GROUP BY g.id;
+            '''
+
+GET_PERSONS_INFO = '''
+            SELECT
+                p.id as person_id,
+                p.full_name as full_name,
+                fp.role as role,
+                string_agg(DISTINCT (cast(fp.film_id as VARCHAR)), ', ') as person_films
+            FROM content.person p
+                INNER JOIN content.film_person fp ON p.id = fp.person_id
+            WHERE p.id = ANY(%s::uuid[])
+            GROUP BY p.id, p.full_name, fp.role
+            ORDER BY p.full_name, p.id;
             '''
 
 DROP_TMP_TABLES = '''
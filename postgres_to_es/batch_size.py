@@ -0,0 +1,73 @@
+import logging
+from dataclasses import dataclass
+from typing import Tuple
+
+
+@dataclass
+class BulkStats:
+    """
+    Что загрузчик увидел за запуск ETL: число bulk-запросов и их общее время, отклонения с 429
+    и наибольшую очередь пула write в эластике
+    """
+    requests: int = 0
+    seconds: float = 0
+    rejected: int = 0
+    write_queue: int = 0
+
+    @property
+    def latency(self) -> float:
+        return self.seconds / self.requests if self.requests else 0.0
+
+
+class AIMD:
+    """
+    Размер по схеме AIMD: пока эластик справляется, растёт на step, при перегрузке уменьшается
+    в 1 / decrease раз и не выходит за пределы [minimum, maximum]
+    """
+
+    def __init__(self, value: int, minimum: int, maximum: int, step: int = None, decrease: float = 0.5):
+        self.minimum = minimum
+        self.maximum = maximum
+        self.step = step or minimum
+        self.decrease = decrease
+        self.value = min(max(value, minimum), maximum)
+
+    def update(self, congested: bool) -> int:
+        if congested:
+            self.value = max(self.minimum, int(self.value * self.decrease))
+        else:
+            self.value = min(self.maximum, self.value + self.step)
+        return self.value
+
+
+class BatchSizeController:
+    """
+    Подбирает LIMIT выгрузки и размер bulk-чанка после каждого запуска ETL. Перегрузкой эластика
+    считаются отклонения с 429, средний bulk-запрос дольше target_latency секунд
+    и очередь пула write больше max_write_queue
+    """
+
+    def __init__(self, limit: AIMD, chunk_size: AIMD, target_latency: float, max_write_queue: int):
+        self.limit = limit
+        self.chunk_size = chunk_size
+        self.target_latency = target_latency
+        self.max_write_queue = max_write_queue
+
+    def is_congested(self, stats: BulkStats) -> bool:
+        return (
+            stats.rejected > 0
+            or stats.latency > self.target_latency
+            or stats.write_queue > self.max_write_queue
+        )
+
+    def update(self, stats: BulkStats) -> Tuple[int, int]:
+        # запуск без загрузки ничего не говорит о нагрузке на эластик
+        if not stats.requests:
+            return self.limit.value, self.chunk_size.value
+        congested = self.is_congested(stats)
+        limit, chunk_size = self.limit.update(congested), self.chunk_size.update(congested)
+        logging.info('Batch size {}: limit {}, bulk chunk {} (bulk {:.3f}s, rejected {}, write queue {})'.format(
+            'decreased' if congested else 'increased', limit, chunk_size,
+            stats.latency, stats.rejected, stats.write_queue)
+        )
+        return limit, chunk_size
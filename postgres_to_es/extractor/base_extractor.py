@@ -3,5 +3,5 @@ from abc import ABC, abstractmethod
 
 class BaseExtractor(ABC):
     @abstractmethod
-    def extract(self, transformer, limit: int):
+    def extract(self, transformer, limit: int) -> bool:
         ...
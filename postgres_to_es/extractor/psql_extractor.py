@@ -1,21 +1,44 @@
 import logging
+import uuid
+from datetime import datetime, timezone
+from typing import Iterator, Optional, Tuple
 
 from extractor.base_extractor import BaseExtractor
 from state_storage.base_storage import BaseStorage
 from SQL_scripts import CREATE_TMP_LAST_UPDATED_FILMS, FIND_UPDATED_GENRES, FIND_UPDATED_PERSONS, FIND_UPDATED_FILMS, \
     CREATE_TMP_FILM_GENRES, CREATE_TMP_FILM_PERSONS, CLEAR_DATA_OVER_LIMIT, GET_UPDATED_FILMS_INFO, \
-    GET_UPDATED_GENRES_INFO, GET_UPDATED_PERSONS_INFO, DROP_TMP_TABLES
+    GET_UPDATED_GENRES_INFO, GET_UPDATED_PERSONS_INFO, DROP_TMP_TABLES, GET_CHANGED_ROWS, CHANGED_FILMS, \
+    GET_FILMS_INFO, GET_GENRES_INFO, GET_PERSONS_INFO
 from models import State
 
+# таблицы с отдельными отметками при выгрузке по курсорам (updated_at, id)
+KEYSET_TABLES = ('genre', 'person', 'film')
+NIL_UUID = '00000000-0000-0000-0000-000000000000'
+
+
+def last_update_checkpoint(raw_films: list) -> dict:
+    return {'last_update': raw_films[-1]['last_update'].isoformat()}
+
+
+def as_utc(value: datetime) -> datetime:
+    return value if value.tzinfo else value.replace(tzinfo=timezone.utc)
+
 
 class PsqlExtractor(BaseExtractor):
 
-    def __init__(self, psql_connect, limit, storage: BaseStorage):
+    def __init__(self, psql_connect, limit, storage: BaseStorage, chunk_size: int = 0, keyset: bool = False):
         self.connect = psql_connect
         self.limit = limit
         self.storage = storage
+        # 0 — выгрузка целиком, иначе потоковая выгрузка пачками такого размера
+        self.chunk_size = chunk_size
+        # выгрузка по курсорам (updated_at, id) с отметкой для каждой таблицы вместо общей last_update
+        self.keyset = keyset
 
-    def extract(self, transformer, limit):
+    def extract(self, transformer, limit) -> bool:
+        """
+        Отправляет изменения в трансформер. Возвращает False, если запуск не состоялся, потому что идёт другой
+        """
         logging.info('Start extractor')
         state = self.storage.retrieve_state()
         last_update = state['last_update'.encode()].decode() if state.get('last_update'.encode()) else '1970-01-01'
@@ -24,7 +47,11 @@ class PsqlExtractor(BaseExtractor):
             self.storage.save_state(state)
         else:
             logging.info('Can\'t start ETL process, because ETL-process already in process'.format(last_update))
-            return
+            return False
+
+        if self.keyset:
+            self.extract_by_keyset(transformer, state, limit)
+            return True
 
         cur = self.connect.cursor()
         # find new updated films
@@ -36,6 +63,9 @@ class PsqlExtractor(BaseExtractor):
         cur.execute(CREATE_TMP_FILM_GENRES, (limit,))
         cur.execute(CREATE_TMP_FILM_PERSONS, (limit,))
         cur.execute(CLEAR_DATA_OVER_LIMIT, (limit,))
+        if self.chunk_size:
+            self.extract_in_chunks(cur, transformer, last_update)
+            return True
         # get updated films
         cur.execute(GET_UPDATED_FILMS_INFO)
         last_updated_films = cur.fetchall()
@@ -51,11 +81,136 @@ class PsqlExtractor(BaseExtractor):
         if not last_updated_films:
             logging.info(f'No new changes have been detected since {last_update}')
             self.storage.save_state(State(last_update=last_update, can_start_ETL='True').dict())
-            return
+            return True
 
         logging.info('Ectractor get {} rows to update'.format(
             len(last_updated_films) + len(last_updated_persons) + len(last_updated_genres))
         )
 
-        updated_data = (last_updated_persons, last_updated_genres, last_updated_films)
+        updated_data = (
+            last_updated_persons, last_updated_genres, last_updated_films, last_update_checkpoint(last_updated_films)
+        )
         transformer.send(updated_data)
+        return True
+
+    def extract_in_chunks(self, cur, transformer, last_update: str):
+        """
+        Потоковая выгрузка: строки читаются серверными курсорами пачками и сразу уходят в трансформер,
+        поэтому память ETL не зависит от размера выгрузки, а загрузка в эластик начинается,
+        пока Postgresql ещё отдаёт строки
+        """
+        # жанры и персоны не сдвигают отметку last_update, поэтому выгружаются раньше фильмов:
+        # если выгрузка прервётся на фильмах, при повторе они будут выгружены снова
+        for raw_genres in self.fetch_in_chunks(GET_UPDATED_GENRES_INFO):
+            transformer.send(([], raw_genres, [], None))
+        # строки одной персоны по разным ролям собираются в один документ и не должны попасть в разные пачки
+        for raw_persons in self.fetch_in_chunks(GET_UPDATED_PERSONS_INFO, key='person_id'):
+            transformer.send((raw_persons, [], [], None))
+        films_count = 0
+        # отметка после пачки должна быть границей: фильмы с одинаковым last_update уходят вместе
+        for raw_films in self.fetch_in_chunks(GET_UPDATED_FILMS_INFO, key='last_update'):
+            transformer.send(([], [], raw_films, last_update_checkpoint(raw_films)))
+            films_count += len(raw_films)
+
+        cur.execute(DROP_TMP_TABLES)
+
+        if not films_count:
+            logging.info(f'No new changes have been detected since {last_update}')
+            self.storage.save_state(State(last_update=last_update, can_start_ETL='True').dict())
+            return
+        logging.info('Extractor streamed {} films to update'.format(films_count))
+
+    def extract_by_keyset(self, transformer, state: dict, limit: int):
+        """
+        Выгрузка по курсорам (updated_at, id), отдельным для каждой таблицы: за запуск из таблицы читается
+        не больше limit изменённых строк диапазоном по индексу, поэтому стоимость запуска зависит от числа
+        изменений, а не от размера таблиц, и строки с одинаковым updated_at не раздувают пачку
+        """
+        changes = 0
+        # last_update — самое позднее updated_at среди выгруженных строк: по нему API отдаёт Last-Modified
+        last_update = as_utc(datetime.fromisoformat(state.get(b'last_update', b'1970-01-01').decode()))
+        cur = self.connect.cursor()
+        for table in KEYSET_TABLES:
+            cur.execute(GET_CHANGED_ROWS.format(table=table), (*self.watermark(state, table), limit))
+            rows = cur.fetchall()
+            changes += len(rows)
+            if not rows and not state.get(f'{table}_watermark'.encode()):
+                # отметка таблицы фиксируется сразу: дальше last_update сдвигается и для неё не годится
+                self.storage.save_state({f'{table}_watermark': '{}|{}'.format(*self.watermark(state, table))})
+            size = self.chunk_size or limit
+            for start in range(0, len(rows), size):
+                chunk = rows[start:start + size]
+                last_update = max(last_update, as_utc(chunk[-1]['updated_at']))
+                self.send_changes(transformer, table, chunk, last_update)
+
+        if not changes:
+            logging.info('No new changes have been detected')
+            self.storage.save_state({'can_start_ETL': 'True'})
+            return
+        logging.info('Extractor found {} changed rows'.format(changes))
+
+    def send_changes(self, transformer, table: str, rows: list, last_update: datetime):
+        """
+        Отправляет документы, которые затрагивают изменённые строки таблицы. Отметка таблицы уходит
+        с последней пачкой: если загрузка прервётся раньше, строки выгрузятся снова
+        """
+        ids = [row['id'] for row in rows]
+        checkpoint = {
+            f'{table}_watermark': '{}|{}'.format(rows[-1]['updated_at'].isoformat(), rows[-1]['id']),
+            'last_update': last_update.isoformat(),
+        }
+        cur = self.connect.cursor()
+        raw_persons, raw_genres, raw_films = [], [], []
+        if table == 'person':
+            cur.execute(GET_PERSONS_INFO, (ids,))
+            raw_persons = cur.fetchall()
+        elif table == 'genre':
+            cur.execute(GET_GENRES_INFO, (ids,))
+            raw_genres = cur.fetchall()
+        # у одного жанра или персоны может быть много фильмов, они читаются пачками
+        query = GET_FILMS_INFO.format(films=CHANGED_FILMS[table])
+        for films in self.fetch_in_chunks(query, (ids,), size=self.chunk_size or len(rows)):
+            if raw_films:
+                transformer.send((raw_persons, raw_genres, raw_films, None))
+                raw_persons, raw_genres = [], []
+            raw_films = films
+        transformer.send((raw_persons, raw_genres, raw_films, checkpoint))
+
+    @staticmethod
+    def watermark(state: dict, table: str) -> Tuple[str, str]:
+        value = state.get(f'{table}_watermark'.encode())
+        if value:
+            updated_at, _, row_id = value.decode().partition('|')
+            return updated_at, row_id
+        # при переходе с выгрузки по last_update таблицы продолжают с общей отметки
+        last_update = state.get('last_update'.encode())
+        return (last_update.decode() if last_update else '1970-01-01'), NIL_UUID
+
+    def fetch_in_chunks(
+            self, query: str, params: tuple = None, key: Optional[str] = None, size: int = None
+    ) -> Iterator[list]:
+        """
+        Читает результат запроса серверным курсором пачками по size строк, по умолчанию chunk_size.
+        Строки с одинаковым значением key идут подряд и между пачками не делятся
+        """
+        size = size or self.chunk_size
+        # у серверного курсора должно быть уникальное в пределах соединения имя
+        with self.connect.cursor(name=f'etl_{uuid.uuid4().hex}') as cursor:
+            cursor.itersize = size
+            cursor.execute(query, params)
+            chunk = []
+            while rows := cursor.fetchmany(size):
+                chunk.extend(rows)
+                if key is None:
+                    yield chunk
+                    chunk = []
+                    continue
+                # строки с последним значением ключа могут продолжиться в следующей пачке
+                split = len(chunk)
+                while split and chunk[split - 1][key] == chunk[-1][key]:
+                    split -= 1
+                if split:
+                    yield chunk[:split]
+                    chunk = chunk[split:]
+            if chunk:
+                yield chunk
@@ -1,3 +1,10 @@
+# поле для подсказок при наборе: completion-суггестер ищет по префиксу без полнотекстового поиска
+SUGGEST_FIELD = {
+    "type": "completion",
+    "analyzer": "simple",
+    "max_input_length": 100
+}
+
 PERSON_MAPPING = {
             "settings": {
                 "refresh_interval": "1s",
@@ -48,6 +55,7 @@ PERSON_MAPPING = {
                         "fields": {
                             "raw": {"type": "keyword"}
                         }},
+                    "full_name_suggest": SUGGEST_FIELD,
                     "films_as_actor": {"type": "text"},
                     "films_as_writer": {"type": "text"},
                     "films_as_director": {"type": "text"}
@@ -64,3 +72,42 @@ GENRE_MAPPING = {
         }
     }
 }
+
+MOVIES_MAPPING = {
+    "settings": PERSON_MAPPING["settings"],
+    "mappings": {
+        "dynamic": "strict",
+        "properties": {
+            "id": {"type": "keyword"},
+            "imdb_rating": {"type": "float"},
+            "genre": {"type": "keyword"},
+            "title": {
+                "type": "text",
+                "analyzer": "ru_en",
+                "fields": {
+                    "raw": {"type": "keyword"}
+                }},
+            "title_suggest": SUGGEST_FIELD,
+            "description": {"type": "text", "analyzer": "ru_en"},
+            "director": {"type": "text", "analyzer": "ru_en"},
+            "actors_names": {"type": "text", "analyzer": "ru_en"},
+            "writers_names": {"type": "text", "analyzer": "ru_en"},
+            "actors": {
+                "type": "nested",
+                "dynamic": "strict",
+                "properties": {
+                    "id": {"type": "keyword"},
+                    "name": {"type": "text", "analyzer": "ru_en"}
+                }
+            },
+            "writers": {
+                "type": "nested",
+                "dynamic": "strict",
+                "properties": {
+                    "id": {"type": "keyword"},
+                    "name": {"type": "text", "analyzer": "ru_en"}
+                }
+            }
+        }
+    }
+}
@@ -1,46 +1,168 @@
 import logging
 import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import List, Tuple
 
 import backoff
 import elasticsearch
-from elasticsearch.helpers import bulk
+from elasticsearch.helpers import streaming_bulk
 
+from batch_size import BulkStats
 from ETL import coroutine
 from loader.base_loader import BaseLoader
+from notifier.base_notifier import BaseNotifier
+from notifier.redis_notifier import group_ids_by_index
 from state_storage.base_storage import BaseStorage
-from indexes import PERSON_MAPPING, GENRE_MAPPING
-from models import State
+from indexes import MOVIES_MAPPING, PERSON_MAPPING, GENRE_MAPPING, SUGGEST_FIELD
+from models import BulkOptions
 
 
 def lookup_es_max_time():
     return int(os.getenv('ES_MAX_TRIES'))
 
 
+def is_retryable(failure: dict) -> bool:
+    # перегрузка и ошибки эластика проходят сами, а ошибки самого документа повтор не исправит
+    return failure.get('status', 500) == 429 or failure.get('status', 500) >= 500
+
+
 class ESLoader(BaseLoader):
-    def __init__(self, es_connect: elasticsearch.Elasticsearch, storage: BaseStorage):
+    def __init__(
+            self,
+            es_connect: elasticsearch.Elasticsearch,
+            storage: BaseStorage,
+            notifier: BaseNotifier = None,
+            bulk_options: BulkOptions = None
+    ):
         self.connect = es_connect
         self.storage = storage
+        self.notifier = notifier
+        self.bulk_options = bulk_options or BulkOptions()
+        self.stats = BulkStats()
+        # счётчик отклонений пула write растёт с запуска эластика, важен только прирост
+        self.rejected_total = None
+        # была неудачная загрузка: до конца запуска отметка не сдвигается
+        self.failed = False
+        self.indices_ready = False
 
     @coroutine
     def load(self):
         while data_to_load := (yield):
-            pure_data, last_update = data_to_load
+            pure_data, checkpoint = data_to_load
+            if self.failed:
+                # отметка после следующих пачек перескочила бы незагруженную, они выгрузятся при следующем запуске
+                logging.warning('Loader skipped {} rows after failed load'.format(len(pure_data)))
+                continue
 
             try:
                 self.is_available_service()
-                self.connect.indices.create(index='genre', body=GENRE_MAPPING, ignore=400)
-                self.connect.indices.create(index='person', body=PERSON_MAPPING, ignore=400)
-                errors = self.load_bulk(pure_data)
-            except elasticsearch.exceptions.ConnectionError:
-                logging.error('Elasticsearch is not available')
+                self.prepare_indices()
+                loaded, failures = self.load_bulk(pure_data)
+            except elasticsearch.exceptions.TransportError as error:
+                logging.error('Elasticsearch is not available: {}'.format(error))
+                self.failed = True
+                self.indices_ready = False
             else:
-                if errors[1]:
-                    logging.error('This films was\'n load into Elasticsearch: \n'.format(';\n'.join(errors[1])))
-                logging.info('Loader send {} rows into Elasticsearch'.format(errors[0]))
-                self.storage.save_state(State(last_update=last_update.isoformat(), can_start_ETL='True').dict())
+                for failure in failures:
+                    logging.error('Document {}/{} wasn\'t loaded into Elasticsearch: {} {}'.format(
+                        failure.get('_index'), failure.get('_id'), failure.get('status'), failure.get('error'))
+                    )
+                logging.info('Loader send {} rows into Elasticsearch'.format(loaded))
+                self.stats.rejected += sum(failure.get('status') == 429 for failure in failures)
+                self.record_write_pool()
+                # время загрузки — Last-Modified ответов API, поэтому сохраняется до сигнала о сбросе кеша:
+                # пересобранные после сигнала ответы не получат прежнюю дату
+                state = {'last_loaded': datetime.now(timezone.utc).isoformat()}
+                if any(is_retryable(failure) for failure in failures):
+                    # эти документы выгрузятся снова при следующем запуске
+                    self.failed = True
+                elif checkpoint is not None:
+                    # запуск ещё идёт, поэтому блокировка can_start_ETL снимается только в finish_run
+                    state.update(checkpoint)
+                self.storage.save_state(state)
+                if self.notifier:
+                    self.notifier.notify(group_ids_by_index(pure_data))
+
+    def prepare_indices(self):
+        """
+        Создаёт индексы, а в уже существующие добавляет поля, появившиеся в маппинге позже:
+        индекс фильмов строгий и отклоняет документы с неизвестными полями
+        """
+        if self.indices_ready:
+            return
+        self.connect.indices.create(index='movies', body=MOVIES_MAPPING, ignore=400)
+        self.connect.indices.create(index='genre', body=GENRE_MAPPING, ignore=400)
+        self.connect.indices.create(index='person', body=PERSON_MAPPING, ignore=400)
+        self.connect.indices.put_mapping(index='movies', body={'properties': {'title_suggest': SUGGEST_FIELD}})
+        self.connect.indices.put_mapping(index='person', body={'properties': {'full_name_suggest': SUGGEST_FIELD}})
+        self.indices_ready = True
+
+    def finish_run(self):
+        """
+        Завершение запуска, когда загружены все его пачки: снимается блокировка, и можно начинать следующий.
+        После неудачной загрузки отметка осталась на последней загруженной пачке, остальные выгрузятся снова
+        """
+        self.failed = False
+        self.storage.save_state({'can_start_ETL': 'True'})
 
-    def load_bulk(self, pure_data):
-        return bulk(self.connect, pure_data)
+    def take_stats(self) -> BulkStats:
+        stats, self.stats = self.stats, BulkStats()
+        return stats
+
+    def record_write_pool(self):
+        try:
+            pools = self.connect.cat.thread_pool(thread_pool_patterns='write', format='json', h='queue,rejected')
+        except elasticsearch.exceptions.TransportError as error:
+            # без статистики пула размер пачки подбирается по времени bulk-запросов и ответам 429
+            logging.debug('Write thread pool stats are not available: {}'.format(error))
+            return
+        rejected = sum(int(pool['rejected']) for pool in pools)
+        if self.rejected_total is not None:
+            self.stats.rejected += max(0, rejected - self.rejected_total)
+        self.rejected_total = rejected
+        self.stats.write_queue = max([self.stats.write_queue] + [int(pool['queue']) for pool in pools])
+
+    def load_bulk(self, pure_data: List[dict]) -> Tuple[int, List[dict]]:
+        """
+        Документы пачки делятся между bulk_options.threads потоками, каждый отправляет свою часть чанками.
+        Возвращает число загруженных документов и ответы эластика по незагруженным
+        """
+        threads = max(1, min(self.bulk_options.threads, len(pure_data)))
+        size = -(-len(pure_data) // threads)
+        started = time.monotonic()
+        if threads == 1:
+            loaded, failures = self.stream_bulk(pure_data)
+        else:
+            parts = (pure_data[start:start + size] for start in range(0, len(pure_data), size))
+            with ThreadPoolExecutor(max_workers=threads) as pool:
+                results = list(pool.map(self.stream_bulk, parts))
+            loaded = sum(count for count, _ in results)
+            failures = [failure for _, items in results for failure in items]
+        # потоки работают одновременно, поэтому время пачки делится на число запросов одного потока
+        self.stats.requests += -(-size // self.bulk_options.chunk_size)
+        self.stats.seconds += time.monotonic() - started
+        return loaded, failures
+
+    def stream_bulk(self, documents: List[dict]) -> Tuple[int, List[dict]]:
+        loaded, failures = 0, []
+        for ok, item in streaming_bulk(
+                self.connect,
+                documents,
+                chunk_size=self.bulk_options.chunk_size,
+                max_chunk_bytes=self.bulk_options.chunk_bytes,
+                raise_on_error=False,
+                max_retries=self.bulk_options.max_retries,
+                initial_backoff=self.bulk_options.initial_backoff,
+                max_backoff=self.bulk_options.max_backoff,
+        ):
+            if ok:
+                loaded += 1
+            else:
+                # ответ по документу лежит под названием операции: {'index': {...}}
+                failures.extend(item.values())
+        return loaded, failures
 
     @backoff.on_exception(backoff.expo,
                           Exception,
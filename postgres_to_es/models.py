@@ -8,6 +8,16 @@ class State(BaseModel):
     can_start_ETL: str
 
 
+class BulkOptions(BaseModel):
+    threads: int = 1
+    chunk_size: int = 500
+    chunk_bytes: int = 100 * 1024 * 1024
+    # повторы чанков, отклонённых эластиком с 429, с паузой от initial_backoff до max_backoff секунд
+    max_retries: int = 3
+    initial_backoff: float = 2
+    max_backoff: float = 60
+
+
 class FilmMap(BaseModel):
     _index: str
     _id: str
@@ -21,6 +31,7 @@ class FilmMap(BaseModel):
     writers_names: List[str]
     actors: List[Dict]
     writers: List[Dict]
+    title_suggest: Optional[Dict]
 
     class Config:
         extra = Extra.allow
@@ -34,6 +45,7 @@ class PersonMap(BaseModel):
     films_as_actor: Optional[str]
     films_as_writer: Optional[str]
     films_as_director: Optional[str]
+    full_name_suggest: Optional[Dict]
 
     class Config:
         extra = Extra.allow
@@ -0,0 +1,8 @@
+from abc import ABC, abstractmethod
+from typing import Dict, List
+
+
+class BaseNotifier(ABC):
+    @abstractmethod
+    def notify(self, loaded: Dict[str, List[str]]):
+        ...
@@ -0,0 +1,38 @@
+import json
+import logging
+from collections import defaultdict
+from typing import Dict, Iterable, List
+
+from redis import Redis, RedisError
+
+from notifier.base_notifier import BaseNotifier
+
+
+class RedisNotifier(BaseNotifier):
+    """
+    Сообщает API, какие документы были загружены в Elasticsearch, чтобы оно сбросило их кеш
+    """
+
+    def __init__(self, redis_adapter: Redis, channel: str):
+        self.redis_adapter = redis_adapter
+        self.channel = channel
+
+    def notify(self, loaded: Dict[str, List[str]]) -> None:
+        if not loaded:
+            return
+        try:
+            receivers = self.redis_adapter.publish(self.channel, json.dumps(loaded))
+        except RedisError:
+            # данные уже загружены, API увидит их после истечения времени жизни кеша
+            logging.error('Cache invalidation message wasn\'t published')
+        else:
+            logging.info('Invalidation of {} documents was sent to {} API workers'.format(
+                sum(len(ids) for ids in loaded.values()), receivers)
+            )
+
+
+def group_ids_by_index(documents: Iterable[dict]) -> Dict[str, List[str]]:
+    loaded = defaultdict(list)
+    for document in documents:
+        loaded[document['_index']].append(document['_id'])
+    return dict(loaded)
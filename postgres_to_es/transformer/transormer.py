@@ -5,19 +5,42 @@ from ETL import coroutine
 from models import FilmMap, GenreMap, PersonMap
 from transformer.base_transormer import BaseTransformer
 
+# сколько слов названия, кроме первого, могут начинать подсказку: "Star Wars" находится и по "wars"
+SUGGEST_MAX_WORD_STARTS = 5
+
+
+def suggest_field(text: str, weight: int) -> dict:
+    """
+    Значение completion-поля: текст целиком и его окончания с начала каждого слова.
+    Вес задаёт порядок подсказок с одинаковым префиксом
+    """
+    words = text.split()
+    # знаки препинания вроде "-" словами не считаются
+    starts = [position for position, word in enumerate(words) if any(char.isalnum() for char in word)]
+    inputs = [' '.join(words[start:]) for start in starts[:SUGGEST_MAX_WORD_STARTS + 1]]
+    return {'input': inputs or [text], 'weight': max(weight, 0)}
+
+
+def films_count(person: PersonMap) -> int:
+    # фильмы персоны в SQL склеиваются через ', '; один фильм в нескольких ролях считается один раз
+    films = set()
+    for role_films in (person.films_as_actor, person.films_as_writer, person.films_as_director):
+        films.update(film_id.strip() for film_id in (role_films or '').split(',') if film_id.strip())
+    return len(films)
+
 
 class Transformer(BaseTransformer):
     @coroutine
     def transform(self, loader):
         while raw_films_info := (yield):
             pure_data = []
-            raw_persons, raw_genres, raw_films = raw_films_info
+            # отметку, которую можно сохранить после загрузки пачки, задаёт экстрактор, у промежуточных пачек её нет
+            raw_persons, raw_genres, raw_films, checkpoint = raw_films_info
             self.transform_films(raw_films, pure_data)
-            last_updated_film = raw_films[-1].get('last_update')
             self.transform_genres(raw_genres, pure_data)
             self.transform_persons(raw_persons, pure_data)
 
-            loader.send((pure_data, last_updated_film))
+            loader.send((pure_data, checkpoint))
 
     @staticmethod
     def transform_films(raw_films, pure_data: list):
@@ -47,6 +70,8 @@ class Transformer(BaseTransformer):
                 writers_names=[writer['name'] for writer in writers],
                 actors=actors,
                 writers=writers,
+                # рейтинг с точностью до десятых: вес completion-поля должен быть целым
+                title_suggest=suggest_field(film_info['title'], int((float(film_info['rating'] or 0)) * 10)),
             )
             pure_data.append(film.dict())
         logging.info('Transformer clear {} films to update'.format(len(raw_films)))
@@ -94,5 +119,7 @@ class Transformer(BaseTransformer):
                 dictable_pure_data[person['person_id']].films_as_director = person['person_films']
 
         for person_info in dictable_pure_data.values():
+            # выше в подсказках персоны, участвовавшие в большем числе фильмов
+            person_info.full_name_suggest = suggest_field(person_info.full_name, films_count(person_info))
             pure_data.append(person_info.dict())
         logging.info('Transformer clear {} persons to update'.format(len(raw_persons)))
@@ -1,6 +1,6 @@
 from fastapi import APIRouter
 
-from . import person, film, genre
+from . import person, film, genre, suggest
 
 router = APIRouter()
 
@@ -8,3 +8,4 @@ router = APIRouter()
 router.include_router(film.router,            prefix='/film',            tags=['Фильмы'])
 router.include_router(person.router,          prefix='/person',          tags=['Персоны'])
 router.include_router(genre.router,           prefix='/genre',           tags=['Жанры'])
+router.include_router(suggest.router,         prefix='/suggest',         tags=['Подсказки'])
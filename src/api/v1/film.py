@@ -1,40 +1,62 @@
-import backoff
 import json
 from http import HTTPStatus
 
-from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi import APIRouter, Depends, HTTPException, Request, Response
 from typing import List
 
-from core.config import HTTP_RETIES
-from models.film import Film, FilterParams, ResponseMessage
+from api.v1.pagination import paginate
+from models.film import BatchRequest, Film, FilmShort, FilterParams, ResponseMessage
+from services.catalog import get_catalog
 from services.film import FilmService, get_film_service
+from services.genre import GenreService
 
 router = APIRouter()
 
 
-@backoff.on_exception(backoff.expo, HTTPException, max_tries=HTTP_RETIES)
-@router.get('/search', response_model=List[Film],
-            response_model_include={'id', 'title', 'imdb_rating'},
+def genre_query(genre: str) -> dict:
+    """
+    Фильтр фильмов по жанру. Жанр, найденный в каталоге по id или названию, фильтруется точным
+    совпадением без подсчёта релевантности; остальное ищется нечётко, как раньше
+    """
+    catalog = get_catalog(GenreService.index)
+    known = catalog.resolve(genre) if catalog else None
+    if known:
+        return {"query": {"bool": {"filter": {"term": {"genre": known.name}}}}}
+    return {"query": {"match": {"genre": {"query": genre, "fuzziness": "auto"}}}}
+
+
+@router.get('/search', response_model=List[FilmShort],
             summary="Поиск кинопроизведений",
             description="Полнотекстовый поиск по кинопроизведениям",
             response_description="Название и рейтинг фильма",
             tags=['Полнотекстовый поиск'])
 async def search_film_list(
         request: Request,
+        response: Response,
         film_service: FilmService = Depends(get_film_service)
-) -> List[Film]:
+) -> List[FilmShort]:
     _filters: FilterParams = request.state.filter_params
-    pagination_params = _filters.dict(include={'sort', 'size', 'from_'})
     if _filters.query:
         body = json.dumps({"query": {"query_string": {"query": _filters.query,  "fuzziness": "auto"}}})
     else:
         body = None
 
-    films = await film_service.get_all_from_elastic(body=body, params=pagination_params)
+    films = await paginate(film_service, request, response, body=body, model=FilmShort)
     return films
 
 
-@backoff.on_exception(backoff.expo, HTTPException, max_tries=HTTP_RETIES)
+@router.post('/_batch', response_model=List[Film],
+             summary="Информация по списку фильмов",
+             description="Подробная информация по списку uuid фильмов за один запрос",
+             response_description="Найденные фильмы в порядке переданных uuid, ненайденные пропускаются",
+             )
+async def film_batch(
+        batch: BatchRequest,
+        film_service: FilmService = Depends(get_film_service)
+) -> List[Film]:
+    return await film_service.get_by_ids(batch.ids)
+
+
 @router.get('/{film_id}', response_model=Film,
             summary="Информация по фильму",
             description="Подробная информация по uuid фильма",
@@ -63,9 +85,7 @@ async def film_details(
     return film
 
 
-@backoff.on_exception(backoff.expo, HTTPException, max_tries=HTTP_RETIES)
-@router.get('/', response_model=List[Film],
-            response_model_include={'id', 'title', 'imdb_rating'},
+@router.get('/', response_model=List[FilmShort],
             summary="Список фильмов",
             description="Список фильмов, отсортированных по жанру, если он передан",
             response_description="Список фильмов, количество фильмов на странице, номер страницы, "
@@ -73,13 +93,11 @@ async def film_details(
             )
 async def film_list(
         request: Request,
+        response: Response,
         film_service: FilmService = Depends(get_film_service),
         genre: str = None
-) -> List[Film]:
-    _filters: FilterParams = request.state.filter_params
-    pagination_params = _filters.dict(include={'sort', 'size', 'from_'})
-
-    body = json.dumps({"query": {"match": {"genre": {"query": genre, "fuzziness": "auto"}}}}) if genre else None
-    films = await film_service.get_all_from_elastic(body=body, params=pagination_params)
+) -> List[FilmShort]:
+    body = json.dumps(genre_query(genre)) if genre else None
+    films = await paginate(film_service, request, response, body=body, model=FilmShort)
     return films
 
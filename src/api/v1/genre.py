@@ -1,18 +1,16 @@
-import backoff
 from http import HTTPStatus
 from typing import List
 
-from fastapi import Depends, HTTPException, APIRouter, Query, Request
+from fastapi import Depends, HTTPException, APIRouter, Query, Request, Response
 
-from core.config import HTTP_RETIES
-from models.film import ResponseMessage, Genre, FilterParams
+from api.v1.pagination import paginate
+from models.film import BatchRequest, ResponseMessage, Genre
 from services.genre import GenreService, get_genre_service
 
 
 router = APIRouter()
 
 
-@backoff.on_exception(backoff.expo, HTTPException, max_tries=HTTP_RETIES)
 @router.get(
     '/',
     summary="Список жанров",
@@ -22,16 +20,27 @@ router = APIRouter()
 )
 async def get_genres(
         request: Request,
+        response: Response,
         genre_service: GenreService = Depends(get_genre_service),
 ) -> List[Genre]:
-    _filters: FilterParams = request.state.filter_params
-    pagination_params = _filters.dict(include={'sort', 'size', 'from_'})
-
-    genres: List[Genre] = await genre_service.get_all_from_elastic(params=pagination_params)
+    genres: List[Genre] = await paginate(genre_service, request, response)
     return genres
 
 
-@backoff.on_exception(backoff.expo, HTTPException, max_tries=HTTP_RETIES)
+@router.post(
+    '/_batch',
+    summary="Информация по списку жанров",
+    description="Подробная информация по списку uuid жанров за один запрос",
+    response_description="Найденные жанры в порядке переданных uuid, ненайденные пропускаются",
+    response_model=List[Genre],
+)
+async def get_genres_batch(
+        batch: BatchRequest,
+        genre_service: GenreService = Depends(get_genre_service),
+) -> List[Genre]:
+    return await genre_service.get_by_ids(batch.ids)
+
+
 @router.get(
     '/{genre_uuid}',
     summary="Информация по жанру",
@@ -0,0 +1,36 @@
+from http import HTTPStatus
+
+from typing import Type
+
+from fastapi import HTTPException, Request, Response
+from pydantic import BaseModel
+
+from models.film import FilterParams
+from services.pagination import InvalidCursor
+from services.service import Service
+
+NEXT_PAGE_CURSOR_HEADER = 'X-Next-Page-Cursor'
+
+
+async def paginate(
+        service: Service, request: Request, response: Response, body=None, model: Type[BaseModel] = None
+) -> list:
+    """
+    Страница списка: по номеру страницы или, если передан page[cursor], через search_after.
+    Токен следующей страницы отдаётся в заголовке X-Next-Page-Cursor. model задаёт проекцию,
+    которую отдаёт маршрут
+    """
+    _filters: FilterParams = request.state.filter_params
+    pagination_params = _filters.dict(include={'sort', 'size', 'from_'})
+    if _filters.cursor is None:
+        return await service.get_all_from_elastic(body=body, params=pagination_params, model=model)
+
+    try:
+        items, next_cursor = await service.get_page_after(
+            body=body, params=pagination_params, cursor=_filters.cursor, model=model
+        )
+    except InvalidCursor:
+        raise HTTPException(status_code=HTTPStatus.BAD_REQUEST, detail='invalid page cursor')
+    if next_cursor:
+        response.headers[NEXT_PAGE_CURSOR_HEADER] = next_cursor
+    return items
@@ -1,13 +1,12 @@
-import backoff
 import json
 from http import HTTPStatus
 from typing import List, Optional
 
-from fastapi import Depends, HTTPException, APIRouter, Request
+from fastapi import Depends, HTTPException, APIRouter, Request, Response
 from api.v1.film import Film
+from api.v1.pagination import paginate
 
-from core.config import HTTP_RETIES
-from models.film import Person, ResponseMessage, FilterParams
+from models.film import BatchRequest, FilmShort, Person, ResponseMessage, FilterParams
 from services.film import FilmService, get_film_service
 from services.person import PersonService, get_person_service
 
@@ -15,7 +14,6 @@ from services.person import PersonService, get_person_service
 router = APIRouter()
 
 
-@backoff.on_exception(backoff.expo, HTTPException, max_tries=HTTP_RETIES)
 @router.get('/search',
             summary="Поиск персон",
             description="Полнотекстовый поиск по персонам",
@@ -24,20 +22,33 @@ router = APIRouter()
             response_model=List[Person])
 async def search_person_list(
         request: Request,
+        response: Response,
         person_service: PersonService = Depends(get_person_service),
 ) -> List[Film]:
     _filters: FilterParams = request.state.filter_params
-    pagination_params = _filters.dict(include={'sort', 'size', 'from_'})
     if _filters.query:
         body = json.dumps({"query": {"query_string": {"query": _filters.query,  "fuzziness": "auto"}}})
     else:
         body = None
 
-    persons = await person_service.get_all_from_elastic(body=body, params=pagination_params)
+    persons = await paginate(person_service, request, response, body=body)
     return persons
 
 
-@backoff.on_exception(backoff.expo, HTTPException, max_tries=HTTP_RETIES)
+@router.post(
+    '/_batch',
+    summary="Информация по списку персон",
+    description="Подробная информация по списку uuid персон за один запрос",
+    response_description="Найденные персоны в порядке переданных uuid, ненайденные пропускаются",
+    response_model=List[Person],
+)
+async def get_persons_batch(
+        batch: BatchRequest,
+        person_service: PersonService = Depends(get_person_service),
+) -> List[Person]:
+    return await person_service.get_by_ids(batch.ids)
+
+
 @router.get(
     '/{person_uuid}',
     summary="Информация по персоне",
@@ -61,14 +72,12 @@ async def get_person(
     return person
 
 
-@backoff.on_exception(backoff.expo, HTTPException, max_tries=HTTP_RETIES)
 @router.get(
     '/{person_uuid}/film',
     summary="Информация по фильмам, где участвовала персона",
     description="Информация о фильмах, где приняла участие персона",
     response_description="Список фильмов, где приняла участие персона",
-    response_model=List[Film],
-    response_model_include={'id', 'title', 'imdb_rating'},
+    response_model=List[FilmShort],
     responses={
         404: {
             'model': ResponseMessage,
@@ -78,13 +87,11 @@ async def get_person(
 )
 async def get_persons_films(
         request: Request,
+        response: Response,
         person_service: PersonService = Depends(get_person_service),
         film_service: FilmService = Depends(get_film_service),
         person_uuid: str = None,
-) -> List[Film]:
-    _filters: FilterParams = request.state.filter_params
-    pagination_params = _filters.dict(include={'sort', 'size', 'from_'})
-
+) -> List[FilmShort]:
     person: Person = await person_service.get_by_id(person_uuid)
     if not person:
         raise HTTPException(status_code=HTTPStatus.NOT_FOUND, detail='Person wasn\'t found')
@@ -95,5 +102,5 @@ async def get_persons_films(
             person_films.extend(role_films.split(","))
 
     body = json.dumps({"query": {"terms": {"_id": person_films}}})
-    person_films = await film_service.get_all_from_elastic(body=body, params=pagination_params)
+    person_films = await paginate(film_service, request, response, body=body, model=FilmShort)
     return person_films
@@ -0,0 +1,22 @@
+from fastapi import APIRouter, Depends, Query
+
+from core.config import SUGGEST_DEFAULT_SIZE, SUGGEST_MAX_SIZE
+from models.film import Suggestions
+from services.suggest import SuggestService, get_suggest_service
+
+router = APIRouter()
+
+
+@router.get(
+    '/',
+    summary="Подсказки при наборе",
+    description="Фильмы и персоны, название или имя которых начинается с префикса, в том числе с любого слова",
+    response_description="Фильмы по убыванию рейтинга и персоны по убыванию числа фильмов",
+    response_model=Suggestions,
+)
+async def suggest(
+        prefix: str = Query(..., min_length=1, max_length=100),
+        size: int = Query(SUGGEST_DEFAULT_SIZE, ge=1, le=SUGGEST_MAX_SIZE),
+        suggest_service: SuggestService = Depends(get_suggest_service),
+) -> Suggestions:
+    return await suggest_service.suggest(prefix, size)
@@ -20,4 +20,145 @@ ELASTIC_PORT = int(os.getenv('ELASTIC_PORT', 9200))
 # корень проекта
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 
-HTTP_RETIES = 3
+# максимальное количество id в одном запросе пакетного получения объектов
+BATCH_MAX_IDS = int(os.getenv('BATCH_MAX_IDS', 500))
+
+# настройки локального кеша процесса, который стоит перед редисом
+LOCAL_CACHE_ENABLED = os.getenv('LOCAL_CACHE_ENABLED', 'True') == 'True'
+LOCAL_CACHE_EXPIRE_IN_SECONDS = int(os.getenv('LOCAL_CACHE_EXPIRE_IN_SECONDS', 30))
+# доля случайного разброса времени жизни записи
+LOCAL_CACHE_JITTER = float(os.getenv('LOCAL_CACHE_JITTER', 0.1))
+LOCAL_CACHE_DEFAULT_SIZE = int(os.getenv('LOCAL_CACHE_DEFAULT_SIZE', 500))
+# максимальное количество записей по индексам
+LOCAL_CACHE_MAX_SIZE = {
+    'movies': int(os.getenv('LOCAL_CACHE_MOVIES_SIZE', 2000)),
+    'person': int(os.getenv('LOCAL_CACHE_PERSON_SIZE', 1000)),
+    'genre': int(os.getenv('LOCAL_CACHE_GENRE_SIZE', 200)),
+    'responses': int(os.getenv('LOCAL_CACHE_RESPONSES_SIZE', 1000)),
+}
+
+# блокировка в редисе, чтобы при промахе кеша в эластик за одним ключом ходил только один воркер
+CACHE_LOCK_ENABLED = os.getenv('CACHE_LOCK_ENABLED', 'False') == 'True'
+CACHE_LOCK_EXPIRE_MS = int(os.getenv('CACHE_LOCK_EXPIRE_MS', 5000))
+# сколько остальные воркеры ждут появления значения в кеше, прежде чем пойти в эластик сами
+CACHE_LOCK_WAIT_IN_SECONDS = float(os.getenv('CACHE_LOCK_WAIT_IN_SECONDS', 1))
+CACHE_LOCK_POLL_INTERVAL = float(os.getenv('CACHE_LOCK_POLL_INTERVAL', 0.05))
+
+# мягкий срок годности записей кеша, по умолчанию 5 минут. С инвалидацией по сигналу ETL его можно увеличить
+CACHE_EXPIRE_IN_SECONDS = int(os.getenv('CACHE_EXPIRE_IN_SECONDS', 60 * 5))
+# сколько помнить, что объекта с таким id нет в эластике
+NEGATIVE_CACHE_EXPIRE_IN_SECONDS = int(os.getenv('NEGATIVE_CACHE_EXPIRE_IN_SECONDS', 30))
+# сколько секунд после мягкого срока годности значение из кеша ещё можно отдавать, обновляя его в фоне
+CACHE_STALE_IN_SECONDS = int(os.getenv('CACHE_STALE_IN_SECONDS', 60 * 10))
+# коэффициент досрочного обновления XFetch: чем больше, тем раньше начинается обновление
+CACHE_XFETCH_BETA = float(os.getenv('CACHE_XFETCH_BETA', 1.0))
+
+# как часто перечитывать из редиса поколение индекса, от которого зависят ключи кеша списков
+CACHE_GENERATION_REFRESH_IN_SECONDS = float(os.getenv('CACHE_GENERATION_REFRESH_IN_SECONDS', 1))
+
+# как хранить в кеше результаты поиска: 'ids' — только упорядоченные id, объекты берутся из их собственных ключей,
+# 'models' — полная копия каждого объекта в ключе списка
+LIST_CACHE_MODE = os.getenv('LIST_CACHE_MODE', 'ids')
+
+# кеш готовых тел ответов API
+RESPONSE_CACHE_ENABLED = os.getenv('RESPONSE_CACHE_ENABLED', 'True') == 'True'
+RESPONSE_CACHE_EXPIRE_IN_SECONDS = int(os.getenv('RESPONSE_CACHE_EXPIRE_IN_SECONDS', 60))
+# условные запросы к закешированным ответам: ETag по содержимому ответа, Last-Modified по отметке
+# последней загрузки ETL, которую он хранит в хеше редиса
+ETL_STATE_KEY = os.getenv('ETL_STATE_KEY', 'postgresql_films')
+# заголовок Cache-Control по префиксам маршрутов
+CACHE_CONTROL = {
+    '/api/v1/film': os.getenv('CACHE_CONTROL_FILM', 'public, max-age=60'),
+    '/api/v1/person': os.getenv('CACHE_CONTROL_PERSON', 'public, max-age=60'),
+    '/api/v1/genre': os.getenv('CACHE_CONTROL_GENRE', 'public, max-age=300'),
+    '/api/v1/suggest': os.getenv('CACHE_CONTROL_SUGGEST', 'public, max-age=30'),
+}
+
+# сжатие ответов по Accept-Encoding: кодировки в порядке предпочтения и размер тела, с которого ответ сжимается.
+# Сжатые варианты закешированных ответов хранятся в кеше ответов рядом с исходными
+COMPRESSION_ENABLED = os.getenv('COMPRESSION_ENABLED', 'True') == 'True'
+COMPRESSION_ENCODINGS = [
+    encoding for encoding in os.getenv('COMPRESSION_ENCODINGS', 'zstd,br,gzip').split(',') if encoding
+]
+COMPRESSION_MIN_SIZE = int(os.getenv('COMPRESSION_MIN_SIZE', 1024))
+COMPRESSION_GZIP_LEVEL = int(os.getenv('COMPRESSION_GZIP_LEVEL', 6))
+COMPRESSION_BROTLI_QUALITY = int(os.getenv('COMPRESSION_BROTLI_QUALITY', 5))
+COMPRESSION_ZSTD_LEVEL = int(os.getenv('COMPRESSION_ZSTD_LEVEL', 3))
+
+# выборка самых запрашиваемых ключей для прогрева кеша: доля учитываемых обращений, сколько разных ключей
+# копится в памяти между сбросами в редис, сколько самых частых хранится за сутки и за сколько суток они учитываются
+HOT_KEYS_ENABLED = os.getenv('HOT_KEYS_ENABLED', 'True') == 'True'
+HOT_KEYS_SAMPLE_RATE = float(os.getenv('HOT_KEYS_SAMPLE_RATE', 0.05))
+HOT_KEYS_BUFFER_SIZE = int(os.getenv('HOT_KEYS_BUFFER_SIZE', 10000))
+HOT_KEYS_MAX_SIZE = int(os.getenv('HOT_KEYS_MAX_SIZE', 5000))
+HOT_KEYS_DAYS = int(os.getenv('HOT_KEYS_DAYS', 2))
+HOT_KEYS_FLUSH_IN_SECONDS = int(os.getenv('HOT_KEYS_FLUSH_IN_SECONDS', 30))
+
+# прогрев кеша при старте: сколько самых частых объектов и поисков каждого вида загружать,
+# по сколько за один mget и msearch и сколько таких запросов выполнять одновременно
+WARMUP_ENABLED = os.getenv('WARMUP_ENABLED', 'True') == 'True'
+WARMUP_ITEMS = int(os.getenv('WARMUP_ITEMS', 1000))
+WARMUP_LISTS = int(os.getenv('WARMUP_LISTS', 200))
+WARMUP_MGET_SIZE = int(os.getenv('WARMUP_MGET_SIZE', 100))
+WARMUP_MSEARCH_SIZE = int(os.getenv('WARMUP_MSEARCH_SIZE', 20))
+WARMUP_CONCURRENCY = int(os.getenv('WARMUP_CONCURRENCY', 4))
+# готовность сообщается, когда прогрета такая доля ключей или когда истекло время прогрева
+WARMUP_TARGET_COVERAGE = float(os.getenv('WARMUP_TARGET_COVERAGE', 0.9))
+WARMUP_TIMEOUT_IN_SECONDS = int(os.getenv('WARMUP_TIMEOUT_IN_SECONDS', 60))
+
+# канал, в который ETL публикует загруженные в эластик документы
+CACHE_INVALIDATION_CHANNEL = os.getenv('CACHE_INVALIDATION_CHANNEL', 'cache_invalidation')
+
+# постраничная выдача через search_after: искать ли по снимку индекса (point in time) и сколько его держать
+CURSOR_PIT_ENABLED = os.getenv('CURSOR_PIT_ENABLED', 'False') == 'True'
+CURSOR_PIT_KEEP_ALIVE = os.getenv('CURSOR_PIT_KEEP_ALIVE', '1m')
+
+# профиль клиента эластика: узлы через запятую (запросы идут к ним по кругу), соединений в пуле на узел
+# и сколько простаивающее соединение держится открытым, повторы запроса на другом узле и обновление списка узлов
+ELASTIC_HOSTS = [host for host in os.getenv('ELASTIC_HOSTS', f'{ELASTIC_HOST}:{ELASTIC_PORT}').split(',') if host]
+ELASTIC_MAX_CONNECTIONS_PER_NODE = int(os.getenv('ELASTIC_MAX_CONNECTIONS_PER_NODE', 25))
+ELASTIC_KEEPALIVE_IN_SECONDS = float(os.getenv('ELASTIC_KEEPALIVE_IN_SECONDS', 60))
+ELASTIC_MAX_RETRIES = int(os.getenv('ELASTIC_MAX_RETRIES', 1))
+ELASTIC_RETRY_ON_TIMEOUT = os.getenv('ELASTIC_RETRY_ON_TIMEOUT', 'False') == 'True'
+ELASTIC_SNIFF_ON_START = os.getenv('ELASTIC_SNIFF_ON_START', 'False') == 'True'
+ELASTIC_SNIFF_ON_CONNECTION_FAIL = os.getenv('ELASTIC_SNIFF_ON_CONNECTION_FAIL', 'False') == 'True'
+# 0 — список узлов не обновляется
+ELASTIC_SNIFFER_TIMEOUT_IN_SECONDS = float(os.getenv('ELASTIC_SNIFFER_TIMEOUT_IN_SECONDS', 0))
+
+# бюджет времени на один запрос в эластик, после которого он прерывается
+ELASTIC_GET_TIMEOUT_IN_SECONDS = float(os.getenv('ELASTIC_GET_TIMEOUT_IN_SECONDS', 1))
+ELASTIC_SEARCH_TIMEOUT_IN_SECONDS = float(os.getenv('ELASTIC_SEARCH_TIMEOUT_IN_SECONDS', 2))
+# общий бюджет времени на все запросы в эластик одного запроса к API по префиксам маршрутов
+ELASTIC_ROUTE_TIMEOUTS = {
+    '/api/v1/suggest': float(os.getenv('ELASTIC_SUGGEST_ROUTE_TIMEOUT_IN_SECONDS', 0.3)),
+    '/api/v1/film': float(os.getenv('ELASTIC_FILM_ROUTE_TIMEOUT_IN_SECONDS', 2)),
+    '/api/v1/person': float(os.getenv('ELASTIC_PERSON_ROUTE_TIMEOUT_IN_SECONDS', 2)),
+    '/api/v1/genre': float(os.getenv('ELASTIC_GENRE_ROUTE_TIMEOUT_IN_SECONDS', 1)),
+}
+
+# размыкатель цепи перед эластиком: пока он разомкнут, запросы в эластик не отправляются,
+# а ответы отдаются из кеша, даже устаревшего
+CIRCUIT_BREAKER_ENABLED = os.getenv('CIRCUIT_BREAKER_ENABLED', 'True') == 'True'
+# по скольким последним запросам считается доля неудачных и с какого их количества цепь может разомкнуться
+CIRCUIT_BREAKER_WINDOW = int(os.getenv('CIRCUIT_BREAKER_WINDOW', 20))
+CIRCUIT_BREAKER_MIN_CALLS = int(os.getenv('CIRCUIT_BREAKER_MIN_CALLS', 10))
+CIRCUIT_BREAKER_FAILURE_RATE = float(os.getenv('CIRCUIT_BREAKER_FAILURE_RATE', 0.5))
+# запросы дольше этого считаются неудачными, даже если эластик ответил
+CIRCUIT_BREAKER_SLOW_CALL_IN_SECONDS = float(os.getenv('CIRCUIT_BREAKER_SLOW_CALL_IN_SECONDS', 0.5))
+# через сколько секунд после размыкания пропустить пробный запрос
+CIRCUIT_BREAKER_RESET_TIMEOUT_IN_SECONDS = float(os.getenv('CIRCUIT_BREAKER_RESET_TIMEOUT_IN_SECONDS', 5))
+
+# подсказки при наборе: сколько отдавать по умолчанию и максимум
+SUGGEST_DEFAULT_SIZE = int(os.getenv('SUGGEST_DEFAULT_SIZE', 5))
+SUGGEST_MAX_SIZE = int(os.getenv('SUGGEST_MAX_SIZE', 20))
+# префиксный индекс в памяти процесса по самым рейтинговым фильмам и персонам: большинство нажатий клавиш
+# обслуживается без эластика. Размер — сколько объектов каждого вида загружать, не больше 10000
+SUGGEST_LOCAL_ENABLED = os.getenv('SUGGEST_LOCAL_ENABLED', 'True') == 'True'
+SUGGEST_LOCAL_SIZE = int(os.getenv('SUGGEST_LOCAL_SIZE', 10000))
+SUGGEST_REFRESH_IN_SECONDS = int(os.getenv('SUGGEST_REFRESH_IN_SECONDS', 60 * 5))
+
+# небольшие индексы, которые целиком держатся в памяти процесса и отдаются без редиса и эластика
+RESIDENT_CATALOG_INDEXES = [index for index in os.getenv('RESIDENT_CATALOG_INDEXES', 'genre').split(',') if index]
+# если в индексе столько документов или больше, он обслуживается обычным путём
+RESIDENT_CATALOG_MAX_SIZE = int(os.getenv('RESIDENT_CATALOG_MAX_SIZE', 1000))
+RESIDENT_CATALOG_REFRESH_IN_SECONDS = int(os.getenv('RESIDENT_CATALOG_REFRESH_IN_SECONDS', 60 * 10))
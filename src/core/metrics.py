@@ -0,0 +1,34 @@
+from prometheus_client import Counter, Gauge, Histogram
+
+# время ответа по маршрутам, маршрут берётся по шаблону пути, а не по самому пути
+REQUEST_LATENCY = Histogram(
+    'api_request_duration_seconds', 'Время обработки запроса', ['method', 'route', 'status'],
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+)
+RESPONSE_SIZE = Histogram(
+    'api_response_size_bytes', 'Размер тела ответа', ['route'],
+    buckets=(128, 512, 1024, 4096, 16384, 65536, 262144, 1048576),
+)
+REQUESTS_IN_PROGRESS = Gauge('api_requests_in_progress', 'Запросы в обработке')
+
+# обращения к кешу: tier — local/redis, entity — пространство ключей, result — hit/miss/error
+CACHE_REQUESTS = Counter('cache_requests_total', 'Обращения к кешу', ['tier', 'entity', 'result'])
+LOCAL_CACHE_SIZE = Gauge('local_cache_entries', 'Записей в кеше процесса', ['entity'])
+REDIS_POOL_CONNECTIONS = Gauge('redis_pool_connections', 'Соединения пула редиса', ['state'])
+
+ES_REQUESTS = Counter('elasticsearch_requests_total', 'Запросы в эластик', ['index', 'operation', 'status'])
+ES_LATENCY = Histogram(
+    'elasticsearch_request_duration_seconds', 'Время запроса в эластик на стороне клиента', ['index', 'operation'],
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+)
+ES_TOOK = Histogram(
+    'elasticsearch_took_seconds', 'Время выполнения запроса самим эластиком (took)', ['index', 'operation'],
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+)
+# пулы соединений клиента эластика: state — in_use (запросы в работе)/max, узлы — alive/dead
+ES_POOL_CONNECTIONS = Gauge('elasticsearch_pool_connections', 'Соединения пулов эластика', ['state'])
+ES_NODES = Gauge('elasticsearch_nodes', 'Узлы эластика в пуле клиента', ['state'])
+
+# 0 — цепь замкнута, 1 — пробный запрос, 2 — разомкнута
+CIRCUIT_BREAKER_STATE = Gauge('circuit_breaker_state', 'Состояние размыкателя цепи', ['name'])
+STALE_FALLBACKS = Counter('stale_fallbacks_total', 'Ответы из устаревшего кеша при недоступном эластике', ['entity'])
@@ -1,8 +1,35 @@
+import math
+import random
+import time
 from abc import ABC, abstractclassmethod
-from typing import Optional, List
+from typing import Dict, Iterable, Optional, List
 from pydantic import BaseModel
 
 
+class CacheEntry:
+    """
+    Значение из кеша с мягким сроком годности. После него значение ещё отдаётся,
+    но должно быть обновлено в фоне, жёсткий срок задаёт время жизни ключа в хранилище
+    """
+
+    def __init__(self, value, soft_expire: float, delta: float = 0.0):
+        self.value = value
+        # unix-время, после которого значение считается устаревшим
+        self.soft_expire = soft_expire
+        # сколько секунд заняло получение значения из эластика
+        self.delta = delta
+
+    def is_stale(self) -> bool:
+        return time.time() >= self.soft_expire
+
+    def should_refresh(self, beta: float) -> bool:
+        """
+        Вероятностное досрочное обновление (XFetch): чем ближе мягкий срок годности и чем дороже
+        пересчёт, тем выше шанс обновить значение заранее, поэтому обновления разносятся во времени
+        """
+        return time.time() - self.delta * beta * math.log(1.0 - random.random()) >= self.soft_expire
+
+
 class AbstractCacheExecutor(ABC):
 
     @abstractclassmethod
@@ -14,9 +41,37 @@ class AbstractCacheExecutor(ABC):
         ...
 
     @abstractclassmethod
-    def put_item_to_cache(self, item: BaseModel) -> None:
+    def item_entry_from_cache(self, item_id: str) -> Optional[CacheEntry]:
+        ...
+
+    @abstractclassmethod
+    def items_entry_from_cache(self, item_id: str) -> Optional[CacheEntry]:
+        ...
+
+    @abstractclassmethod
+    def put_item_to_cache(self, item: BaseModel, delta: float = 0.0) -> None:
+        ...
+
+    @abstractclassmethod
+    def put_items_to_cache(self, item, key=None, delta: float = 0.0) -> None:
+        ...
+
+    @abstractclassmethod
+    def ids_entry_from_cache(self, key: str) -> Optional[CacheEntry]:
+        ...
+
+    @abstractclassmethod
+    def put_ids_to_cache(self, ids: List[str], key=None, delta: float = 0.0) -> None:
+        ...
+
+    @abstractclassmethod
+    def item_entries_from_cache(self, ids: List[str]) -> Dict[str, CacheEntry]:
+        ...
+
+    @abstractclassmethod
+    def put_many_items_to_cache(self, items: Iterable[BaseModel], delta: float = 0.0) -> None:
         ...
 
     @abstractclassmethod
-    def put_items_to_cache(self, item) -> None:
+    def put_missing_to_cache(self, ids: List[str]) -> None:
         ...
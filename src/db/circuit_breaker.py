@@ -0,0 +1,100 @@
+import logging
+import time
+from collections import deque
+
+from core.metrics import CIRCUIT_BREAKER_STATE
+
+CLOSED, HALF_OPEN, OPEN = 'closed', 'half_open', 'open'
+STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+
+class CircuitOpenError(Exception):
+    pass
+
+
+class CircuitBreaker:
+    """
+    Размыкатель цепи: считает исходы последних запросов и, если неудачных слишком много,
+    на reset_timeout секунд перестаёт пропускать запросы. Затем пропускает один пробный
+    и по его исходу замыкает цепь или снова размыкает
+    """
+
+    def __init__(
+            self, name: str, window: int, min_calls: int, failure_rate: float,
+            slow_call: float, reset_timeout: float,
+    ):
+        self.name = name
+        self.min_calls = min_calls
+        self.failure_rate = failure_rate
+        self.slow_call = slow_call
+        self.reset_timeout = reset_timeout
+        self._outcomes = deque(maxlen=window)
+        self._opened_at = 0.0
+        self._probing = False
+        self.state = CLOSED
+        CIRCUIT_BREAKER_STATE.labels(name).set(STATE_VALUES[CLOSED])
+
+    def _set_state(self, state: str) -> None:
+        if state != self.state:
+            logging.warning('Circuit breaker %s: %s -> %s', self.name, self.state, state)
+        self.state = state
+        CIRCUIT_BREAKER_STATE.labels(self.name).set(STATE_VALUES[state])
+
+    def retry_after(self) -> float:
+        return max(0.0, self._opened_at + self.reset_timeout - time.monotonic())
+
+    def allows_calls(self) -> bool:
+        return self.state != OPEN or self.retry_after() == 0
+
+    def before_call(self) -> bool:
+        """
+        Разрешает запрос или бросает CircuitOpenError. Возвращает True, если запрос пробный:
+        только его исход замыкает или снова размыкает цепь
+        """
+        if self.state == OPEN:
+            if self.retry_after() > 0:
+                raise CircuitOpenError(self.name)
+            self._set_state(HALF_OPEN)
+        if self.state == HALF_OPEN:
+            # пока идёт пробный запрос, остальные не пропускаются
+            if self._probing:
+                raise CircuitOpenError(self.name)
+            self._probing = True
+            return True
+        return False
+
+    def on_success(self, duration: float, probe: bool = False) -> None:
+        self.record(duration <= self.slow_call, probe)
+
+    def on_failure(self, probe: bool = False) -> None:
+        self.record(False, probe)
+
+    def on_cancel(self, probe: bool = False) -> None:
+        # отменённый пробный запрос ничего не говорит о состоянии эластика
+        if probe:
+            self._probing = False
+
+    def record(self, success: bool, probe: bool = False) -> None:
+        if self.state == OPEN:
+            # запрос был отправлен до размыкания
+            return
+        if self.state == HALF_OPEN:
+            if not probe:
+                # запрос был отправлен до размыкания и завершился уже во время пробы
+                return
+            self._probing = False
+            if success:
+                self._outcomes.clear()
+                self._set_state(CLOSED)
+            else:
+                self.open()
+            return
+        self._outcomes.append(success)
+        failures = self._outcomes.count(False)
+        if len(self._outcomes) >= self.min_calls and failures / len(self._outcomes) >= self.failure_rate:
+            self.open()
+
+    def open(self) -> None:
+        self._opened_at = time.monotonic()
+        self._outcomes.clear()
+        self._set_state(OPEN)
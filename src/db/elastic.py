@@ -1,9 +1,155 @@
-from elasticsearch import AsyncElasticsearch, exceptions
+import asyncio
+import time
+from contextvars import ContextVar
+from typing import Awaitable, Callable, Optional, List, Tuple
+
+import aiohttp
+from elasticsearch import AIOHttpConnection, AsyncElasticsearch, exceptions
 from pydantic import BaseModel
-from typing import Optional, List
+
+from core import config
+from core.metrics import ES_LATENCY, ES_NODES, ES_POOL_CONNECTIONS, ES_REQUESTS, ES_TOOK
+from db.circuit_breaker import CircuitBreaker, CircuitOpenError
+
+try:
+    # класс ответа, который ждёт клиент эластика; его версия закреплена в requirements
+    from elasticsearch._async.http_aiohttp import ESClientResponse
+except ImportError:
+    ESClientResponse = None
 
 es: AsyncElasticsearch = None
 
+# запросы к эластику, которые сейчас в работе: каждый занимает соединение пула
+in_flight = 0
+
+# момент (по часам цикла событий), к которому должны уложиться все запросы в эластик текущего запроса к API
+deadline: ContextVar[Optional[float]] = ContextVar('elastic_deadline', default=None)
+
+# один размыкатель на кластер: если эластик деградировал, то для всех индексов сразу
+breaker = CircuitBreaker(
+    'elasticsearch',
+    window=config.CIRCUIT_BREAKER_WINDOW,
+    min_calls=config.CIRCUIT_BREAKER_MIN_CALLS,
+    failure_rate=config.CIRCUIT_BREAKER_FAILURE_RATE,
+    slow_call=config.CIRCUIT_BREAKER_SLOW_CALL_IN_SECONDS,
+    reset_timeout=config.CIRCUIT_BREAKER_RESET_TIMEOUT_IN_SECONDS,
+)
+
+TIMEOUTS = {
+    'get': config.ELASTIC_GET_TIMEOUT_IN_SECONDS,
+    'mget': config.ELASTIC_GET_TIMEOUT_IN_SECONDS,
+    'open_point_in_time': config.ELASTIC_GET_TIMEOUT_IN_SECONDS,
+    'suggest': config.ELASTIC_GET_TIMEOUT_IN_SECONDS,
+}
+
+
+class KeepAliveConnection(AIOHttpConnection):
+    """
+    Соединение с узлом эластика, в пуле которого простаивающие соединения живут keepalive_timeout секунд.
+    Сессия для https создаётся клиентом как обычно, с keep-alive по умолчанию aiohttp
+    """
+
+    def __init__(self, *args, keepalive_timeout: float = None, maxsize: int = 10, **kwargs):
+        super().__init__(*args, maxsize=maxsize, **kwargs)
+        self.maxsize = maxsize
+        self.keepalive_timeout = keepalive_timeout
+
+    async def perform_request(self, *args, **kwargs):
+        if self.session is None and not self.use_ssl and ESClientResponse is not None:
+            self.session = aiohttp.ClientSession(
+                headers=self.headers,
+                auto_decompress=True,
+                cookie_jar=aiohttp.DummyCookieJar(),
+                response_class=ESClientResponse,
+                connector=aiohttp.TCPConnector(
+                    limit=self.maxsize, use_dns_cache=True, keepalive_timeout=self.keepalive_timeout,
+                ),
+            )
+        return await super().perform_request(*args, **kwargs)
+
+
+def create_elastic() -> AsyncElasticsearch:
+    """
+    Клиент эластика по профилю из настроек: узлы перебираются по кругу, у каждого свой пул соединений
+    """
+    return AsyncElasticsearch(
+        hosts=config.ELASTIC_HOSTS,
+        connection_class=KeepAliveConnection,
+        keepalive_timeout=config.ELASTIC_KEEPALIVE_IN_SECONDS,
+        maxsize=config.ELASTIC_MAX_CONNECTIONS_PER_NODE,
+        timeout=config.ELASTIC_SEARCH_TIMEOUT_IN_SECONDS,
+        max_retries=config.ELASTIC_MAX_RETRIES,
+        retry_on_timeout=config.ELASTIC_RETRY_ON_TIMEOUT,
+        sniff_on_start=config.ELASTIC_SNIFF_ON_START,
+        sniff_on_connection_fail=config.ELASTIC_SNIFF_ON_CONNECTION_FAIL,
+        sniffer_timeout=config.ELASTIC_SNIFFER_TIMEOUT_IN_SECONDS or None,
+    )
+
+
+def elastic_pool_stats() -> dict:
+    """
+    Число живых и исключённых из перебора узлов эластика и загрузка их пулов: запросы в работе
+    и общий предел соединений
+    """
+    pool = es.transport.connection_pool
+    nodes = {'alive': len(pool.connections), 'dead': pool.dead.qsize() if hasattr(pool, 'dead') else 0}
+    for state, value in nodes.items():
+        ES_NODES.labels(state).set(value)
+    # исключённые узлы тоже держат пулы соединений
+    connections = {
+        'in_use': in_flight,
+        'max': config.ELASTIC_MAX_CONNECTIONS_PER_NODE * len(getattr(pool, 'orig_connections', pool.connections)),
+    }
+    for state, value in connections.items():
+        ES_POOL_CONNECTIONS.labels(state).set(value)
+    return {'nodes': nodes, 'connections': connections}
+
+
+def timeout_for(operation: str) -> Tuple[float, bool]:
+    """
+    Время на запрос: бюджет операции, но не больше, чем осталось от бюджета маршрута.
+    Второе значение — урезал ли время бюджет маршрута
+    """
+    timeout = TIMEOUTS.get(operation, config.ELASTIC_SEARCH_TIMEOUT_IN_SECONDS)
+    route_deadline = deadline.get()
+    if route_deadline is not None:
+        left = route_deadline - asyncio.get_event_loop().time()
+        if left < timeout:
+            return left, True
+    return timeout, False
+
+
+def set_route_budget(budget: Optional[float]) -> None:
+    if budget:
+        deadline.set(asyncio.get_event_loop().time() + budget)
+
+
+def without_route_budget(fn: Callable[[], Awaitable]) -> Callable[[], Awaitable]:
+    """
+    Фоновая задача получает копию контекста запроса-инициатора, но его бюджетом не ограничена
+    """
+    async def run():
+        deadline.set(None)
+        return await fn()
+    return run
+
+
+class ElasticUnavailable(Exception):
+    """
+    Эластик не ответил вовремя, вернул ошибку на своей стороне или размыкатель цепи не пропустил запрос
+    """
+
+    def __init__(self, reason: str, retry_after: float = 0.0):
+        super().__init__(reason)
+        self.retry_after = retry_after
+
+
+def is_unavailable(error: exceptions.TransportError) -> bool:
+    # ошибки запроса (400, 404) говорят о запросе, а не о состоянии эластика
+    return isinstance(error, exceptions.ConnectionError) or error.status_code == 429 or (
+        isinstance(error.status_code, int) and error.status_code >= 500
+    )
+
 
 # функция понадобится при внедрении зависимостей
 async def get_elastic() -> AsyncElasticsearch:
@@ -12,19 +158,196 @@ async def get_elastic() -> AsyncElasticsearch:
 
 class ElasticExecutor:
 
-    def __init__(self, elastic, index, model):
+    def __init__(self, elastic, index, model, source: List[str] = None):
         self.elastic = elastic
         self.index = index
         self.model = model
+        # поля документа, которые нужны модели: остальное эластик не отдаёт
+        self.source = source
+
+    def with_source(self, params: dict = None) -> dict:
+        params = dict(params or {})
+        if self.source:
+            params['_source_includes'] = ','.join(self.source)
+        return params
+
+    async def call(self, operation: str, request: Callable[[float], Awaitable]):
+        """
+        Выполняет запрос к эластику в пределах бюджета времени операции и маршрута через размыкатель цепи,
+        собирая статистику: количество, время на клиенте и took. request получает время на запрос,
+        которое передаётся клиенту эластика как request_timeout
+        """
+        timeout, truncated = timeout_for(operation)
+        if timeout <= 0:
+            # бюджет маршрута уже израсходован: эластик тут ни при чём, размыкатель об этом не узнаёт
+            ES_REQUESTS.labels(self.index, operation, 'budget_exhausted').inc()
+            raise ElasticUnavailable(f'{operation} has no time left in the route budget')
+        probe = False
+        if config.CIRCUIT_BREAKER_ENABLED:
+            try:
+                probe = breaker.before_call()
+            except CircuitOpenError:
+                ES_REQUESTS.labels(self.index, operation, 'circuit_open').inc()
+                raise ElasticUnavailable('circuit breaker is open', retry_after=breaker.retry_after())
+
+        global in_flight
+        started = time.monotonic()
+        status = 'ok'
+        in_flight += 1
+        try:
+            result = await asyncio.wait_for(request(timeout), timeout)
+        except (asyncio.TimeoutError, exceptions.ConnectionTimeout) as error:
+            if truncated:
+                # время урезал бюджет маршрута: медленным эластик от этого не считается
+                status = 'budget_timeout'
+                self.on_cancel(probe)
+                raise ElasticUnavailable(f'{operation} ran out of the route budget') from error
+            status = 'timeout'
+            self.on_failure(probe)
+            raise ElasticUnavailable(f'{operation} timed out') from error
+        except exceptions.NotFoundError:
+            status = 'not_found'
+            self.on_success(time.monotonic() - started, probe)
+            raise
+        except exceptions.TransportError as error:
+            if not is_unavailable(error):
+                status = 'error'
+                self.on_success(time.monotonic() - started, probe)
+                raise
+            status = 'unavailable'
+            self.on_failure(probe)
+            raise ElasticUnavailable(f'{operation} failed: {error!r}') from error
+        except asyncio.CancelledError:
+            status = 'cancelled'
+            self.on_cancel(probe)
+            raise
+        except Exception:
+            status = 'error'
+            self.on_failure(probe)
+            raise
+        finally:
+            in_flight -= 1
+            ES_REQUESTS.labels(self.index, operation, status).inc()
+            ES_LATENCY.labels(self.index, operation).observe(time.monotonic() - started)
+        self.on_success(time.monotonic() - started, probe)
+        if 'took' in result:
+            ES_TOOK.labels(self.index, operation).observe(result['took'] / 1000)
+        return result
+
+    @staticmethod
+    def on_success(duration: float, probe: bool) -> None:
+        if config.CIRCUIT_BREAKER_ENABLED:
+            breaker.on_success(duration, probe)
+
+    @staticmethod
+    def on_failure(probe: bool) -> None:
+        if config.CIRCUIT_BREAKER_ENABLED:
+            breaker.on_failure(probe)
+
+    @staticmethod
+    def on_cancel(probe: bool) -> None:
+        # исход вызова ничего не говорит об эластике: пробный вызов освобождается без записи
+        if config.CIRCUIT_BREAKER_ENABLED:
+            breaker.on_cancel(probe)
 
     async def get_from_elastic_by_id(self, item_id: str) -> Optional[BaseModel]:
         try:
-            doc = await self.elastic.get(self.index, item_id)
+            doc = await self.call('get', lambda timeout: self.elastic.get(
+                self.index, item_id, params=self.with_source(), request_timeout=timeout
+            ))
         except exceptions.NotFoundError:
             return {}
         return self.model(**doc['_source'])
 
     async def get_detected_from_elastic(self, body: dict, params: dict) -> Optional[List[BaseModel]]:
-        items = await self.elastic.search(index=self.index, body=body, params=params)
+        items = await self.call('search', lambda timeout: self.elastic.search(
+            index=self.index, body=body, params=self.with_source(params), request_timeout=timeout
+        ))
         models = [self.model(**hit['_source']) for hit in items['hits']['hits']]
         return models
+
+    async def get_from_elastic_by_ids(self, ids: List[str]) -> List[BaseModel]:
+        """
+        Достаёт объекты по списку id одним запросом mget, ненайденные id пропускаются
+        """
+        if not ids:
+            return []
+        docs = await self.call('mget', lambda timeout: self.elastic.mget(
+            body={'ids': ids}, index=self.index, params=self.with_source(), request_timeout=timeout
+        ))
+        return [self.model(**doc['_source']) for doc in docs['docs'] if doc.get('found')]
+
+    async def msearch_from_elastic(
+            self, searches: List[Tuple[Optional[dict], dict]]
+    ) -> List[Optional[List[BaseModel]]]:
+        """
+        Несколько поисков одним запросом msearch. Для поиска, завершившегося ошибкой, вместо списка None
+        """
+        lines = []
+        for body, params in searches:
+            lines.extend(({}, self.search_body(body, params)))
+        result = await self.call('msearch', lambda timeout: self.elastic.msearch(
+            body=lines, index=self.index, request_timeout=timeout
+        ))
+        return [
+            None if 'error' in response else [self.model(**hit['_source']) for hit in response['hits']['hits']]
+            for response in result['responses']
+        ]
+
+    def search_body(self, body: Optional[dict], params: dict) -> dict:
+        """
+        Тело поиска с параметрами адреса: у отдельных поисков в msearch их нет
+        """
+        body = dict(body or {})
+        for param, field in (('from_', 'from'), ('from', 'from'), ('size', 'size')):
+            if params.get(param):
+                body[field] = int(params[param])
+        if params.get('sort'):
+            field, _, order = params['sort'].partition(':')
+            body['sort'] = [{field: order or 'asc'}]
+        if self.source:
+            body['_source'] = self.source
+        return body
+
+    async def search_after_from_elastic(
+            self, body: dict, search_after: Optional[list] = None, pit_id: Optional[str] = None, keep_alive: str = None
+    ) -> Tuple[List[BaseModel], Optional[list], Optional[str]]:
+        """
+        Страница после документа с переданными значениями сортировки. С point in time поиск идёт
+        по снимку индекса, и страницы не съезжают при его обновлении
+        """
+        body = dict(body)
+        if self.source:
+            body['_source'] = self.source
+        if search_after is not None:
+            body['search_after'] = search_after
+        if pit_id:
+            body['pit'] = {'id': pit_id, 'keep_alive': keep_alive}
+            items = await self.call('search_after', lambda timeout: self.elastic.search(
+                body=body, request_timeout=timeout
+            ))
+        else:
+            items = await self.call('search_after', lambda timeout: self.elastic.search(
+                index=self.index, body=body, request_timeout=timeout
+            ))
+        hits = items['hits']['hits']
+        last_sort = hits[-1]['sort'] if hits else None
+        return [self.model(**hit['_source']) for hit in hits], last_sort, items.get('pit_id', pit_id)
+
+    async def suggest_from_elastic(self, field: str, prefix: str, size: int) -> List[BaseModel]:
+        """
+        Подсказки completion-суггестера по префиксу, в порядке веса
+        """
+        body = {'suggest': {'suggestions': {'prefix': prefix, 'completion': {'field': field, 'size': size}}}}
+        if self.source:
+            body['_source'] = self.source
+        items = await self.call('suggest', lambda timeout: self.elastic.search(
+            index=self.index, body=body, request_timeout=timeout
+        ))
+        return [self.model(**option['_source']) for option in items['suggest']['suggestions'][0]['options']]
+
+    async def open_point_in_time(self, keep_alive: str) -> str:
+        pit = await self.call('open_point_in_time', lambda timeout: self.elastic.open_point_in_time(
+            index=self.index, params={'keep_alive': keep_alive}, request_timeout=timeout
+        ))
+        return pit['id']
@@ -0,0 +1,228 @@
+import random
+import time
+from collections import OrderedDict
+from typing import Dict, Hashable, Iterable, List, Optional, TypeVar
+
+from pydantic import BaseModel
+
+from core import config
+from core.metrics import CACHE_REQUESTS, LOCAL_CACHE_SIZE
+from db.base import AbstractCacheExecutor, CacheEntry
+from db.redis import FILM_CACHE_EXPIRE_IN_SECONDS
+
+T = TypeVar('T', bound=BaseModel)
+
+
+class LocalCache:
+    """
+    LRU-кеш в памяти процесса с ограничением по количеству записей и временем жизни
+    """
+
+    def __init__(self, max_size: int, expire: float, jitter: float = 0.0, name: str = 'local'):
+        self.name = name
+        self.max_size = max_size
+        self.expire = expire
+        self.jitter = jitter
+        self.hits = 0
+        self.misses = 0
+        self._data: OrderedDict = OrderedDict()
+
+    def get(self, key: Hashable):
+        record = self._data.get(key)
+        if record is None:
+            self._count('miss')
+            return None
+        value, expire_at = record
+        if expire_at < time.monotonic():
+            # устаревшая запись остаётся до вытеснения: её можно отдать, если эластик недоступен
+            self._count('miss')
+            return None
+        self._data.move_to_end(key)
+        self._count('hit')
+        return value
+
+    def get_stale(self, key: Hashable):
+        """
+        Последнее известное значение без учёта времени жизни
+        """
+        record = self._data.get(key)
+        return record[0] if record else None
+
+    def _count(self, result: str) -> None:
+        if result == 'hit':
+            self.hits += 1
+        else:
+            self.misses += 1
+        CACHE_REQUESTS.labels('local', self.name, result).inc()
+
+    def set(self, key: Hashable, value, expire: Optional[float] = None) -> None:
+        expire = self.expire if expire is None else expire
+        # разбрасываем время жизни, чтобы горячие записи не устаревали одновременно
+        expire *= 1 + random.uniform(-self.jitter, self.jitter)
+        self._data[key] = (value, time.monotonic() + expire)
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_size:
+            self._data.popitem(last=False)
+
+    def delete(self, key: Hashable) -> None:
+        self._data.pop(key, None)
+
+    def clear(self) -> None:
+        self._data.clear()
+
+    def stats(self) -> dict:
+        return {'size': len(self._data), 'max_size': self.max_size, 'hits': self.hits, 'misses': self.misses}
+
+
+# кеши процесса по индексам, общие для всех экземпляров сервисов
+local_caches: Dict[str, LocalCache] = {}
+
+
+def get_local_cache(namespace: str) -> LocalCache:
+    if namespace not in local_caches:
+        local_caches[namespace] = LocalCache(
+            max_size=config.LOCAL_CACHE_MAX_SIZE.get(namespace, config.LOCAL_CACHE_DEFAULT_SIZE),
+            expire=config.LOCAL_CACHE_EXPIRE_IN_SECONDS,
+            jitter=config.LOCAL_CACHE_JITTER,
+            name=namespace,
+        )
+    return local_caches[namespace]
+
+
+def local_caches_stats() -> Dict[str, dict]:
+    stats = {namespace: cache.stats() for namespace, cache in local_caches.items()}
+    for namespace, cache_stats in stats.items():
+        LOCAL_CACHE_SIZE.labels(namespace).set(cache_stats['size'])
+    return stats
+
+
+class LocalCacheExecutor(AbstractCacheExecutor):
+    """
+    Хранит готовые модели, поэтому попадание в кеш не требует ни запроса в редис, ни parse_raw
+    """
+
+    def __init__(self, cache: LocalCache, model):
+        self.cache = cache
+        self.model = model
+
+    async def item_from_cache(self, item_id: str) -> Optional[T]:
+        entry = self.cache.get(item_id)
+        return entry.value if entry else None
+
+    async def items_from_cache(self, item_id: str) -> Optional[List[T]]:
+        entry = self.cache.get(item_id)
+        return entry.value if entry else None
+
+    async def item_entry_from_cache(self, item_id: str) -> Optional[CacheEntry]:
+        return self.cache.get(item_id)
+
+    async def items_entry_from_cache(self, item_id: str) -> Optional[CacheEntry]:
+        return self.cache.get(item_id)
+
+    async def put_item_to_cache(self, item: Optional[T], delta: float = 0.0) -> None:
+        self.put_entry(item.id, CacheEntry(item, time.time() + FILM_CACHE_EXPIRE_IN_SECONDS, delta))
+
+    async def put_items_to_cache(self, items: List[Optional[T]], key=None, delta: float = 0.0) -> None:
+        self.put_entry(key, CacheEntry(items, time.time() + FILM_CACHE_EXPIRE_IN_SECONDS, delta))
+
+    async def ids_entry_from_cache(self, key: str) -> Optional[CacheEntry]:
+        return self.cache.get(key)
+
+    async def put_ids_to_cache(self, ids: List[str], key=None, delta: float = 0.0) -> None:
+        self.put_entry(key, CacheEntry(ids, time.time() + FILM_CACHE_EXPIRE_IN_SECONDS, delta))
+
+    async def item_entries_from_cache(self, ids: List[str]) -> Dict[str, CacheEntry]:
+        entries = {}
+        for item_id in ids:
+            entry = self.cache.get(item_id)
+            if entry is not None:
+                entries[item_id] = entry
+        return entries
+
+    async def put_many_items_to_cache(self, items: Iterable[T], delta: float = 0.0) -> None:
+        for item in items:
+            await self.put_item_to_cache(item, delta)
+
+    async def put_missing_to_cache(self, ids: List[str]) -> None:
+        for item_id in ids:
+            self.put_entry(item_id, CacheEntry(None, time.time() + config.NEGATIVE_CACHE_EXPIRE_IN_SECONDS))
+
+    def put_entry(self, key: str, entry: CacheEntry) -> None:
+        # запись о несуществующем объекте живёт не дольше, чем в редисе
+        expire = None
+        if entry.value is None:
+            expire = min(self.cache.expire, config.NEGATIVE_CACHE_EXPIRE_IN_SECONDS)
+        self.cache.set(key, entry, expire=expire)
+
+
+class TieredCacheExecutor(AbstractCacheExecutor):
+    """
+    Двухуровневый кеш: локальный кеш процесса (L1) перед общим для всех воркеров редисом (L2)
+    """
+
+    def __init__(self, local: LocalCacheExecutor, remote: AbstractCacheExecutor):
+        self.local = local
+        self.remote = remote
+
+    async def item_from_cache(self, item_id: str) -> Optional[T]:
+        entry = await self.item_entry_from_cache(item_id)
+        return entry.value if entry else None
+
+    async def items_from_cache(self, item_id: str) -> Optional[List[T]]:
+        entry = await self.items_entry_from_cache(item_id)
+        return entry.value if entry else None
+
+    async def item_entry_from_cache(self, item_id: str) -> Optional[CacheEntry]:
+        entry = await self.local.item_entry_from_cache(item_id)
+        if entry is None:
+            entry = await self.remote.item_entry_from_cache(item_id)
+            if entry is not None:
+                self.local.put_entry(item_id, entry)
+        return entry
+
+    async def items_entry_from_cache(self, item_id: str) -> Optional[CacheEntry]:
+        entry = await self.local.items_entry_from_cache(item_id)
+        if entry is None:
+            entry = await self.remote.items_entry_from_cache(item_id)
+            if entry is not None:
+                self.local.put_entry(item_id, entry)
+        return entry
+
+    async def ids_entry_from_cache(self, key: str) -> Optional[CacheEntry]:
+        entry = await self.local.ids_entry_from_cache(key)
+        if entry is None:
+            entry = await self.remote.ids_entry_from_cache(key)
+            if entry is not None:
+                self.local.put_entry(key, entry)
+        return entry
+
+    async def item_entries_from_cache(self, ids: List[str]) -> Dict[str, CacheEntry]:
+        entries = await self.local.item_entries_from_cache(ids)
+        missing = [item_id for item_id in ids if item_id not in entries]
+        if missing:
+            remote_entries = await self.remote.item_entries_from_cache(missing)
+            for item_id, entry in remote_entries.items():
+                self.local.put_entry(item_id, entry)
+            entries.update(remote_entries)
+        return entries
+
+    async def put_ids_to_cache(self, ids: List[str], key=None, delta: float = 0.0) -> None:
+        await self.remote.put_ids_to_cache(ids, key=key, delta=delta)
+        await self.local.put_ids_to_cache(ids, key=key, delta=delta)
+
+    async def put_many_items_to_cache(self, items: Iterable[T], delta: float = 0.0) -> None:
+        items = list(items)
+        await self.remote.put_many_items_to_cache(items, delta)
+        await self.local.put_many_items_to_cache(items, delta)
+
+    async def put_missing_to_cache(self, ids: List[str]) -> None:
+        await self.remote.put_missing_to_cache(ids)
+        await self.local.put_missing_to_cache(ids)
+
+    async def put_item_to_cache(self, item: Optional[T], delta: float = 0.0) -> None:
+        await self.remote.put_item_to_cache(item, delta)
+        await self.local.put_item_to_cache(item, delta)
+
+    async def put_items_to_cache(self, items: List[Optional[T]], key=None, delta: float = 0.0) -> None:
+        await self.remote.put_items_to_cache(items, key=key, delta=delta)
+        await self.local.put_items_to_cache(items, key=key, delta=delta)
@@ -1,59 +1,227 @@
-from aioredis import Redis
+from aioredis import Redis, RedisError
 
-from typing import Optional, TypeVar, List
+from typing import Dict, Iterable, Optional, Tuple, TypeVar, List
 import json
+import time
+import uuid
 
 from pydantic import BaseModel
 
-from db.base import AbstractCacheExecutor
+from core import config
+from core.metrics import CACHE_REQUESTS, REDIS_POOL_CONNECTIONS
+from db.base import AbstractCacheExecutor, CacheEntry
 
 redis: Redis = None
 
-FILM_CACHE_EXPIRE_IN_SECONDS = 60 * 5  # 5 минут
+FILM_CACHE_EXPIRE_IN_SECONDS = config.CACHE_EXPIRE_IN_SECONDS
+# после мягкого срока годности запись ещё какое-то время хранится, чтобы отдавать её, пока идёт обновление
+CACHE_HARD_EXPIRE_IN_SECONDS = FILM_CACHE_EXPIRE_IN_SECONDS + config.CACHE_STALE_IN_SECONDS
+ENTRY_FORMAT = 'e1'
+# компактная запись о том, что объекта с таким id нет в эластике
+MISSING_ITEM = b'-'
 T = TypeVar('T', bound=BaseModel)
 
+# удаляем блокировку, только если она всё ещё принадлежит нам
+RELEASE_LOCK_SCRIPT = '''
+if redis.call("get", KEYS[1]) == ARGV[1] then
+    return redis.call("del", KEYS[1])
+end
+return 0
+'''
+
 
 # функция понадобится при внедрении зависимостей
 async def get_redis() -> Redis:
     return redis
 
 
+def redis_pool_stats() -> dict:
+    """
+    Заполненность пула соединений, по ней подбираются minsize и maxsize
+    """
+    pool = redis.connection
+    stats = {'size': pool.size, 'free': pool.freesize, 'minsize': pool.minsize, 'maxsize': pool.maxsize}
+    for state, value in stats.items():
+        REDIS_POOL_CONNECTIONS.labels(state).set(value)
+    return stats
+
+
+def encode_entry(payload: str, delta: float) -> str:
+    """
+    Запись кеша: версия формата, мягкий срок годности, время пересчёта и сами данные
+    """
+    soft_expire = time.time() + FILM_CACHE_EXPIRE_IN_SECONDS
+    return f'{ENTRY_FORMAT}|{soft_expire:.3f}|{delta:.3f}|{payload}'
+
+
+def missing_entry() -> CacheEntry:
+    return CacheEntry(None, time.time() + config.NEGATIVE_CACHE_EXPIRE_IN_SECONDS)
+
+
+def decode_entry(data: bytes) -> Optional[Tuple[bytes, float, float]]:
+    parts = data.split(b'|', 3)
+    if len(parts) != 4 or parts[0] != ENTRY_FORMAT.encode():
+        # запись в старом формате считаем промахом, она будет перезаписана
+        return None
+    _, soft_expire, delta, payload = parts
+    return payload, float(soft_expire), float(delta)
+
+
 class RedisCacheExecutor(AbstractCacheExecutor):
     model = BaseModel
 
-    def __init__(self, redis, model):
+    def __init__(self, redis, model, namespace: str = None):
         self.redis = redis
         self.model = model
+        # префикс ключей отдельных объектов, чтобы id разных индексов не пересекались
+        self.namespace = namespace
+
+    def item_key(self, item_id: str) -> str:
+        return f'{self.namespace}:id:{item_id}' if self.namespace else item_id
+
+    def count(self, result: str, amount: int = 1) -> None:
+        if amount:
+            CACHE_REQUESTS.labels('redis', self.namespace or '', result).inc(amount)
+
+    async def get(self, key: str) -> Optional[bytes]:
+        try:
+            data = await self.redis.get(key)
+        except RedisError:
+            self.count('error')
+            raise
+        self.count('hit' if data else 'miss')
+        return data
+
+    async def mget(self, keys: List[str]) -> List[Optional[bytes]]:
+        try:
+            values = await self.redis.mget(*keys)
+        except RedisError:
+            self.count('error', len(keys))
+            raise
+        hits = sum(1 for data in values if data)
+        self.count('hit', hits)
+        self.count('miss', len(values) - hits)
+        return values
 
     async def item_from_cache(self, item_id: str):
+        entry = await self.item_entry_from_cache(item_id)
+        return entry.value if entry else None
+
+    async def items_from_cache(self, item_id: str) -> Optional[List[model]]:
+        entry = await self.items_entry_from_cache(item_id)
+        return entry.value if entry else None
+
+    async def item_entry_from_cache(self, item_id: str) -> Optional[CacheEntry]:
         # пытаемся получить данные о фильме из кеша использую команду get
         # https://redis.io/commands/get
-        data = await self.redis.get(item_id)
-        if not data:
+        data = await self.get(self.item_key(item_id))
+        if data == MISSING_ITEM:
+            return missing_entry()
+        decoded = decode_entry(data or b'')
+        if not decoded:
             return None
 
+        payload, soft_expire, delta = decoded
         # pydantic предоставляет удобное API для создания объекта моделей из json
-        item = self.model.parse_raw(data)
-        return item
+        return CacheEntry(self.model.parse_raw(payload), soft_expire, delta)
 
-    async def items_from_cache(self, item_id: str) -> Optional[List[model]]:
-        data = await self.redis.get(item_id)
-        if not data:
+    async def items_entry_from_cache(self, item_id: str) -> Optional[CacheEntry]:
+        decoded = decode_entry(await self.get(item_id) or b'')
+        if not decoded:
             return None
-        else:
-            return [self.model.parse_raw(item) for item in json.loads(data)]
 
-    async def put_item_to_cache(self, item: Optional[T]) -> None:
-        # сохраняем данные о фильме с использованием команды set
-        # выставляем время жизни кеша равное 5 минутам
-        # https://redis.io/commands/set
-        # pydantic позволяет модель сериализовать в json
-        await self.redis.set(item.id, item.json(), expire=FILM_CACHE_EXPIRE_IN_SECONDS)
+        payload, soft_expire, delta = decoded
+        return CacheEntry([self.model.parse_raw(item) for item in json.loads(payload)], soft_expire, delta)
 
-    async def put_items_to_cache(self, items: List[Optional[T]], key=None) -> None:
+    async def put_item_to_cache(self, item: Optional[T], delta: float = 0.0) -> None:
         # сохраняем данные о фильме с использованием команды set
-        # выставляем время жизни кеша равное 5 минутам
+        # ключ живёт дольше мягкого срока годности, чтобы устаревшее значение можно было отдать, пока оно обновляется
         # https://redis.io/commands/set
         # pydantic позволяет модель сериализовать в json
+        await self.redis.set(
+            self.item_key(item.id), encode_entry(item.json(), delta), expire=CACHE_HARD_EXPIRE_IN_SECONDS
+        )
+
+    async def put_items_to_cache(self, items: List[Optional[T]], key=None, delta: float = 0.0) -> None:
         values = [item.json() for item in items]
-        await self.redis.set(key, json.dumps(values), expire=FILM_CACHE_EXPIRE_IN_SECONDS)
+        await self.redis.set(key, encode_entry(json.dumps(values), delta), expire=CACHE_HARD_EXPIRE_IN_SECONDS)
+
+    async def ids_entry_from_cache(self, key: str) -> Optional[CacheEntry]:
+        decoded = decode_entry(await self.get(key) or b'')
+        if not decoded:
+            return None
+
+        payload, soft_expire, delta = decoded
+        return CacheEntry(json.loads(payload), soft_expire, delta)
+
+    async def put_ids_to_cache(self, ids: List[str], key=None, delta: float = 0.0) -> None:
+        # в ключе списка храним только упорядоченные id, сами объекты лежат в ключах отдельных объектов
+        await self.redis.set(key, encode_entry(json.dumps(ids), delta), expire=CACHE_HARD_EXPIRE_IN_SECONDS)
+
+    async def item_entries_from_cache(self, ids: List[str]) -> Dict[str, CacheEntry]:
+        """
+        Достаёт объекты по списку id одной командой mget, отсутствующие в кеше id в результат не попадают
+        https://redis.io/commands/mget
+        """
+        if not ids:
+            return {}
+        entries = {}
+        for item_id, data in zip(ids, await self.mget([self.item_key(item_id) for item_id in ids])):
+            if data == MISSING_ITEM:
+                entries[item_id] = missing_entry()
+                continue
+            decoded = decode_entry(data or b'')
+            if decoded:
+                payload, soft_expire, delta = decoded
+                entries[item_id] = CacheEntry(self.model.parse_raw(payload), soft_expire, delta)
+        return entries
+
+    async def put_many_items_to_cache(self, items: Iterable[T], delta: float = 0.0) -> None:
+        # все set отправляются одним пайплайном, без ожидания ответа на каждый
+        pipeline = self.redis.pipeline()
+        for item in items:
+            pipeline.set(self.item_key(item.id), encode_entry(item.json(), delta), expire=CACHE_HARD_EXPIRE_IN_SECONDS)
+        await pipeline.execute()
+
+    async def delete_items(self, ids: List[str]) -> None:
+        if ids:
+            await self.redis.delete(*(self.item_key(item_id) for item_id in ids))
+
+    async def bytes_from_cache(self, key: str) -> Optional[bytes]:
+        return await self.get(key)
+
+    async def put_bytes_to_cache(self, key: str, data: bytes, expire: int = FILM_CACHE_EXPIRE_IN_SECONDS) -> None:
+        await self.redis.set(key, data, expire=expire)
+
+    async def put_missing_to_cache(self, ids: List[str]) -> None:
+        if not ids:
+            return
+        pipeline = self.redis.pipeline()
+        for item_id in ids:
+            pipeline.set(self.item_key(item_id), MISSING_ITEM, expire=config.NEGATIVE_CACHE_EXPIRE_IN_SECONDS)
+        await pipeline.execute()
+
+    async def get_generation(self, index: str) -> int:
+        return int(await self.redis.get(f'{index}:generation') or 0)
+
+    async def bump_generation(self, index: str) -> int:
+        return await self.redis.incr(f'{index}:generation')
+
+    async def get_watermark(self) -> Optional[bytes]:
+        # время последней загрузки ETL в эластик, у старых версий ETL — время последних загруженных изменений
+        last_loaded, last_update = await self.redis.hmget(config.ETL_STATE_KEY, 'last_loaded', 'last_update')
+        return last_loaded or last_update
+
+    async def acquire_lock(self, key: str, expire_ms: int) -> Optional[str]:
+        """
+        Короткоживущая блокировка, общая для всех воркеров. Возвращает токен владельца или None
+        """
+        token = uuid.uuid4().hex
+        acquired = await self.redis.set(f'lock:{key}', token, pexpire=expire_ms, exist=Redis.SET_IF_NOT_EXIST)
+        return token if acquired else None
+
+    async def release_lock(self, key: str, token: str) -> None:
+        await self.redis.eval(RELEASE_LOCK_SCRIPT, keys=[f'lock:{key}'], args=[token])
+
+    async def is_locked(self, key: str) -> bool:
+        return bool(await self.redis.exists(f'lock:{key}'))
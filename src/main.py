@@ -1,16 +1,31 @@
+import asyncio
 import logging
+import math
+import time
+from http import HTTPStatus
 
 import aioredis
 import uvicorn as uvicorn
-from elasticsearch import AsyncElasticsearch
-from fastapi import FastAPI, Request
+from fastapi import FastAPI, Request, Response
 from fastapi.responses import ORJSONResponse
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
+from starlette.routing import Match
 
 import api
 from core import config
 from core.logger import LOGGING
+from core.metrics import REQUEST_LATENCY, REQUESTS_IN_PROGRESS, RESPONSE_SIZE
 from db import elastic, redis
+from db.elastic import ElasticUnavailable, create_elastic, elastic_pool_stats, set_route_budget
+from db.memory import local_caches_stats
 from models.film import FilterParams
+from services.catalog import refresh_catalogs, register_catalogs
+from services.compression import choose_encoding, compress, should_compress
+from services.hot_keys import flush_hot_keys, hot_keys
+from services.invalidation import SERVICES, listen_invalidations
+from services.response_cache import ResponseCache
+from services.suggest import get_suggest_service, refresh_prefix_indexes
+from services.warmup import CacheWarmer
 
 app = FastAPI(
     title=config.PROJECT_NAME,
@@ -25,11 +40,35 @@ app = FastAPI(
 @app.on_event('startup')
 async def startup():
     redis.redis = await aioredis.create_redis_pool((config.REDIS_HOST, config.REDIS_PORT), minsize=10, maxsize=20)
-    elastic.es = AsyncElasticsearch(hosts=[f'{config.ELASTIC_HOST}:{config.ELASTIC_PORT}'])
+    elastic.es = create_elastic()
+    # сбрасываем кеш по сигналу ETL, поэтому время жизни кеша можно держать большим
+    app.state.invalidation_listener = asyncio.ensure_future(listen_invalidations(redis.redis))
+    # небольшие индексы целиком в памяти, обновляются по таймеру и по сигналу ETL
+    register_catalogs(elastic.es, SERVICES)
+    app.state.catalog_refresher = asyncio.ensure_future(refresh_catalogs())
+    app.state.suggest_refresher = None
+    if config.SUGGEST_LOCAL_ENABLED:
+        suggest_service = get_suggest_service(redis.redis, elastic.es)
+        app.state.suggest_refresher = asyncio.ensure_future(refresh_prefix_indexes(suggest_service))
+    app.state.hot_keys_flusher = asyncio.ensure_future(flush_hot_keys(redis.redis))
+    # прогрев идёт в фоне: воркер принимает запросы сразу, но готовым считается после прогрева
+    app.state.warmer = CacheWarmer(redis.redis, elastic.es)
+    app.state.warming = asyncio.ensure_future(app.state.warmer.run()) if config.WARMUP_ENABLED else None
 
 
 @app.on_event('shutdown')
 async def shutdown():
+    app.state.invalidation_listener.cancel()
+    app.state.catalog_refresher.cancel()
+    if app.state.suggest_refresher:
+        app.state.suggest_refresher.cancel()
+    if app.state.warming:
+        app.state.warming.cancel()
+    app.state.hot_keys_flusher.cancel()
+    try:
+        await hot_keys.flush(redis.redis)
+    except aioredis.RedisError as error:
+        logging.warning('Hot keys were not saved: %r', error)
     await redis.redis.close()
     await elastic.es.close()
 
@@ -37,27 +76,123 @@ async def shutdown():
 app.include_router(api.router, prefix='/api')
 
 
+@app.exception_handler(ElasticUnavailable)
+async def elastic_unavailable(request: Request, error: ElasticUnavailable):
+    # сюда попадают только запросы, для которых в кеше не нашлось даже устаревшего ответа
+    return ORJSONResponse(
+        status_code=HTTPStatus.SERVICE_UNAVAILABLE,
+        content={'detail': 'search is temporarily unavailable'},
+        headers={'Retry-After': str(math.ceil(error.retry_after or config.CIRCUIT_BREAKER_RESET_TIMEOUT_IN_SECONDS))},
+    )
+
+
+@app.get('/metrics', include_in_schema=False)
+async def metrics():
+    # размеры пулов и кешей снимаются в момент опроса, остальные метрики копятся по ходу работы
+    redis.redis_pool_stats()
+    elastic_pool_stats()
+    local_caches_stats()
+    return Response(generate_latest(), headers={'Content-Type': CONTENT_TYPE_LATEST})
+
+
+@app.get('/ready', include_in_schema=False)
+async def ready():
+    # проба готовности для балансировщика: трафик на воркер идёт только после прогрева кеша
+    warmer = app.state.warmer
+    status = HTTPStatus.OK if not config.WARMUP_ENABLED or warmer.ready else HTTPStatus.SERVICE_UNAVAILABLE
+    return ORJSONResponse(status_code=status, content={'coverage': round(warmer.coverage, 3)})
+
+
 @app.middleware("http")
 async def add_process_time_header(request: Request, call_next):
     query = request.query_params.get('query')
     sort = request.query_params.get('sort')
     page = request.query_params.get('page[number]')
     size = request.query_params.get('page[size]')
+    cursor = request.query_params.get('page[cursor]')
     filter_params = FilterParams(
         query=query,
         sort=sort,
         size=size,
         page=page,
+        cursor=cursor,
         from_=0
     )
     filter_params.calculate_offset_from_()
     # filter_params = dict(query=query, sort=sort, size=size, from_=size * (int(page) - 1) if int(page) > 0 else 0)
     request.state.filter_params = filter_params
+    return await call_next(request)
+
+
+@app.middleware("http")
+async def limit_elastic_time(request: Request, call_next):
+    # все запросы в эластик, сделанные при обработке запроса, укладываются в общий бюджет маршрута
+    for prefix, budget in config.ELASTIC_ROUTE_TIMEOUTS.items():
+        if request.url.path.startswith(prefix):
+            set_route_budget(budget)
+            break
+    return await call_next(request)
+
+
+@app.middleware("http")
+async def cache_response(request: Request, call_next):
+    # внутри collect_metrics и compress_response, но снаружи limit_elastic_time и add_process_time_header:
+    # при попадании в кеш запрос не доходит ни до них, ни до роутеров
+    if not config.RESPONSE_CACHE_ENABLED:
+        return await call_next(request)
+    return await ResponseCache(redis.redis).handle(request, call_next)
+
+
+@app.middleware("http")
+async def compress_response(request: Request, call_next):
+    # ответы из кеша ответов приходят уже сжатыми, здесь сжимаются остальные: страницы по курсору и ответы без кеша
+    encoding = choose_encoding(request.headers.get('accept-encoding'))
     response = await call_next(request)
-    # process_time = time.time() - start_time
-    # response.headers["X-Process-Time"] = str(process_time)
+    if encoding is None or response.status_code != HTTPStatus.OK or 'content-encoding' in response.headers:
+        return response
+    if 'content-length' in response.headers and int(response.headers['content-length']) < config.COMPRESSION_MIN_SIZE:
+        return response
+    body = b''.join([chunk async for chunk in response.body_iterator])
+    headers = dict(response.headers)
+    headers.pop('content-length', None)
+    headers['Vary'] = 'Accept-Encoding'
+    if should_compress(body):
+        body = compress(body, encoding)
+        headers['Content-Encoding'] = encoding
+    return Response(body, status_code=response.status_code, headers=headers)
+
+
+def route_template(request: Request) -> str:
+    """
+    Шаблон пути вместо самого пути, чтобы id в адресе не плодили метки метрик
+    """
+    for route in app.routes:
+        match, _ = route.matches(request.scope)
+        if match == Match.FULL:
+            return route.path
+    return 'unmatched'
+
+
+@app.middleware("http")
+async def collect_metrics(request: Request, call_next):
+    # самый внешний middleware: время считается вместе с кешем ответов
+    route = route_template(request)
+    started = time.monotonic()
+    status = 500
+    REQUESTS_IN_PROGRESS.inc()
+    try:
+        response = await call_next(request)
+        status = response.status_code
+    finally:
+        REQUESTS_IN_PROGRESS.dec()
+        process_time = time.monotonic() - started
+        REQUEST_LATENCY.labels(request.method, route, int(status)).observe(process_time)
+    response.headers['X-Process-Time'] = str(process_time)
+    if 'content-length' in response.headers:
+        RESPONSE_SIZE.labels(route).observe(int(response.headers['content-length']))
     return response
 
+
 if __name__ == '__main__':
     uvicorn.run(
         'main:app',
@@ -1,10 +1,13 @@
-from typing import Optional, Union
+from typing import List, Optional, Union
 
 import orjson
 
 # используем pydantic для упрощения работы при перегонке данных из json в объекты
 from pydantic import BaseModel, validator
 
+from core.config import BATCH_MAX_IDS
+
+
 class OrJsonConfig:
 
     class Config:
@@ -23,6 +26,15 @@ class Film(BaseModel, OrJsonConfig):
     description: str = None
 
 
+class FilmShort(BaseModel, OrJsonConfig):
+    """
+    Фильм в списках: только то, что отдают списочные эндпоинты
+    """
+    id: str
+    title: str
+    imdb_rating: float = None
+
+
 class Genre(BaseModel, OrJsonConfig):
     id: str
     name: str
@@ -36,6 +48,28 @@ class Person(BaseModel, OrJsonConfig):
     films_as_writer: Optional[str]
     films_as_director: Optional[str]
 
+
+class PersonShort(BaseModel, OrJsonConfig):
+    id: str
+    full_name: str
+
+
+class Suggestions(BaseModel, OrJsonConfig):
+    films: List[FilmShort]
+    persons: List[PersonShort]
+
+
+class BatchRequest(BaseModel, OrJsonConfig):
+    ids: List[str]
+
+    @validator('ids')
+    def validate_ids(cls, v: List[str]):
+        if len(v) > BATCH_MAX_IDS:
+            raise ValueError(f'no more than {BATCH_MAX_IDS} ids are allowed')
+        # повторяющиеся id запрашиваем один раз, сохраняя порядок
+        return list(dict.fromkeys(v))
+
+
 class ResponseMessage(BaseModel, OrJsonConfig):
     message: str = None
 
@@ -46,6 +80,8 @@ class FilterParams(BaseModel, OrJsonConfig):
     from_: Union[None, str, int]
     page: Union[None, str, int]
     size: Union[None, str, int]
+    # токен следующей страницы для постраничной выдачи через search_after, пустая строка — первая страница
+    cursor: Optional[str]
 
     @validator('page')
     def validate_from_(cls, v: str):
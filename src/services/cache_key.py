@@ -0,0 +1,71 @@
+import hashlib
+import time
+from typing import Dict, Optional, Tuple, Union
+
+import orjson
+
+from core import config
+from db.redis import RedisCacheExecutor
+
+# меняется при изменении формата того, что лежит в кеше по ключам списков
+CACHE_SCHEMA_VERSION = 1
+
+# части запроса, в которых порядок значений не влияет на результат
+UNORDERED_CLAUSES = {'terms', 'ids'}
+
+# поколения индексов, прочитанные из редиса: индекс -> (поколение, время чтения)
+generations: Dict[str, Tuple[int, float]] = {}
+
+
+def normalize_query(value, unordered: bool = False):
+    """
+    Приводит тело запроса к каноническому виду: порядок ключей и значений в terms/ids не важен.
+    Сами значения не меняются — от них зависит результат поиска
+    """
+    if isinstance(value, dict):
+        return {
+            key: normalize_query(item, unordered or key in UNORDERED_CLAUSES)
+            for key, item in sorted(value.items())
+        }
+    if isinstance(value, list):
+        items = [normalize_query(item, unordered) for item in value]
+        return sorted(items, key=orjson.dumps) if unordered else items
+    return value
+
+
+def canonical_query(body: Union[None, str, bytes, dict], params: Optional[dict]) -> bytes:
+    if isinstance(body, (str, bytes)):
+        body = orjson.loads(body)
+    # пустые параметры равнозначны отсутствующим, а числа могут прийти строками
+    params = {key: str(value) for key, value in (params or {}).items() if value not in (None, '', 0)}
+    return orjson.dumps({'body': normalize_query(body), 'params': params}, option=orjson.OPT_SORT_KEYS)
+
+
+def list_cache_key(index: str, generation: int, body, params: Optional[dict]) -> str:
+    """
+    Короткий ключ для результатов поиска: индекс, версия схемы и режим хранения, поколение индекса и хеш запроса
+    """
+    digest = hashlib.blake2b(canonical_query(body, params), digest_size=16).hexdigest()
+    return f'{index}:v{CACHE_SCHEMA_VERSION}{config.LIST_CACHE_MODE}:g{generation}:{digest}'
+
+
+async def get_generation(redis_executor: RedisCacheExecutor, index: str) -> int:
+    """
+    Текущее поколение индекса. Чтобы не ходить в редис на каждый запрос, значение
+    запоминается в процессе на CACHE_GENERATION_REFRESH_IN_SECONDS
+    """
+    cached = generations.get(index)
+    if cached and time.monotonic() - cached[1] < config.CACHE_GENERATION_REFRESH_IN_SECONDS:
+        return cached[0]
+    generation = await redis_executor.get_generation(index)
+    generations[index] = (generation, time.monotonic())
+    return generation
+
+
+async def bump_generation(redis_executor: RedisCacheExecutor, index: str) -> int:
+    """
+    Инвалидирует все закешированные списки индекса разом: старые ключи перестают читаться и истекают сами
+    """
+    generation = await redis_executor.bump_generation(index)
+    generations[index] = (generation, time.monotonic())
+    return generation
@@ -0,0 +1,147 @@
+import asyncio
+import logging
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from elasticsearch import exceptions
+from pydantic import BaseModel
+
+from core import config
+from db.elastic import ElasticExecutor, ElasticUnavailable
+from services.pagination import sort_for_search_after
+
+
+class ResidentCatalog:
+    """
+    Небольшой индекс, целиком загруженный в память процесса: объекты, списки, сортировка
+    и постраничная выдача отдаются без редиса и эластика
+    """
+
+    def __init__(self, elastic_executor: ElasticExecutor):
+        self.elastic_executor = elastic_executor
+        self.items: List[BaseModel] = []
+        self.by_id: Dict[str, BaseModel] = {}
+        self.by_name: Dict[str, BaseModel] = {}
+        self.loaded = False
+        self._refreshing: Optional[asyncio.Future] = None
+
+    async def refresh(self) -> None:
+        size = config.RESIDENT_CATALOG_MAX_SIZE
+        # без сортировки, чтобы порядок списка совпадал с тем, что отдал бы эластик
+        items = await self.elastic_executor.get_detected_from_elastic({'size': size}, None)
+        if not items:
+            # индекс ещё не наполнен: пока его нет, запросы идут обычным путём
+            return
+        if len(items) >= size:
+            # индекс перерос каталог: неполный список в памяти хуже запроса в эластик
+            logging.warning('Index %s does not fit into resident catalog of %s items', self.elastic_executor.index, size)
+            self.loaded = False
+            return
+        self.items = items
+        self.by_id = {item.id: item for item in items}
+        self.by_name = {item.name.lower(): item for item in items if getattr(item, 'name', None)}
+        self.loaded = True
+
+    def refresh_soon(self) -> None:
+        """
+        Перезагружает каталог в фоне; повторные сигналы во время загрузки её не множат
+        """
+        if self._refreshing is None or self._refreshing.done():
+            self._refreshing = asyncio.ensure_future(self.refresh())
+            self._refreshing.add_done_callback(self._log_failure)
+
+    def _log_failure(self, refreshing: asyncio.Future) -> None:
+        if not refreshing.cancelled() and refreshing.exception():
+            logging.warning('Resident catalog %s was not refreshed: %r', self.elastic_executor.index,
+                            refreshing.exception())
+
+    def get(self, item_id: str) -> Optional[BaseModel]:
+        return self.by_id.get(item_id)
+
+    def resolve(self, value: str) -> Optional[BaseModel]:
+        """
+        Объект по id или по названию без учёта регистра
+        """
+        return self.by_id.get(value) or self.by_name.get(value.lower())
+
+    def get_many(self, ids: List[str]) -> List[BaseModel]:
+        return [self.by_id[item_id] for item_id in ids if item_id in self.by_id]
+
+    def page(self, params: dict) -> List[BaseModel]:
+        """
+        Страница по параметрам, подготовленным Service.prepare_params_for_search
+        """
+        items = self.sorted(params.get('sort'))
+        # смещение приходит под именем from_, как его принимает клиент эластика
+        start = int(params.get('from_') or params.get('from') or 0)
+        return items[start:start + int(params.get('size') or 10)]
+
+    def page_after(self, params: dict, search_after: Optional[list]) -> Tuple[List[BaseModel], Optional[list]]:
+        """
+        Страница для постраничной выдачи через search_after с теми же значениями сортировки, что у эластика
+        """
+        sort = sort_for_search_after(params.get('sort'))
+        items = self.sorted(params.get('sort'))
+        if search_after is not None:
+            items = [item for item in items if self.follows(self.sort_values(item, sort), search_after, sort)]
+        page = items[:int(params.get('size') or 10)]
+        return page, self.sort_values(page[-1], sort) if page else None
+
+    def sorted(self, sort: Optional[str]) -> List[BaseModel]:
+        if not sort:
+            return self.items
+        field, _, order = sort.partition(':')
+        # как в эластике, объекты без значения поля идут в конце при любом порядке
+        present = [item for item in self.items if getattr(item, field, None) is not None]
+        missing = [item for item in self.items if getattr(item, field, None) is None]
+        # при равных значениях порядок по id всегда прямой, как в сортировке для search_after
+        present.sort(key=lambda item: item.id)
+        present.sort(key=lambda item: getattr(item, field), reverse=order == 'desc')
+        return present + missing
+
+    @staticmethod
+    def sort_values(item: BaseModel, sort: List[dict]) -> list:
+        # у match_all все документы с одинаковой релевантностью
+        return [1.0 if field == '_score' else getattr(item, field, None) for field in (next(iter(key)) for key in sort)]
+
+    @staticmethod
+    def follows(values: list, search_after: list, sort: List[dict]) -> bool:
+        for value, after, key in zip(values, search_after, sort):
+            if value == after:
+                continue
+            if value is None or after is None:
+                return after is not None
+            order = next(iter(key.values()))
+            return value > after if order == 'asc' else value < after
+        return False
+
+
+# каталоги процесса по индексам
+catalogs: Dict[str, ResidentCatalog] = {}
+
+
+def get_catalog(index: str) -> Optional[ResidentCatalog]:
+    """
+    Каталог индекса, если он включён и уже загружен
+    """
+    catalog = catalogs.get(index)
+    return catalog if catalog is not None and catalog.loaded else None
+
+
+def register_catalogs(elastic, services: Iterable) -> None:
+    """
+    Заводит каталоги для индексов сервисов, перечисленных в RESIDENT_CATALOG_INDEXES
+    """
+    for service in services:
+        if service.index in config.RESIDENT_CATALOG_INDEXES:
+            catalogs[service.index] = ResidentCatalog(ElasticExecutor(elastic, service.index, service.model))
+
+
+async def refresh_catalogs() -> None:
+    while True:
+        for index, catalog in catalogs.items():
+            try:
+                await catalog.refresh()
+            except (ElasticUnavailable, exceptions.TransportError) as error:
+                # остаётся прежнее содержимое каталога, а до первой загрузки запросы идут обычным путём
+                logging.warning('Resident catalog %s was not refreshed: %r', index, error)
+        await asyncio.sleep(config.RESIDENT_CATALOG_REFRESH_IN_SECONDS)
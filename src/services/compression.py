@@ -0,0 +1,56 @@
+import gzip
+from typing import Callable, Dict, Optional
+
+import brotli
+import zstandard
+
+from core import config
+
+# кодировщики по названиям из Accept-Encoding
+ENCODERS: Dict[str, Callable[[bytes], bytes]] = {
+    'zstd': lambda body: zstandard.ZstdCompressor(level=config.COMPRESSION_ZSTD_LEVEL).compress(body),
+    'br': lambda body: brotli.compress(body, quality=config.COMPRESSION_BROTLI_QUALITY),
+    'gzip': lambda body: gzip.compress(body, compresslevel=config.COMPRESSION_GZIP_LEVEL),
+}
+
+
+def parse_accept_encoding(header: str) -> Dict[str, float]:
+    weights = {}
+    for item in header.split(','):
+        name, _, params = item.strip().partition(';')
+        if not name:
+            continue
+        weight = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                weight = float(params[2:])
+            except ValueError:
+                weight = 0.0
+        weights[name.strip().lower()] = weight
+    return weights
+
+
+def choose_encoding(header: Optional[str]) -> Optional[str]:
+    """
+    Кодировка ответа по Accept-Encoding клиента. При равном весе выбирается первая
+    из COMPRESSION_ENCODINGS, None — отдавать как есть
+    """
+    if not config.COMPRESSION_ENABLED or not header:
+        return None
+    weights = parse_accept_encoding(header)
+    best, best_weight = None, 0.0
+    for encoding in config.COMPRESSION_ENCODINGS:
+        weight = weights.get(encoding, weights.get('*', 0.0))
+        if encoding in ENCODERS and weight > best_weight:
+            best, best_weight = encoding, weight
+    return best
+
+
+def should_compress(body: bytes) -> bool:
+    # на маленьких ответах сжатие почти ничего не экономит, а время тратит
+    return len(body) >= config.COMPRESSION_MIN_SIZE
+
+
+def compress(body: bytes, encoding: str) -> bytes:
+    return ENCODERS[encoding](body)
@@ -6,13 +6,14 @@ from fastapi import Depends
 
 from db.elastic import get_elastic
 from db.redis import get_redis
-from models.film import Film
+from models.film import Film, FilmShort
 from services.service import Service
 
 
 class FilmService(Service):
     model = Film
     index = 'movies'
+    projections = (FilmShort,)
 
 
 @lru_cache()
@@ -0,0 +1,83 @@
+import asyncio
+import logging
+import random
+import time
+from collections import Counter
+from typing import Dict, List, Tuple
+
+from aioredis import Redis, RedisError
+
+from core import config
+
+SECONDS_IN_DAY = 60 * 60 * 24
+
+
+def hot_keys_key(namespace: str, kind: str, day: int) -> str:
+    return f'hot_keys:{namespace}:{kind}:{day}'
+
+
+def current_day() -> int:
+    return int(time.time() // SECONDS_IN_DAY)
+
+
+class HotKeys:
+    """
+    Выборка самых запрашиваемых ключей для прогрева кеша. Обращения отбираются с вероятностью
+    HOT_KEYS_SAMPLE_RATE и копятся в памяти процесса, а в редис сбрасываются периодически,
+    в отсортированные множества по суткам: так популярность со временем обновляется
+    """
+
+    def __init__(self):
+        self.counts: Counter = Counter()
+
+    def record(self, namespace: str, kind: str, member: str) -> None:
+        if not config.HOT_KEYS_ENABLED or random.random() >= config.HOT_KEYS_SAMPLE_RATE:
+            return
+        key = (namespace, kind, member)
+        # новые ключи сверх размера буфера до следующего сброса не учитываются
+        if key in self.counts or len(self.counts) < config.HOT_KEYS_BUFFER_SIZE:
+            self.counts[key] += 1
+
+    async def flush(self, redis: Redis) -> None:
+        counts, self.counts = self.counts, Counter()
+        if not counts:
+            return
+        day = current_day()
+        pipeline = redis.pipeline()
+        touched = set()
+        for (namespace, kind, member), count in counts.items():
+            key = hot_keys_key(namespace, kind, day)
+            pipeline.zincrby(key, count, member)
+            touched.add(key)
+        for key in touched:
+            # в множестве остаются только самые частые ключи
+            pipeline.zremrangebyrank(key, 0, -config.HOT_KEYS_MAX_SIZE - 1)
+            pipeline.expire(key, SECONDS_IN_DAY * (config.HOT_KEYS_DAYS + 1))
+        await pipeline.execute()
+
+
+# выборка процесса, общая для всех экземпляров сервисов
+hot_keys = HotKeys()
+
+
+async def top_keys(redis: Redis, namespace: str, kind: str, size: int) -> List[str]:
+    """
+    Самые частые ключи за последние HOT_KEYS_DAYS суток
+    """
+    day = current_day()
+    scores: Dict[str, float] = Counter()
+    for key in (hot_keys_key(namespace, kind, day - offset) for offset in range(config.HOT_KEYS_DAYS)):
+        members: List[Tuple[bytes, float]] = await redis.zrevrange(key, 0, size - 1, withscores=True)
+        for member, score in members:
+            scores[member.decode()] += score
+    return [member for member, _ in sorted(scores.items(), key=lambda item: -item[1])[:size]]
+
+
+async def flush_hot_keys(redis: Redis) -> None:
+    while True:
+        await asyncio.sleep(config.HOT_KEYS_FLUSH_IN_SECONDS)
+        try:
+            await hot_keys.flush(redis)
+        except RedisError as error:
+            # выборка за этот период теряется, на работу API это не влияет
+            logging.warning('Hot keys were not saved: %r', error)
@@ -0,0 +1,70 @@
+import logging
+from typing import Dict, List
+
+import aioredis
+import backoff
+import orjson
+from aioredis import Redis
+
+from core import config
+from db.memory import local_caches
+from db.redis import RedisCacheExecutor
+from services.cache_key import bump_generation
+from services import response_cache
+from services.catalog import catalogs
+from services.film import FilmService
+from services.genre import GenreService
+from services.person import PersonService
+
+SERVICES = (FilmService, PersonService, GenreService)
+
+
+def cache_namespaces(index: str) -> List[str]:
+    """
+    Все пространства ключей индекса: полные объекты и их проекции
+    """
+    for service in SERVICES:
+        if service.index == index:
+            return service.cache_namespaces()
+    return [index]
+
+
+async def invalidate(redis: Redis, loaded: Dict[str, List[str]]) -> None:
+    """
+    Сбрасывает кеш документов, которые ETL только что загрузил в эластик:
+    ключи отдельных объектов удаляются из редиса и памяти процесса, а списки и готовые ответы
+    по индексу перестают читаться за счёт смены поколения индекса
+    """
+    for index, ids in loaded.items():
+        for namespace in cache_namespaces(index):
+            await RedisCacheExecutor(redis, None, namespace=namespace).delete_items(ids)
+            local_cache = local_caches.get(namespace)
+            if local_cache is not None:
+                for item_id in ids:
+                    local_cache.delete(item_id)
+        await bump_generation(RedisCacheExecutor(redis, None), index)
+        if index in catalogs:
+            catalogs[index].refresh_soon()
+    # новые ответы должны получить Last-Modified этой загрузки, а не запомненный до неё
+    response_cache.watermark = None
+    logging.info('Cache of %s documents was invalidated', sum(len(ids) for ids in loaded.values()))
+
+
+@backoff.on_exception(backoff.expo, (aioredis.RedisError, OSError), max_value=30)
+async def listen_invalidations(redis: Redis) -> None:
+    """
+    Слушает канал, в который ETL публикует загруженные документы. Подписка держит
+    отдельное соединение, поэтому для неё не используется общий пул
+    """
+    connection = await aioredis.create_redis((config.REDIS_HOST, config.REDIS_PORT))
+    try:
+        channel, = await connection.subscribe(config.CACHE_INVALIDATION_CHANNEL)
+        async for message in channel.iter():
+            try:
+                await invalidate(redis, orjson.loads(message))
+            except (aioredis.RedisError, ValueError) as e:
+                logging.error('Cache invalidation failed: %r', e)
+    finally:
+        connection.close()
+    # канал закрывается только при обрыве соединения, переподключаемся
+    raise aioredis.ConnectionClosedError('Invalidation channel was closed')
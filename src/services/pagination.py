@@ -0,0 +1,44 @@
+import base64
+import binascii
+from typing import List, Optional, Tuple
+
+import orjson
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(search_after: List, pit_id: Optional[str] = None) -> str:
+    """
+    Непрозрачный токен следующей страницы: значения сортировки последнего документа и id point in time
+    """
+    payload = orjson.dumps({'after': search_after, 'pit': pit_id})
+    return base64.urlsafe_b64encode(payload).decode().rstrip('=')
+
+
+def decode_cursor(cursor: str) -> Tuple[Optional[List], Optional[str]]:
+    """
+    Пустой токен означает первую страницу
+    """
+    if not cursor:
+        return None, None
+    try:
+        payload = orjson.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+        search_after, pit_id = payload['after'], payload['pit']
+    except (binascii.Error, ValueError, KeyError, TypeError):
+        raise InvalidCursor(cursor)
+    if not isinstance(search_after, list):
+        raise InvalidCursor(cursor)
+    return search_after, pit_id
+
+
+def sort_for_search_after(sort: Optional[str]) -> List[dict]:
+    """
+    Переводит параметр sort вида "field:order" в сортировку тела запроса. Для search_after порядок
+    должен быть однозначным, поэтому последним ключом всегда идёт id
+    """
+    if sort:
+        field, _, order = sort.partition(':')
+        return [{field: order or 'asc'}, {'id': 'asc'}]
+    return [{'_score': 'desc'}, {'id': 'asc'}]
@@ -0,0 +1,211 @@
+import hashlib
+import time
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from http import HTTPStatus
+from typing import Callable, Mapping, NamedTuple, Optional, Tuple
+
+import orjson
+from fastapi import Request, Response
+from starlette.datastructures import QueryParams
+
+from core import config
+from db.memory import get_local_cache
+from db.redis import RedisCacheExecutor
+from services.cache_key import CACHE_SCHEMA_VERSION, get_generation
+from services.compression import choose_encoding, compress, should_compress
+
+# префиксы кешируемых маршрутов и индексы, от которых зависит их ответ
+ROUTE_INDEXES: Tuple[Tuple[str, Tuple[str, ...]], ...] = (
+    ('/api/v1/film', ('movies',)),
+    # фильмы персоны берутся из индекса фильмов
+    ('/api/v1/person', ('person', 'movies')),
+    ('/api/v1/genre', ('genre',)),
+    ('/api/v1/suggest', ('movies', 'person')),
+)
+
+
+RESPONSE_FORMAT = b'r1'
+
+# отметка последней загрузки ETL, прочитанная из редиса: (Last-Modified, время чтения)
+watermark: Optional[Tuple[str, float]] = None
+
+
+class CachedResponse(NamedTuple):
+    etag: str
+    last_modified: str
+    body: bytes
+
+
+def route_indexes(path: str) -> Optional[Tuple[str, ...]]:
+    for prefix, indexes in ROUTE_INDEXES:
+        if path.startswith(prefix):
+            return indexes
+    return None
+
+
+def route_cache_control(path: str) -> Optional[str]:
+    for prefix, cache_control in config.CACHE_CONTROL.items():
+        if path.startswith(prefix):
+            return cache_control
+    return None
+
+
+def make_etag(body: bytes) -> str:
+    return '"{}"'.format(hashlib.blake2b(body, digest_size=16).hexdigest())
+
+
+def base_etag(etag: str) -> str:
+    # в шестнадцатеричном хеше нет дефиса, поэтому после него может быть только кодировка
+    return etag.split('-', 1)[0] + '"' if '-' in etag else etag
+
+
+def variant_etag(etag: str, encoding: Optional[str]) -> str:
+    """
+    У сжатого варианта свой ETag: байты ответа другие, а кеши по пути к клиенту сравнивают их строго
+    """
+    etag = base_etag(etag)
+    return f'{etag[:-1]}-{encoding}"' if encoding else etag
+
+
+def http_date(value: bytes) -> str:
+    updated_at = datetime.fromisoformat(value.decode())
+    if updated_at.tzinfo is None:
+        updated_at = updated_at.replace(tzinfo=timezone.utc)
+    return format_datetime(updated_at.astimezone(timezone.utc), usegmt=True)
+
+
+async def get_last_modified(redis_executor: RedisCacheExecutor) -> str:
+    """
+    Last-Modified ответов: время последних изменений, загруженных ETL. Как и поколение индекса,
+    запоминается в процессе на CACHE_GENERATION_REFRESH_IN_SECONDS
+    """
+    global watermark
+    if watermark and time.monotonic() - watermark[1] < config.CACHE_GENERATION_REFRESH_IN_SECONDS:
+        return watermark[0]
+    value = await redis_executor.get_watermark()
+    # до первой загрузки ETL заголовка нет, остаётся только ETag
+    watermark = (http_date(value) if value else '', time.monotonic())
+    return watermark[0]
+
+
+def encode_response(cached: CachedResponse) -> bytes:
+    return b'|'.join((RESPONSE_FORMAT, cached.etag.encode(), cached.last_modified.encode(), cached.body))
+
+
+def decode_response(data: bytes) -> Optional[CachedResponse]:
+    parts = data.split(b'|', 3)
+    if len(parts) != 4 or parts[0] != RESPONSE_FORMAT:
+        # ответ в старом формате считаем промахом, он будет перезаписан
+        return None
+    _, etag, last_modified, body = parts
+    return CachedResponse(etag.decode(), last_modified.decode(), body)
+
+
+def parse_http_date(value: str) -> Optional[datetime]:
+    try:
+        parsed = parsedate_to_datetime(value)
+    except (TypeError, ValueError, IndexError):
+        return None
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+
+
+def not_modified(headers: Mapping[str, str], cached: CachedResponse) -> bool:
+    """
+    Есть ли у клиента актуальная копия ответа. If-Modified-Since учитывается,
+    только если нет If-None-Match (RFC 7232, раздел 6)
+    """
+    if_none_match = headers.get('if-none-match')
+    if if_none_match is not None:
+        # для GET достаточно слабого сравнения: префикс W/ не важен
+        tags = {tag.strip()[2:] if tag.strip().startswith('W/') else tag.strip() for tag in if_none_match.split(',')}
+        # копия в любой кодировке равнозначна: содержимое то же
+        return '*' in tags or base_etag(cached.etag) in {base_etag(tag) for tag in tags}
+    if_modified_since = headers.get('if-modified-since')
+    if if_modified_since is None or not cached.last_modified:
+        return False
+    since = parse_http_date(if_modified_since)
+    return since is not None and parse_http_date(cached.last_modified) <= since
+
+
+class ResponseCache:
+    """
+    Кеш готовых тел ответов. При попадании ответ отдаётся как есть,
+    без построения pydantic-моделей, фильтрации полей и повторной сериализации.
+    ETag хранится рядом с телом, поэтому ответ 304 не требует даже хеширования.
+    Сжатые варианты ответа лежат в собственных ключах и сжимаются один раз
+    """
+
+    def __init__(self, redis):
+        self.redis_executor = RedisCacheExecutor(redis, None, namespace='responses')
+        self.local = get_local_cache('responses')
+
+    async def key_for(self, path: str, query_params: QueryParams) -> Optional[str]:
+        indexes = route_indexes(path)
+        if indexes is None:
+            return None
+        # ответ устаревает вместе с поколением любого индекса, из которого он собран
+        generations = [str(await get_generation(self.redis_executor, index)) for index in indexes]
+        canonical = orjson.dumps([path.rstrip('/'), sorted(query_params.multi_items())])
+        digest = hashlib.blake2b(canonical, digest_size=16).hexdigest()
+        return f'response:v{CACHE_SCHEMA_VERSION}:{".".join(generations)}:{digest}'
+
+    async def get(self, key: str, encoding: Optional[str]) -> Tuple[Optional[CachedResponse], bool]:
+        """
+        Сжатый в encoding вариант ответа, а если его нет — исходный ответ; второе значение — сжат ли он.
+        Оба ключа запрашиваются из редиса одной командой
+        """
+        keys = [f'{key}:{encoding}', key] if encoding else [key]
+        for item_key in keys:
+            cached = self.local.get(item_key)
+            if cached is not None:
+                return cached, item_key != key
+        for item_key, data in zip(keys, await self.redis_executor.mget(keys)):
+            cached = decode_response(data or b'')
+            if cached is not None:
+                self.local.set(item_key, cached)
+                return cached, item_key != key
+        return None, False
+
+    async def put(self, key: str, cached: CachedResponse) -> None:
+        await self.redis_executor.put_bytes_to_cache(
+            key, encode_response(cached), expire=config.RESPONSE_CACHE_EXPIRE_IN_SECONDS
+        )
+        self.local.set(key, cached)
+
+    async def handle(self, request: Request, call_next: Callable) -> Response:
+        # у страниц через search_after в заголовке передаётся токен следующей страницы, а point in time у каждого свой
+        if request.method != 'GET' or 'page[cursor]' in request.query_params:
+            return await call_next(request)
+        key = await self.key_for(request.url.path, request.query_params)
+        if key is None:
+            return await call_next(request)
+
+        accepted = choose_encoding(request.headers.get('accept-encoding'))
+        cached, compressed = await self.get(key, accepted)
+        if cached is None:
+            response = await call_next(request)
+            if response.status_code != HTTPStatus.OK:
+                return response
+            body = b''.join([chunk async for chunk in response.body_iterator])
+            cached = CachedResponse(make_etag(body), await get_last_modified(self.redis_executor), body)
+            await self.put(key, cached)
+        encoding = accepted if compressed or (accepted and should_compress(cached.body)) else None
+
+        headers = {'ETag': variant_etag(cached.etag, encoding)}
+        if cached.last_modified:
+            headers['Last-Modified'] = cached.last_modified
+        cache_control = route_cache_control(request.url.path)
+        if cache_control:
+            headers['Cache-Control'] = cache_control
+        if config.COMPRESSION_ENABLED:
+            headers['Vary'] = 'Accept-Encoding'
+        # проверка до сжатия: клиенту с актуальной копией ничего сжимать не нужно
+        if not_modified(request.headers, cached):
+            return Response(status_code=HTTPStatus.NOT_MODIFIED, headers=headers)
+        if encoding:
+            if not compressed:
+                cached = CachedResponse(headers['ETag'], cached.last_modified, compress(cached.body, encoding))
+                await self.put(f'{key}:{encoding}', cached)
+            headers['Content-Encoding'] = encoding
+        return Response(cached.body, media_type='application/json', headers=headers)
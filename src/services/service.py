@@ -1,11 +1,24 @@
-from typing import Optional, TypeVar
+import asyncio
+import time
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple, Type, TypeVar
 
-from aioredis import Redis
+import orjson
+
+from aioredis import Redis, RedisError
 from elasticsearch import AsyncElasticsearch, exceptions
 from pydantic import BaseModel
 
-from db.elastic import ElasticExecutor
+from core import config
+from db.base import AbstractCacheExecutor, CacheEntry
+from core.metrics import STALE_FALLBACKS
+from db.elastic import ElasticExecutor, ElasticUnavailable, breaker, without_route_budget
+from db.memory import LocalCacheExecutor, TieredCacheExecutor, get_local_cache
 from db.redis import RedisCacheExecutor
+from services.cache_key import canonical_query, get_generation, list_cache_key
+from services.catalog import ResidentCatalog, get_catalog
+from services.hot_keys import hot_keys
+from services.pagination import decode_cursor, encode_cursor, sort_for_search_after
+from services.single_flight import SingleFlight
 
 FILM_CACHE_EXPIRE_IN_SECONDS = 60 * 5  # 5 минут
 T = TypeVar('T', bound=BaseModel)
@@ -14,29 +27,114 @@ T = TypeVar('T', bound=BaseModel)
 class Service:
     model = BaseModel
     index = None
+    # урезанные модели для списков: из эластика забираются и кешируются только их поля
+    projections: Tuple[Type[BaseModel], ...] = ()
 
     def __init__(self, redis: Redis, elastic: AsyncElasticsearch):
         self.elastic = elastic
-        self.redis_executor = RedisCacheExecutor(redis, self.model)
-        self.elastic_executor = ElasticExecutor(self.elastic, self.index, self.model)
+        self.redis = redis
+        self._executors: Dict[Type[BaseModel], Tuple[RedisCacheExecutor, AbstractCacheExecutor, ElasticExecutor]] = {}
+        self.redis_executor, self.cache_executor, self.elastic_executor = self.executors(self.model)
+        self.single_flight = SingleFlight()
+
+    @classmethod
+    def namespace(cls, model: Type[BaseModel] = None) -> str:
+        """
+        Пространство ключей кеша для модели: у проекций оно своё, чтобы не путать их с полными объектами
+        """
+        if model is None or model is cls.model:
+            return cls.index
+        return f'{cls.index}:{model.__name__}'
+
+    @classmethod
+    def cache_namespaces(cls) -> List[str]:
+        return [cls.namespace()] + [cls.namespace(projection) for projection in cls.projections]
+
+    def executors(self, model: Type[BaseModel]) -> Tuple[RedisCacheExecutor, AbstractCacheExecutor, ElasticExecutor]:
+        if model not in self._executors:
+            namespace = self.namespace(model)
+            redis_executor = RedisCacheExecutor(self.redis, model, namespace=namespace)
+            cache_executor = redis_executor
+            if config.LOCAL_CACHE_ENABLED:
+                # горячие ключи отдаются из памяти процесса, редис остаётся общим кешем для всех воркеров
+                local_executor = LocalCacheExecutor(get_local_cache(namespace), model)
+                cache_executor = TieredCacheExecutor(local_executor, redis_executor)
+            source = None if model is self.model else list(model.__fields__)
+            elastic_executor = ElasticExecutor(self.elastic, self.index, model, source=source)
+            self._executors[model] = (redis_executor, cache_executor, elastic_executor)
+        return self._executors[model]
 
     async def get_by_id(self, item_id: str) -> Optional[T]:
         """
         Возвращает объект из кэша или эластика по id
         """
+        catalog = self.catalog()
+        if catalog:
+            return catalog.get(item_id)
+        hot_keys.record(self.index, 'ids', item_id)
+
+        def load():
+            # одновременные промахи по одному id делят один запрос в эластик
+            return self.coalesced_load(
+                item_id,
+                load=lambda: self.load_by_id(item_id),
+                from_cache=lambda: self.cache_executor.item_entry_from_cache(item_id),
+            )
+
         # пытаемся получить данные из кеша ибо получение данных из кеша работает быстрее;
-        item = await self.redis_executor.item_from_cache(item_id)
-        if not item:
-            # если  нет в кеше то ищем его в эластике
-            item = await self.elastic_executor.get_from_elastic_by_id(item_id)
-            if not item:
-                # если он отсутствует в эластике, значит отсутствует
+        entry = await self.cache_executor.item_entry_from_cache(item_id)
+        if entry:
+            if entry.value is None:
                 return None
-            # сохраняем фильм  в кеш
-            await self.redis_executor.put_item_to_cache(item)
+            if entry.should_refresh(config.CACHE_XFETCH_BETA) and self.can_refresh():
+                # отдаём то, что есть, а обновляем в фоне
+                self.single_flight.start(item_id, without_route_budget(load))
+            return entry.value
+        # если нет в кеше, то ищем в эластике
+        try:
+            return await self.single_flight.do(item_id, load)
+        except ElasticUnavailable as error:
+            return await self.stale_value(item_id, error)
 
+    async def load_by_id(self, item_id: str) -> Optional[T]:
+        started = time.monotonic()
+        item = await self.elastic_executor.get_from_elastic_by_id(item_id)
+        if not item:
+            # если он отсутствует в эластике, значит отсутствует: запоминаем это ненадолго,
+            # чтобы повторные запросы несуществующего id не доходили до эластика
+            await self.cache_executor.put_missing_to_cache([item_id])
+            return None
+        # сохраняем фильм  в кеш
+        await self.cache_executor.put_item_to_cache(item, delta=time.monotonic() - started)
         return item
 
+    async def coalesced_load(self, key: str, load: Callable[[], Awaitable], from_cache: Callable[[], Awaitable]):
+        """
+        Загружает значение, не допуская одновременной загрузки одного ключа разными воркерами
+        """
+        if not config.CACHE_LOCK_ENABLED:
+            return await load()
+
+        lock_key = f'{self.index}:{key}'
+        token = await self.redis_executor.acquire_lock(lock_key, config.CACHE_LOCK_EXPIRE_MS)
+        if token is None:
+            # значение уже загружает другой воркер, ждём его появления в кеше
+            loop = asyncio.get_event_loop()
+            deadline = loop.time() + config.CACHE_LOCK_WAIT_IN_SECONDS
+            while loop.time() < deadline:
+                await asyncio.sleep(config.CACHE_LOCK_POLL_INTERVAL)
+                entry = await from_cache()
+                if entry is not None:
+                    return entry.value
+                if not await self.redis_executor.is_locked(lock_key):
+                    break
+            return await load()
+
+        try:
+            return await load()
+        finally:
+            await self.redis_executor.release_lock(lock_key, token)
+
     @staticmethod
     def prepare_params_for_search(params: dict) -> dict:
         """
@@ -56,14 +154,194 @@ class Service:
                     es_params[key] = value
         return es_params
 
-    async def get_all_from_elastic(self, body=None, params=None) -> list:
+    async def get_all_from_elastic(self, body=None, params=None, model: Type[BaseModel] = None) -> list:
+        model = model or self.model
         params = self.prepare_params_for_search(params)
-        key_for_redis = "_".join((self.index, ";".join((f"{key}={value}" for key, value in params.items())), str(body)))
-        items = await self.redis_executor.items_from_cache(key_for_redis)
-        if not items:
-            models = await self.elastic_executor.get_detected_from_elastic(body, params)
-            await self.redis_executor.put_items_to_cache(models, key=key_for_redis)
-            return models
-        return items
+        catalog = self.catalog(body, model)
+        if catalog:
+            return catalog.page(params)
+        # запрос запоминается в каноническом виде: по нему при прогреве получится тот же ключ кеша
+        hot_keys.record(self.namespace(model), 'lists', canonical_query(body, params).decode())
+        generation = await get_generation(self.redis_executor, self.index)
+        key_for_redis = list_cache_key(self.namespace(model), generation, body, params)
+
+        def load():
+            return self.coalesced_load(
+                key_for_redis,
+                load=lambda: self.load_from_elastic(key_for_redis, body, params, model),
+                from_cache=lambda: self.list_entry_from_cache(key_for_redis, model),
+            )
+
+        entry = await self.list_entry_from_cache(key_for_redis, model)
+        if entry:
+            if entry.should_refresh(config.CACHE_XFETCH_BETA) and self.can_refresh():
+                self.single_flight.start(key_for_redis, without_route_budget(load))
+            return entry.value
+        try:
+            return await self.single_flight.do(key_for_redis, load)
+        except ElasticUnavailable as error:
+            value = await self.stale_value(key_for_redis, error, model, is_list=True)
+            if config.LIST_CACHE_MODE == 'ids':
+                return await self.get_by_ids(value, model)
+            return value
+
+    async def get_page_after(
+            self, body=None, params=None, cursor: str = '', model: Type[BaseModel] = None
+    ) -> Tuple[List[T], Optional[str]]:
+        """
+        Постраничная выдача через search_after: стоимость страницы не зависит от её номера.
+        Возвращает объекты и токен следующей страницы, если она может быть
+        """
+        search_after, pit_id = decode_cursor(cursor)
+        params = self.prepare_params_for_search(params)
+        size = int(params.get('size') or 10)
+        catalog = self.catalog(body, model)
+        if catalog:
+            models, last_sort = catalog.page_after(params, search_after)
+            return models, encode_cursor(last_sort, None) if len(models) == size else None
+        body = orjson.loads(body) if body else {}
+        body.update(size=size, sort=sort_for_search_after(params.get('sort')))
+        _, _, elastic_executor = self.executors(model or self.model)
+
+        if config.CURSOR_PIT_ENABLED and not pit_id:
+            pit_id = await elastic_executor.open_point_in_time(config.CURSOR_PIT_KEEP_ALIVE)
+        models, last_sort, pit_id = await elastic_executor.search_after_from_elastic(
+            body, search_after, pit_id, keep_alive=config.CURSOR_PIT_KEEP_ALIVE
+        )
+        if len(models) < size or last_sort is None:
+            return models, None
+        return models, encode_cursor(last_sort, pit_id)
+
+    async def load_from_elastic(self, key: str, body, params: dict, model: Type[BaseModel] = None) -> list:
+        _, cache_executor, elastic_executor = self.executors(model or self.model)
+        started = time.monotonic()
+        models = await elastic_executor.get_detected_from_elastic(body, params)
+        await self.put_list_to_cache(key, models, time.monotonic() - started, model)
+        return models
+
+    async def put_list_to_cache(self, key: str, models: List[T], delta: float, model: Type[BaseModel] = None) -> None:
+        _, cache_executor, _ = self.executors(model or self.model)
+        if config.LIST_CACHE_MODE == 'ids':
+            # объекты кладутся в общие с детальными запросами ключи, а в ключ списка — только их id
+            await cache_executor.put_many_items_to_cache(models, delta=delta)
+            await cache_executor.put_ids_to_cache([item.id for item in models], key=key, delta=delta)
+        else:
+            await cache_executor.put_items_to_cache(models, key=key, delta=delta)
+
+    async def warm_lists(self, queries: List[dict], model: Type[BaseModel] = None) -> None:
+        """
+        Кладёт в кеш результаты поисков, сохранённых HotKeys. Уже закешированные списки
+        только поднимаются в кеш процесса, остальные запрашиваются у эластика одним msearch
+        """
+        model = model or self.model
+        _, _, elastic_executor = self.executors(model)
+        generation = await get_generation(self.redis_executor, self.index)
+        keys = [list_cache_key(self.namespace(model), generation, query['body'], query['params']) for query in queries]
+        entries = await asyncio.gather(*(self.list_entry_from_cache(key, model) for key in keys))
+        missing = [(key, query) for key, query, entry in zip(keys, queries, entries) if entry is None]
+        if not missing:
+            return
+        started = time.monotonic()
+        results = await elastic_executor.msearch_from_elastic([(query['body'], query['params']) for _, query in missing])
+        delta = time.monotonic() - started
+        for (key, _), models in zip(missing, results):
+            # поиск с ошибкой завершится ею же и в обычном запросе, кешировать нечего
+            if models is not None:
+                await self.put_list_to_cache(key, models, delta, model)
+
+    async def list_entry_from_cache(self, key: str, model: Type[BaseModel] = None) -> Optional[CacheEntry]:
+        _, cache_executor, _ = self.executors(model or self.model)
+        if config.LIST_CACHE_MODE != 'ids':
+            return await cache_executor.items_entry_from_cache(key)
+        entry = await cache_executor.ids_entry_from_cache(key)
+        if entry is None:
+            return None
+        return CacheEntry(await self.get_by_ids(entry.value, model), entry.soft_expire, entry.delta)
+
+    async def get_by_ids(self, ids: List[str], model: Type[BaseModel] = None) -> List[T]:
+        """
+        Возвращает объекты по списку id в том же порядке: что есть в кеше — одним mget из редиса,
+        недостающие — одним mget из эластика
+        """
+        catalog = self.catalog(model=model)
+        if catalog:
+            return catalog.get_many(ids)
+        _, cache_executor, elastic_executor = self.executors(model or self.model)
+        entries = await cache_executor.item_entries_from_cache(ids)
+        # для заведомо отсутствующих id в кеше лежит None
+        found = {item_id: entry.value for item_id, entry in entries.items()}
+        missing = [item_id for item_id in ids if item_id not in found]
+        if missing:
+            started = time.monotonic()
+            try:
+                items = await elastic_executor.get_from_elastic_by_ids(missing)
+            except ElasticUnavailable as error:
+                # отдаём только целиком собранный ответ, недостающие объекты берём из устаревшего кеша
+                found.update(await self.stale_values(missing, error, model))
+                return [found[item_id] for item_id in ids if found.get(item_id) is not None]
+            await cache_executor.put_many_items_to_cache(items, delta=time.monotonic() - started)
+            found.update((item.id, item) for item in items)
+            await cache_executor.put_missing_to_cache([item_id for item_id in missing if item_id not in found])
+        return [found[item_id] for item_id in ids if found.get(item_id) is not None]
+
+    def catalog(self, body=None, model: Type[BaseModel] = None) -> Optional[ResidentCatalog]:
+        """
+        Каталог индекса в памяти, если он загружен и запрос можно выполнить по нему: без условий поиска и для полной модели
+        """
+        if body or (model is not None and model is not self.model):
+            return None
+        return get_catalog(self.index)
+
+    @staticmethod
+    def can_refresh() -> bool:
+        # пока цепь разомкнута, фоновое обновление всё равно не дойдёт до эластика
+        return not config.CIRCUIT_BREAKER_ENABLED or breaker.allows_calls()
+
+    async def stale_value(
+            self, key: str, error: ElasticUnavailable, model: Type[BaseModel] = None, is_list: bool = False
+    ):
+        """
+        Последнее известное значение, даже устаревшее: из кеша процесса, а если там его нет — из редиса,
+        где ключ живёт до жёсткого срока. Если его нет нигде, пробрасывает ошибку эластика
+        """
+        namespace = self.namespace(model or self.model)
+        entry = get_local_cache(namespace).get_stale(key) if config.LOCAL_CACHE_ENABLED else None
+        if entry is None:
+            redis_executor, _, _ = self.executors(model or self.model)
+            try:
+                if not is_list:
+                    entry = await redis_executor.item_entry_from_cache(key)
+                elif config.LIST_CACHE_MODE == 'ids':
+                    entry = await redis_executor.ids_entry_from_cache(key)
+                else:
+                    entry = await redis_executor.items_entry_from_cache(key)
+            except RedisError:
+                entry = None
+        if entry is None:
+            raise error
+        STALE_FALLBACKS.labels(namespace).inc()
+        return entry.value
+
+    async def stale_values(self, ids: List[str], error: ElasticUnavailable, model: Type[BaseModel] = None) -> dict:
+        """
+        То же для списка id: недостающие в кеше процесса объекты достаются из редиса одним mget
+        """
+        namespace = self.namespace(model or self.model)
+        entries = {}
+        if config.LOCAL_CACHE_ENABLED:
+            local_cache = get_local_cache(namespace)
+            entries = {item_id: local_cache.get_stale(item_id) for item_id in ids}
+            entries = {item_id: entry for item_id, entry in entries.items() if entry is not None}
+        missing = [item_id for item_id in ids if item_id not in entries]
+        if missing:
+            redis_executor, _, _ = self.executors(model or self.model)
+            try:
+                entries.update(await redis_executor.item_entries_from_cache(missing))
+            except RedisError:
+                pass
+        if len(entries) < len(ids):
+            raise error
+        STALE_FALLBACKS.labels(namespace).inc(len(entries))
+        return {item_id: entry.value for item_id, entry in entries.items()}
 
 
@@ -0,0 +1,38 @@
+import asyncio
+import logging
+from typing import Awaitable, Callable, Dict, Hashable
+
+
+class SingleFlight:
+    """
+    Схлопывает одновременные вызовы с одинаковым ключом: выполняется только первый,
+    остальные дожидаются и получают его результат
+    """
+
+    def __init__(self):
+        self._calls: Dict[Hashable, asyncio.Future] = {}
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable]):
+        return await asyncio.shield(self.start(key, fn))
+
+    def start(self, key: Hashable, fn: Callable[[], Awaitable]) -> asyncio.Future:
+        """
+        Запускает вызов, если по ключу ещё ничего не выполняется, и не дожидается результата
+        """
+        call = self._calls.get(key)
+        if call is None:
+            # загрузка идёт отдельной задачей, чтобы отмена запроса-инициатора не оставила ожидающих без результата
+            call = asyncio.ensure_future(fn())
+            self._calls[key] = call
+            call.add_done_callback(lambda done: self._forget(key, done))
+        return call
+
+    def _forget(self, key: Hashable, call: asyncio.Future) -> None:
+        if self._calls.get(key) is call:
+            del self._calls[key]
+        # помечаем исключение полученным, даже если дождаться результата было некому
+        if not call.cancelled() and call.exception():
+            logging.warning('Loading of %s failed: %r', key, call.exception())
+
+    def in_flight(self) -> int:
+        return len(self._calls)
@@ -0,0 +1,155 @@
+import asyncio
+import heapq
+import logging
+import re
+from bisect import bisect_left
+from functools import lru_cache
+from typing import Dict, Iterable, List, Tuple
+
+from aioredis import Redis
+from elasticsearch import AsyncElasticsearch, exceptions
+from fastapi import Depends
+from pydantic import BaseModel
+
+from core import config
+from db.elastic import ElasticUnavailable, get_elastic
+from db.redis import get_redis
+from models.film import FilmShort, Person, PersonShort, Suggestions
+from services.film import FilmService
+from services.person import PersonService
+
+# сколько слов, кроме первого, могут начинать подсказку — так же, как в completion-поле ETL
+SUGGEST_MAX_WORD_STARTS = 5
+# префиксы такой длины встречаются чаще всего и дают самые большие диапазоны, их ответы запоминаются
+SHORT_PREFIX_LENGTH = 2
+WORD = re.compile(r'\w+')
+
+
+def normalize(text: str) -> str:
+    # как анализатор simple у completion-поля: нижний регистр, разделители между словами схлопываются
+    return ' '.join(WORD.findall(text.lower()))
+
+
+def suggest_keys(text: str) -> List[str]:
+    words = text.split()
+    starts = [position for position, word in enumerate(words) if any(char.isalnum() for char in word)]
+    return [normalize(' '.join(words[start:])) for start in starts[:SUGGEST_MAX_WORD_STARTS + 1]]
+
+
+class PrefixIndex:
+    """
+    Отсортированный массив ключей подсказок: диапазон ключей с нужным префиксом находится двоичным поиском.
+    complete означает, что в индексе все объекты, и отсутствие подсказки в нём окончательно
+    """
+
+    def __init__(self, items: Iterable[Tuple[BaseModel, str, float]], complete: bool):
+        self.complete = complete
+        self.items: List[BaseModel] = []
+        self.weights: List[float] = []
+        keys = []
+        for position, (item, text, weight) in enumerate(items):
+            self.items.append(item)
+            self.weights.append(weight)
+            keys.extend((key, position) for key in suggest_keys(text))
+        keys.sort()
+        self.keys = [key for key, _ in keys]
+        self.positions = [position for _, position in keys]
+        self._short: Dict[str, List[int]] = {}
+
+    def search(self, prefix: str, size: int) -> List[BaseModel]:
+        if len(prefix) <= SHORT_PREFIX_LENGTH:
+            if prefix not in self._short:
+                self._short[prefix] = self._top(prefix, config.SUGGEST_MAX_SIZE)
+            positions = self._short[prefix][:size]
+        else:
+            positions = self._top(prefix, size)
+        return [self.items[position] for position in positions]
+
+    def _top(self, prefix: str, size: int) -> List[int]:
+        start = bisect_left(self.keys, prefix)
+        end = bisect_left(self.keys, prefix + '\uffff', lo=start)
+        # объект попадает в диапазон по каждому подходящему слову, но в подсказках нужен один раз
+        candidates = set(self.positions[start:end])
+        return heapq.nsmallest(size, candidates, key=lambda position: (-self.weights[position], position))
+
+
+# префиксные индексы процесса по видам подсказок, общие для всех экземпляров сервиса
+prefix_indexes: Dict[str, PrefixIndex] = {}
+
+
+class SuggestService:
+    def __init__(self, film_service: FilmService, person_service: PersonService):
+        _, _, self.films_elastic = film_service.executors(FilmShort)
+        _, _, self.persons_elastic = person_service.executors(Person)
+
+    async def suggest(self, prefix: str, size: int) -> Suggestions:
+        films, persons = await asyncio.gather(
+            self.lookup('films', self.films_elastic, 'title_suggest', prefix, size),
+            self.lookup('persons', self.persons_elastic, 'full_name_suggest', prefix, size),
+        )
+        return Suggestions(
+            films=films,
+            persons=[PersonShort(id=person.id, full_name=person.full_name) for person in persons],
+        )
+
+    @staticmethod
+    async def lookup(kind: str, elastic_executor, field: str, prefix: str, size: int) -> List[BaseModel]:
+        index = prefix_indexes.get(kind)
+        if index is not None:
+            found = index.search(normalize(prefix), size)
+            # в памяти самые весомые объекты: если их хватило, в эластике лучше не найдётся
+            if index.complete or len(found) >= size:
+                return found
+        return await elastic_executor.suggest_from_elastic(field, prefix, size)
+
+    async def refresh(self) -> None:
+        """
+        Перестраивает префиксные индексы по самым рейтинговым фильмам и по персонам
+        """
+        size = config.SUGGEST_LOCAL_SIZE
+        loop = asyncio.get_event_loop()
+        films = await self.films_elastic.get_detected_from_elastic(
+            {'sort': [{'imdb_rating': 'desc'}, {'id': 'asc'}], 'size': size}, None
+        )
+        if not films:
+            # индекс ещё не наполнен: пусть подсказки идут в эластик, а не отвечают пустотой до следующего обновления
+            return
+        # сортировка десятков тысяч ключей заметно задержала бы обработку запросов, поэтому идёт в потоке
+        prefix_indexes['films'] = await loop.run_in_executor(None, lambda: PrefixIndex(
+            ((film, film.title, film.imdb_rating or 0) for film in films), complete=len(films) < size
+        ))
+        # у персон нет поля, по которому эластик отсортировал бы их по весу подсказки,
+        # поэтому индекс в памяти строится, только если персоны помещаются в него целиком
+        persons = await self.persons_elastic.get_detected_from_elastic({'size': size}, None)
+        if len(persons) < size:
+            prefix_indexes['persons'] = await loop.run_in_executor(None, lambda: PrefixIndex(
+                ((person, person.full_name, films_count(person)) for person in persons), complete=True
+            ))
+        else:
+            prefix_indexes.pop('persons', None)
+
+
+def films_count(person: Person) -> int:
+    # так же, как вес подсказки персоны в ETL: фильмы в индексе склеены через ', '
+    films = set()
+    for role_films in (person.films_as_actor, person.films_as_writer, person.films_as_director):
+        films.update(film_id.strip() for film_id in (role_films or '').split(',') if film_id.strip())
+    return len(films)
+
+
+async def refresh_prefix_indexes(service: SuggestService) -> None:
+    while True:
+        try:
+            await service.refresh()
+        except (ElasticUnavailable, exceptions.TransportError) as error:
+            # индекс остаётся прежним, а без него подсказки идут в эластик
+            logging.warning('Suggest prefix indexes were not refreshed: %r', error)
+        await asyncio.sleep(config.SUGGEST_REFRESH_IN_SECONDS)
+
+
+@lru_cache()
+def get_suggest_service(
+        redis: Redis = Depends(get_redis),
+        elastic: AsyncElasticsearch = Depends(get_elastic),
+) -> SuggestService:
+    return SuggestService(FilmService(redis, elastic), PersonService(redis, elastic))
@@ -0,0 +1,122 @@
+import asyncio
+import logging
+from typing import Awaitable, Callable, Iterable, List, Tuple
+
+import orjson
+from aioredis import Redis, RedisError
+from elasticsearch import AsyncElasticsearch, exceptions
+
+from core import config
+from db.elastic import ElasticUnavailable
+from services.hot_keys import top_keys
+from services.invalidation import SERVICES
+
+# пауза перед повтором пачек, которые не удалось прогреть
+RETRY_DELAY_IN_SECONDS = 1
+
+Job = Tuple[int, Callable[[], Awaitable]]
+
+
+def chunks(items: list, size: int) -> Iterable[list]:
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+class CacheWarmer:
+    """
+    Прогрев кеша самыми запрашиваемыми объектами и поисками из выборки HotKeys: объекты загружаются
+    пачками через mget, поиски — через msearch, не больше WARMUP_CONCURRENCY запросов одновременно.
+    Покрытие — доля прогретых ключей от запланированных
+    """
+
+    def __init__(self, redis: Redis, elastic: AsyncElasticsearch):
+        self.redis = redis
+        self.elastic = elastic
+        self.planned = 0
+        self.warmed = 0
+        self.finished = False
+
+    @property
+    def coverage(self) -> float:
+        return self.warmed / self.planned if self.planned else 1.0
+
+    @property
+    def ready(self) -> bool:
+        return self.finished or self.coverage >= config.WARMUP_TARGET_COVERAGE
+
+    async def plan(self) -> List[Job]:
+        jobs = []
+        for service_class in SERVICES:
+            service = service_class(self.redis, self.elastic)
+            ids = await top_keys(self.redis, service.index, 'ids', config.WARMUP_ITEMS)
+            for batch in chunks(ids, config.WARMUP_MGET_SIZE):
+                jobs.append((len(batch), lambda service=service, batch=batch: service.get_by_ids(batch)))
+            for model in (service.model,) + service.projections:
+                queries = [
+                    orjson.loads(query)
+                    for query in await top_keys(self.redis, service.namespace(model), 'lists', config.WARMUP_LISTS)
+                ]
+                for batch in chunks(queries, config.WARMUP_MSEARCH_SIZE):
+                    jobs.append((
+                        len(batch), lambda service=service, batch=batch, model=model: service.warm_lists(batch, model)
+                    ))
+        return jobs
+
+    async def run(self) -> float:
+        loop = asyncio.get_event_loop()
+        deadline = loop.time() + config.WARMUP_TIMEOUT_IN_SECONDS
+        semaphore = asyncio.Semaphore(config.WARMUP_CONCURRENCY)
+
+        async def attempt(job: Job) -> bool:
+            weight, warm = job
+            async with semaphore:
+                try:
+                    await warm()
+                except (ElasticUnavailable, exceptions.TransportError, RedisError) as error:
+                    logging.warning('Cache warm-up batch failed: %r', error)
+                    return False
+            self.warmed += weight
+            return True
+
+        try:
+            pending = await self.plan()
+            self.planned = sum(weight for weight, _ in pending)
+            while pending and loop.time() < deadline:
+                results = await asyncio.gather(*(attempt(job) for job in pending))
+                pending = [job for job, warmed in zip(pending, results) if not warmed]
+                if pending:
+                    await asyncio.sleep(RETRY_DELAY_IN_SECONDS)
+        except RedisError as error:
+            # без выборки прогревать нечего, кеш наполнится обычными запросами
+            logging.warning('Cache warm-up was skipped: %r', error)
+        finally:
+            self.finished = True
+        log = logging.info if self.coverage >= config.WARMUP_TARGET_COVERAGE else logging.warning
+        log('Cache warm-up finished: %s of %s keys', self.warmed, self.planned)
+        return self.coverage
+
+
+async def main() -> None:
+    """
+    Прогрев общего кеша в редисе отдельной командой, например перед переключением трафика:
+
+        cd src && python -m services.warmup
+    """
+    import aioredis
+
+    from db import elastic, redis
+
+    redis.redis = await aioredis.create_redis_pool((config.REDIS_HOST, config.REDIS_PORT), minsize=1, maxsize=10)
+    elastic.es = elastic.create_elastic()
+    try:
+        coverage = await CacheWarmer(redis.redis, elastic.es).run()
+    finally:
+        redis.redis.close()
+        await redis.redis.wait_closed()
+        await elastic.es.close()
+    if coverage < config.WARMUP_TARGET_COVERAGE:
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    asyncio.get_event_loop().run_until_complete(main())
@@ -0,0 +1,137 @@
+"""
+Нагрузочный прогон API без эластика и редиса:
+
+    python -m tests.benchmark --save default
+    python -m tests.benchmark --compare default
+
+Приложение работает с поддельным эластиком с задержкой ответа и поддельным редисом
+(или настоящим, если задан BENCHMARK_REDIS_HOST), а нагрузка — смесь запросов
+по тестовым данным, размноженным в --scale раз
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+
+from . import settings
+from .dataset import build_indexes
+from .fakes import FakeElasticsearch, FakeRedis
+from .runner import cache_counters, hit_rates, load_app, replay, summarize
+from .scenario import Scenario
+
+# направление, в котором показатель считается улучшением
+HIGHER_IS_BETTER = {'rps'}
+LOWER_IS_BETTER = {'p50_ms', 'p95_ms', 'p99_ms', 'es_calls_per_request', 'errors'}
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(prog='python -m tests.benchmark', description='Нагрузочный прогон API')
+    parser.add_argument('--concurrency', type=int, default=settings.BENCHMARK_CONCURRENCY)
+    parser.add_argument('--requests', type=int, default=settings.BENCHMARK_REQUESTS)
+    parser.add_argument('--warmup', type=int, default=settings.BENCHMARK_WARMUP_REQUESTS)
+    parser.add_argument('--scale', type=int, default=settings.BENCHMARK_SCALE)
+    parser.add_argument('--es-latency', type=float, default=settings.BENCHMARK_ES_LATENCY)
+    parser.add_argument('--seed', type=int, default=settings.BENCHMARK_SEED)
+    parser.add_argument('--save', metavar='NAME', help='сохранить результат как замер NAME')
+    parser.add_argument('--compare', metavar='NAME', help='сравнить результат с замером NAME')
+    parser.add_argument('--tolerance', type=float, default=settings.BENCHMARK_TOLERANCE)
+    return parser.parse_args()
+
+
+def baseline_path(name: str) -> str:
+    return os.path.join(settings.BASELINES_DIR, f'{name}.json')
+
+
+async def connect_redis():
+    if not settings.BENCHMARK_REDIS_HOST:
+        return FakeRedis()
+    import aioredis
+
+    redis = await aioredis.create_redis_pool(
+        (settings.BENCHMARK_REDIS_HOST, settings.BENCHMARK_REDIS_PORT), minsize=10, maxsize=20
+    )
+    await redis.flushdb()
+    return redis
+
+
+async def run(args) -> dict:
+    app = load_app(settings.SRC_DIR)
+    from db import elastic, redis
+    from services.catalog import catalogs, register_catalogs
+    from services.invalidation import SERVICES
+
+    indexes = build_indexes(args.scale)
+    elastic.es = FakeElasticsearch(indexes, latency=args.es_latency, seed=args.seed)
+    redis.redis = await connect_redis()
+    scenario = Scenario(indexes, seed=args.seed)
+    # как при старте приложения: каталоги небольших индексов загружаются в память заранее
+    register_catalogs(elastic.es, SERVICES)
+    for catalog in catalogs.values():
+        await catalog.refresh()
+
+    try:
+        await replay(app, scenario.requests(args.warmup), args.concurrency)
+        es_calls, counters = elastic.es.calls, cache_counters()
+        measurement = await replay(app, scenario.requests(args.requests), args.concurrency)
+        result = summarize(measurement, elastic.es.calls - es_calls, hit_rates(counters, cache_counters()))
+    finally:
+        redis.redis.close()
+        await redis.redis.wait_closed()
+
+    result['params'] = {
+        'concurrency': args.concurrency,
+        'requests': args.requests,
+        'warmup': args.warmup,
+        'scale': args.scale,
+        'es_latency': args.es_latency,
+        'seed': args.seed,
+        'redis': 'real' if settings.BENCHMARK_REDIS_HOST else 'fake',
+    }
+    return result
+
+
+def compare(result: dict, baseline: dict, tolerance: float) -> list:
+    """
+    Показатели, ухудшившиеся относительно замера больше чем на tolerance
+    """
+    regressions = []
+    for name in sorted(HIGHER_IS_BETTER | LOWER_IS_BETTER):
+        current, previous = result[name], baseline[name]
+        if name in HIGHER_IS_BETTER:
+            worse = current < previous * (1 - tolerance)
+        else:
+            worse = current > previous * (1 + tolerance) and current > previous
+        if worse:
+            regressions.append(f'{name}: {previous} -> {current}')
+    for tier, previous in baseline['cache_hit_rate'].items():
+        current = result['cache_hit_rate'].get(tier, 0)
+        if current < previous * (1 - tolerance):
+            regressions.append(f'cache_hit_rate[{tier}]: {previous} -> {current}')
+    return regressions
+
+
+def main():
+    args = parse_args()
+    result = asyncio.get_event_loop().run_until_complete(run(args))
+    print(json.dumps(result, indent=2, ensure_ascii=False))
+
+    if args.compare:
+        with open(baseline_path(args.compare)) as f:
+            baseline = json.load(f)
+        if baseline['params'] != result['params']:
+            print(f'параметры прогона отличаются от замера {args.compare}: {baseline["params"]}', file=sys.stderr)
+        regressions = compare(result, baseline, args.tolerance)
+        if regressions:
+            print('ухудшения относительно замера:', *regressions, sep='\n  ', file=sys.stderr)
+            sys.exit(1)
+        print(f'ухудшений относительно замера {args.compare} нет', file=sys.stderr)
+
+    if args.save:
+        with open(baseline_path(args.save), 'w') as f:
+            json.dump(result, f, indent=2, ensure_ascii=False)
+            f.write('\n')
+
+
+if __name__ == '__main__':
+    main()
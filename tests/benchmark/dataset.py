@@ -0,0 +1,64 @@
+import json
+import os
+import uuid
+from typing import Dict, List
+
+from .settings import LOAD_DATA_DIR
+
+# файл с данными для bulk-загрузки в тестах и индекс, в который он грузится
+LOAD_DATA_FILES = {
+    'movies': 'films.json',
+    'person': 'person.json',
+    'genre': 'genres.json',
+}
+
+
+def load_documents(file_name: str) -> Dict[str, dict]:
+    """
+    Читает документы из тела bulk-запроса: строки действий чередуются с документами
+    """
+    with open(os.path.join(LOAD_DATA_DIR, file_name)) as f:
+        bulk = json.load(f)
+    return {action['create']['_id']: doc for action, doc in zip(bulk[::2], bulk[1::2])}
+
+
+def copy_id(item_id: str, copy: int) -> str:
+    if copy == 0:
+        return item_id
+    return str(uuid.uuid5(uuid.NAMESPACE_OID, f'{item_id}:{copy}'))
+
+
+def copy_ids(ids: str, copy: int) -> str:
+    # у персон фильмы хранятся строкой id через запятую
+    return ','.join(copy_id(item_id, copy) for item_id in ids.split(',') if item_id) if ids else ids
+
+
+def build_indexes(scale: int) -> Dict[str, Dict[str, dict]]:
+    """
+    Размножает тестовые фильмы и персоны в scale раз. Копии получают свои id и названия,
+    а связи фильмов и персон остаются внутри своей копии. Жанров в жизни мало, их не размножаем
+    """
+    films = load_documents(LOAD_DATA_FILES['movies'])
+    persons = load_documents(LOAD_DATA_FILES['person'])
+    indexes = {'movies': {}, 'person': {}, 'genre': load_documents(LOAD_DATA_FILES['genre'])}
+
+    for copy in range(scale):
+        for film in films.values():
+            film_copy = dict(film, id=copy_id(film['id'], copy))
+            if copy:
+                film_copy['title'] = f'{film["title"]} {copy}'
+                film_copy['imdb_rating'] = round((film.get('imdb_rating') or 0) - copy % 10 / 10, 1)
+            for role in ('actors', 'writers'):
+                film_copy[role] = [dict(person, id=copy_id(person['id'], copy)) for person in film.get(role) or []]
+            indexes['movies'][film_copy['id']] = film_copy
+        for person in persons.values():
+            person_copy = dict(person, id=copy_id(person['id'], copy))
+            for role in ('films_as_actor', 'films_as_writer', 'films_as_director'):
+                person_copy[role] = copy_ids(person.get(role), copy)
+            indexes['person'][person_copy['id']] = person_copy
+    return indexes
+
+
+def title_words(indexes: Dict[str, Dict[str, dict]]) -> List[str]:
+    words = {word.lower() for film in indexes['movies'].values() for word in film['title'].split() if word.isalpha()}
+    return sorted(words)
@@ -0,0 +1,263 @@
+import asyncio
+import random
+import time
+import uuid
+from typing import Dict, List, Optional
+
+import orjson
+from elasticsearch import exceptions
+
+# поля, по которым идёт полнотекстовый поиск в каждом индексе
+SEARCH_FIELDS = {
+    'movies': ('title', 'description'),
+    'person': ('full_name',),
+    'genre': ('name',),
+}
+
+
+class FakeElasticsearch:
+    """
+    Замена AsyncElasticsearch в памяти процесса: понимает запросы, которые строит API,
+    и отвечает с настраиваемой задержкой
+    """
+
+    def __init__(self, indexes: Dict[str, Dict[str, dict]], latency: float = 0.0, seed: int = None):
+        self.indexes = indexes
+        self.latency = latency
+        self.random = random.Random(seed)
+        self.calls = 0
+
+    async def wait(self) -> int:
+        self.calls += 1
+        delay = self.latency * self.random.uniform(0.5, 1.5)
+        await asyncio.sleep(delay)
+        return int(delay * 1000)
+
+    async def close(self):
+        pass
+
+    def source(self, doc: dict, includes) -> dict:
+        if not includes:
+            return doc
+        if isinstance(includes, str):
+            includes = includes.split(',')
+        return {field: doc[field] for field in includes if field in doc}
+
+    async def get(self, index: str, id: str, params: dict = None, **kwargs) -> dict:
+        took = await self.wait()
+        doc = self.indexes.get(index, {}).get(id)
+        if doc is None:
+            raise exceptions.NotFoundError(404, 'not_found', {'found': False})
+        includes = (params or {}).get('_source_includes')
+        return {'_index': index, '_id': id, 'found': True, 'took': took, '_source': self.source(doc, includes)}
+
+    async def mget(self, body: dict, index: str, params: dict = None, **kwargs) -> dict:
+        await self.wait()
+        docs = self.indexes.get(index, {})
+        includes = (params or {}).get('_source_includes')
+        return {'docs': [
+            {'_index': index, '_id': item_id, 'found': True, '_source': self.source(docs[item_id], includes)}
+            if item_id in docs else {'_index': index, '_id': item_id, 'found': False}
+            for item_id in body['ids']
+        ]}
+
+    async def open_point_in_time(self, index: str, params: dict = None, **kwargs) -> dict:
+        await self.wait()
+        # снимок не нужен: данные во время замера не меняются
+        return {'id': f'{index}:{uuid.uuid4()}'}
+
+    async def search(self, index: str = None, body=None, params: dict = None, **kwargs) -> dict:
+        took = await self.wait()
+        if isinstance(body, (str, bytes)):
+            body = orjson.loads(body)
+        body = body or {}
+        params = params or {}
+        if index is None:
+            # запрос внутри point in time: индекс зашит в id снимка
+            index = body['pit']['id'].split(':', 1)[0]
+
+        docs = [doc for doc in self.indexes.get(index, {}).values() if self.matches(index, doc, body.get('query'))]
+        docs = self.sort(docs, body.get('sort') or params.get('sort'))
+        if 'search_after' in body:
+            docs = docs[self.position_after(docs, body['sort'], body['search_after']):]
+            start = 0
+        else:
+            # смещение API передаёт как from_, клиент эластика переименовывает его в from
+            start = int(params.get('from_') or params.get('from') or body.get('from') or 0)
+        size = int(body.get('size') or params.get('size') or 10)
+        includes = body.get('_source') or params.get('_source_includes')
+
+        hits = []
+        sort = body.get('sort')
+        for doc in docs[start:start + size]:
+            hit = {'_index': index, '_id': doc['id'], '_score': 1.0, '_source': self.source(doc, includes)}
+            if isinstance(sort, list):
+                hit['sort'] = [self.sort_value(doc, field) for field in self.sort_fields(sort)]
+            hits.append(hit)
+        result = {'took': took, 'hits': {'total': {'value': len(docs)}, 'hits': hits}}
+        if 'pit' in body:
+            result['pit_id'] = body['pit']['id']
+        return result
+
+    def matches(self, index: str, doc: dict, query: Optional[dict]) -> bool:
+        if not query:
+            return True
+        if 'bool' in query:
+            clauses = []
+            for occur in ('must', 'filter'):
+                clause = query['bool'].get(occur) or []
+                clauses.extend(clause if isinstance(clause, list) else [clause])
+            return all(self.matches(index, doc, clause) for clause in clauses)
+        if 'term' in query:
+            (field, value), = query['term'].items()
+            values = doc.get(field) or []
+            return value in (values if isinstance(values, list) else [values])
+        if 'query_string' in query:
+            words = query['query_string']['query'].lower().split()
+            text = ' '.join(str(doc.get(field) or '') for field in SEARCH_FIELDS.get(index, ())).lower()
+            return any(word in text for word in words)
+        if 'match' in query:
+            (field, condition), = query['match'].items()
+            value = condition['query'] if isinstance(condition, dict) else condition
+            values = doc.get(field) or []
+            return value in (values if isinstance(values, list) else [values])
+        if 'terms' in query:
+            (field, values), = query['terms'].items()
+            return doc.get('id' if field == '_id' else field) in values
+        if 'ids' in query:
+            return doc['id'] in query['ids']['values']
+        return True
+
+    @staticmethod
+    def sort_fields(sort: List[dict]) -> List[str]:
+        return [next(iter(item)) for item in sort]
+
+    @staticmethod
+    def sort_value(doc: dict, field: str):
+        if field == '_score':
+            return 1.0
+        return doc.get(field) or 0
+
+    def sort(self, docs: List[dict], sort) -> List[dict]:
+        if not sort:
+            return sorted(docs, key=lambda doc: doc['id'])
+        if isinstance(sort, str):
+            field, _, order = sort.partition(':')
+            sort = [{field: order or 'asc'}]
+        # сортировки устойчивые, поэтому применяются с последнего ключа к первому
+        for item in reversed(sort):
+            (field, order), = item.items()
+            docs = sorted(docs, key=lambda doc: self.sort_value(doc, field), reverse=order == 'desc')
+        return docs
+
+    def position_after(self, docs: List[dict], sort: List[dict], search_after: list) -> int:
+        fields = self.sort_fields(sort)
+        for position, doc in enumerate(docs):
+            if [self.sort_value(doc, field) for field in fields] == search_after:
+                return position + 1
+        return len(docs)
+
+
+class FakePipeline:
+    def __init__(self, redis: 'FakeRedis'):
+        self.redis = redis
+        self.commands = []
+
+    def __getattr__(self, name):
+        def command(*args, **kwargs):
+            self.commands.append(getattr(self.redis, name)(*args, **kwargs))
+        return command
+
+    async def execute(self) -> list:
+        return list(await asyncio.gather(*self.commands))
+
+
+class FakePool:
+    size = freesize = minsize = maxsize = 1
+
+
+class FakeRedis:
+    """
+    Замена пула aioredis в памяти процесса с поддержкой сроков жизни ключей
+    """
+    connection = FakePool()
+
+    def __init__(self):
+        self.data: Dict[str, tuple] = {}
+        self.calls = 0
+
+    def read(self, key: str) -> Optional[bytes]:
+        record = self.data.get(key)
+        if record is None:
+            return None
+        value, expire_at = record
+        if expire_at is not None and expire_at < time.monotonic():
+            del self.data[key]
+            return None
+        return value
+
+    async def get(self, key: str) -> Optional[bytes]:
+        self.calls += 1
+        return self.read(key)
+
+    async def mget(self, key: str, *keys: str) -> List[Optional[bytes]]:
+        self.calls += 1
+        return [self.read(item) for item in (key,) + keys]
+
+    async def set(self, key: str, value, expire: int = 0, pexpire: int = 0, exist=None) -> bool:
+        self.calls += 1
+        if exist and self.read(key) is not None:
+            return False
+        if isinstance(value, str):
+            value = value.encode()
+        elif isinstance(value, (int, float)):
+            value = str(value).encode()
+        expire_at = None
+        if expire or pexpire:
+            expire_at = time.monotonic() + (expire or pexpire / 1000)
+        self.data[key] = (value, expire_at)
+        return True
+
+    async def delete(self, key: str, *keys: str) -> int:
+        self.calls += 1
+        return sum(self.data.pop(item, None) is not None for item in (key,) + keys)
+
+    async def incr(self, key: str) -> int:
+        self.calls += 1
+        value = int(self.read(key) or 0) + 1
+        self.data[key] = (str(value).encode(), None)
+        return value
+
+    async def exists(self, key: str) -> int:
+        self.calls += 1
+        return int(self.read(key) is not None)
+
+    async def hget(self, key: str, field: str) -> Optional[bytes]:
+        # состояния ETL в прогоне нет
+        self.calls += 1
+        return None
+
+    async def hmget(self, key: str, *fields: str) -> List[Optional[bytes]]:
+        self.calls += 1
+        return [None] * len(fields)
+
+    async def eval(self, script: str, keys: list = (), args: list = ()):
+        # единственный скрипт API — снятие блокировки своим токеном
+        self.calls += 1
+        if self.read(keys[0]) == str(args[0]).encode():
+            del self.data[keys[0]]
+            return 1
+        return 0
+
+    async def publish(self, channel: str, message) -> int:
+        self.calls += 1
+        return 0
+
+    def pipeline(self) -> FakePipeline:
+        return FakePipeline(self)
+
+    def close(self):
+        pass
+
+    async def wait_closed(self):
+        pass
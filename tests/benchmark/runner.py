@@ -0,0 +1,136 @@
+import asyncio
+import sys
+import time
+from collections import defaultdict
+from dataclasses import dataclass, field
+from typing import Dict, List, Tuple
+
+from .scenario import BenchmarkRequest
+
+PERCENTILES = (50, 95, 99)
+
+
+@dataclass
+class Measurement:
+    latencies: Dict[str, List[float]] = field(default_factory=lambda: defaultdict(list))
+    statuses: Dict[int, int] = field(default_factory=lambda: defaultdict(int))
+    elapsed: float = 0.0
+
+
+def load_app(src_dir: str):
+    """
+    Импортирует приложение так же, как его запускает uvicorn. Настройки читаются из окружения
+    в момент импорта, поэтому переменные окружения нужно выставить до вызова
+    """
+    if src_dir not in sys.path:
+        sys.path.insert(0, src_dir)
+    import main
+    return main.app
+
+
+async def call(app, request: BenchmarkRequest) -> int:
+    """
+    Выполняет запрос через ASGI-интерфейс приложения, без сети и HTTP-сервера
+    """
+    scope = {
+        'type': 'http',
+        'asgi': {'version': '3.0'},
+        'http_version': '1.1',
+        'method': 'GET',
+        'scheme': 'http',
+        'path': request.path,
+        'raw_path': request.path.encode(),
+        'root_path': '',
+        'query_string': request.query.encode(),
+        'headers': [(b'host', b'benchmark'), (b'accept', b'application/json')],
+        'client': ('127.0.0.1', 0),
+        'server': ('benchmark', 80),
+    }
+    status = 0
+    requested = False
+    finished = asyncio.Event()
+
+    async def receive():
+        nonlocal requested
+        if not requested:
+            requested = True
+            return {'type': 'http.request', 'body': b'', 'more_body': False}
+        # клиент «отключается» только после получения ответа целиком
+        await finished.wait()
+        return {'type': 'http.disconnect'}
+
+    async def send(message):
+        nonlocal status
+        if message['type'] == 'http.response.start':
+            status = message['status']
+        elif message['type'] == 'http.response.body' and not message.get('more_body'):
+            finished.set()
+
+    await app(scope, receive, send)
+    return status
+
+
+async def replay(app, requests: List[BenchmarkRequest], concurrency: int) -> Measurement:
+    measurement = Measurement()
+    queue = iter(requests)
+
+    async def worker():
+        for request in queue:
+            started = time.perf_counter()
+            status = await call(app, request)
+            measurement.latencies[request.kind].append(time.perf_counter() - started)
+            measurement.statuses[status] += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    measurement.elapsed = time.perf_counter() - started
+    return measurement
+
+
+def percentiles(values: List[float]) -> Dict[str, float]:
+    values = sorted(values)
+    result = {}
+    for percentile in PERCENTILES:
+        index = min(len(values) - 1, max(0, round(percentile / 100 * len(values)) - 1))
+        result[f'p{percentile}_ms'] = round(values[index] * 1000, 3)
+    return result
+
+
+def cache_counters() -> Dict[Tuple[str, str], float]:
+    from prometheus_client import REGISTRY
+
+    counters = defaultdict(float)
+    for metric in REGISTRY.collect():
+        if metric.name != 'cache_requests':
+            continue
+        for sample in metric.samples:
+            if sample.name == 'cache_requests_total':
+                counters[sample.labels['tier'], sample.labels['result']] += sample.value
+    return counters
+
+
+def hit_rates(before: Dict[Tuple[str, str], float], after: Dict[Tuple[str, str], float]) -> Dict[str, float]:
+    rates = {}
+    for tier in sorted({tier for tier, _ in after}):
+        hits = after[tier, 'hit'] - before.get((tier, 'hit'), 0)
+        misses = after[tier, 'miss'] - before.get((tier, 'miss'), 0)
+        if hits + misses:
+            rates[tier] = round(hits / (hits + misses), 4)
+    return rates
+
+
+def summarize(measurement: Measurement, es_calls: int, cache_hit_rates: Dict[str, float]) -> dict:
+    all_latencies = [latency for latencies in measurement.latencies.values() for latency in latencies]
+    total = len(all_latencies)
+    return {
+        'requests': total,
+        'rps': round(total / measurement.elapsed, 1),
+        **percentiles(all_latencies),
+        'errors': sum(count for status, count in measurement.statuses.items() if status >= 500),
+        'es_calls_per_request': round(es_calls / total, 4),
+        'cache_hit_rate': cache_hit_rates,
+        'routes': {
+            kind: {'requests': len(latencies), **percentiles(latencies)}
+            for kind, latencies in sorted(measurement.latencies.items())
+        },
+    }
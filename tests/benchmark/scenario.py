@@ -0,0 +1,90 @@
+import random
+from dataclasses import dataclass
+from itertools import accumulate
+from typing import Dict, List, Sequence
+from urllib.parse import urlencode
+
+from .dataset import title_words
+
+# доля каждого вида запросов в нагрузке
+REQUEST_MIX = (
+    ('film_detail', 35),
+    ('film_list', 15),
+    ('film_search', 15),
+    ('person_detail', 10),
+    ('person_films', 10),
+    ('person_search', 5),
+    ('genre_list', 4),
+    ('genre_detail', 4),
+    ('not_found', 2),
+)
+SORTS = ('', 'imdb_rating', '-imdb_rating')
+GENRES = ('Action', 'Adventure', 'Fantasy', 'Sci-Fi', 'Drama')
+# показатель степенного закона популярности: небольшая часть объектов собирает большую часть запросов
+POPULARITY_EXPONENT = 1.1
+
+
+@dataclass
+class BenchmarkRequest:
+    kind: str
+    path: str
+    query: str = ''
+
+
+class Popularity:
+    """
+    Выбирает объекты по закону Ципфа
+    """
+
+    def __init__(self, items: Sequence[str], rnd: random.Random):
+        self.items = list(items)
+        rnd.shuffle(self.items)
+        self.weights = list(accumulate(1 / rank ** POPULARITY_EXPONENT for rank in range(1, len(self.items) + 1)))
+        self.random = rnd
+
+    def choice(self) -> str:
+        return self.random.choices(self.items, cum_weights=self.weights)[0]
+
+
+class Scenario:
+    def __init__(self, indexes: Dict[str, Dict[str, dict]], seed: int):
+        self.random = random.Random(seed)
+        self.films = Popularity(indexes['movies'], self.random)
+        self.persons = Popularity(indexes['person'], self.random)
+        self.genres = Popularity(indexes['genre'], self.random)
+        self.words = title_words(indexes)
+        kinds, weights = zip(*REQUEST_MIX)
+        self.kinds = kinds
+        self.weights = list(accumulate(weights))
+
+    def page(self, **params) -> str:
+        params.setdefault('page[number]', self.random.choices((1, 2, 3, 4, 5), weights=(50, 20, 15, 10, 5))[0])
+        params.setdefault('page[size]', self.random.choice((10, 20, 50)))
+        sort = self.random.choice(SORTS)
+        if sort:
+            params['sort'] = sort
+        return urlencode(params)
+
+    def make(self, kind: str) -> BenchmarkRequest:
+        if kind == 'film_detail':
+            return BenchmarkRequest(kind, f'/api/v1/film/{self.films.choice()}')
+        if kind == 'film_list':
+            params = {'genre': self.random.choice(GENRES)} if self.random.random() < 0.3 else {}
+            return BenchmarkRequest(kind, '/api/v1/film/', self.page(**params))
+        if kind == 'film_search':
+            return BenchmarkRequest(kind, '/api/v1/film/search', self.page(query=self.random.choice(self.words)))
+        if kind == 'person_detail':
+            return BenchmarkRequest(kind, f'/api/v1/person/{self.persons.choice()}')
+        if kind == 'person_films':
+            return BenchmarkRequest(kind, f'/api/v1/person/{self.persons.choice()}/film')
+        if kind == 'person_search':
+            return BenchmarkRequest(kind, '/api/v1/person/search', self.page(query=self.random.choice(self.words)))
+        if kind == 'genre_list':
+            return BenchmarkRequest(kind, '/api/v1/genre/')
+        if kind == 'genre_detail':
+            return BenchmarkRequest(kind, f'/api/v1/genre/{self.genres.choice()}')
+        # несуществующие id: проверяют, что промахи не уходят каждый раз в эластик
+        return BenchmarkRequest(kind, f'/api/v1/film/missing-{self.random.randrange(100)}')
+
+    def requests(self, count: int) -> List[BenchmarkRequest]:
+        return [self.make(self.random.choices(self.kinds, cum_weights=self.weights)[0]) for _ in range(count)]
@@ -0,0 +1,22 @@
+import os
+
+# каталог API, из которого импортируется приложение
+SRC_DIR = os.path.join(os.path.dirname(__file__), '..', '..', 'src')
+LOAD_DATA_DIR = os.path.join(os.path.dirname(__file__), '..', 'functional', 'testdata', 'load_data')
+BASELINES_DIR = os.path.join(os.path.dirname(__file__), 'baselines')
+
+# параметры прогона по умолчанию, переопределяются аргументами командной строки
+BENCHMARK_CONCURRENCY = int(os.getenv('BENCHMARK_CONCURRENCY', 50))
+BENCHMARK_REQUESTS = int(os.getenv('BENCHMARK_REQUESTS', 5000))
+BENCHMARK_WARMUP_REQUESTS = int(os.getenv('BENCHMARK_WARMUP_REQUESTS', 500))
+# во сколько раз размножаются фильмы и персоны из тестовых данных
+BENCHMARK_SCALE = int(os.getenv('BENCHMARK_SCALE', 200))
+# средняя задержка ответа поддельного эластика, в секундах
+BENCHMARK_ES_LATENCY = float(os.getenv('BENCHMARK_ES_LATENCY', 0.005))
+BENCHMARK_SEED = int(os.getenv('BENCHMARK_SEED', 42))
+# допустимое ухудшение относительно сохранённого замера, в долях
+BENCHMARK_TOLERANCE = float(os.getenv('BENCHMARK_TOLERANCE', 0.2))
+
+# если задан, вместо поддельного редиса используется настоящий
+BENCHMARK_REDIS_HOST = os.getenv('BENCHMARK_REDIS_HOST')
+BENCHMARK_REDIS_PORT = int(os.getenv('BENCHMARK_REDIS_PORT', 6379))
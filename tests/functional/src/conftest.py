@@ -56,10 +56,25 @@ async def session():
 
 @pytest.fixture
 def make_get_request(session):
-    async def inner(method: str, params: dict = None) -> HTTPResponse:
+    async def inner(method: str, params: dict = None, headers: dict = None) -> HTTPResponse:
         params = params or {}
         url = SERVICE_URL + '/api/v1' + method  # в боевых системах старайтесь так не делать!
-        async with session.get(url, params=params) as response:
+        async with session.get(url, params=params, headers=headers) as response:
+            return HTTPResponse(
+                # у ответа 304 нет тела
+                body=await response.json() if response.status != 304 else None,
+                headers=response.headers,
+                status=response.status,
+            )
+
+    return inner
+
+
+@pytest.fixture
+def make_post_request(session):
+    async def inner(method: str, body: dict = None) -> HTTPResponse:
+        url = SERVICE_URL + '/api/v1' + method
+        async with session.post(url, json=body or {}) as response:
             return HTTPResponse(
                 body=await response.json(),
                 headers=response.headers,
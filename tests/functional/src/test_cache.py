@@ -0,0 +1,24 @@
+import uuid
+
+import pytest
+
+
+class TestCache:
+
+    @pytest.mark.asyncio
+    async def test_missing_film_is_cached(self, make_get_request, redis_client, create_movie_index):
+        film_id = str(uuid.uuid4())
+        response = await make_get_request(f'/film/{film_id}')
+
+        assert response.status == 404
+        # несуществующий id запоминается ненадолго, повторные запросы не доходят до эластика
+        assert await redis_client.get(f'movies:id:{film_id}') == b'-'
+        assert await redis_client.ttl(f'movies:id:{film_id}') > 0
+
+    @pytest.mark.asyncio
+    async def test_response_is_cached(self, make_get_request, redis_client, create_movie_index):
+        before = len(await redis_client.keys('response:*'))
+        response = await make_get_request('/film/search', {'query': str(uuid.uuid4())})
+
+        assert response.status == 200
+        assert len(await redis_client.keys('response:*')) > before
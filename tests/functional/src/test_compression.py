@@ -0,0 +1,33 @@
+import pytest
+
+
+class TestCompressedResponses:
+
+    @pytest.mark.asyncio
+    async def test_vary(self, make_get_request, create_movie_index):
+        response = await make_get_request('/film', headers={'Accept-Encoding': 'gzip'})
+
+        assert response.status == 200
+        assert response.headers['Vary'] == 'Accept-Encoding'
+
+    @pytest.mark.asyncio
+    async def test_small_response_is_not_compressed(self, make_get_request, create_movie_index):
+        response = await make_get_request('/film', headers={'Accept-Encoding': 'gzip'})
+
+        # на маленьких ответах сжатие почти ничего не экономит
+        assert response.status == 200
+        assert 'Content-Encoding' not in response.headers
+        assert '-gzip' not in response.headers['ETag']
+
+    @pytest.mark.asyncio
+    async def test_identity_etag_matches_compressed_variant(self, make_get_request, create_movie_index):
+        response = await make_get_request('/film/ab2811a3-3295-4564-988d-1ebc2ee03ab6', headers={
+            'Accept-Encoding': 'identity'
+        })
+        etag = response.headers['ETag']
+
+        response = await make_get_request('/film/ab2811a3-3295-4564-988d-1ebc2ee03ab6', headers={
+            'Accept-Encoding': 'gzip', 'If-None-Match': etag
+        })
+
+        assert response.status == 304
@@ -59,3 +59,45 @@ class TestFilmApi:
 
         assert response.status == 404
 
+    @pytest.mark.asyncio
+    async def test_batch_films(self, make_post_request, all_films, create_movie_index):
+        ids = [all_films[-1]['id'], 'ab2811a3-3295-4564-988d-1ebc2ee03ab7', all_films[0]['id']]
+        response = await make_post_request('/film/_batch', {'ids': ids})
+
+        assert response.status == 200
+        assert [film['id'] for film in response.body] == [all_films[-1]['id'], all_films[0]['id']]
+
+    @pytest.mark.asyncio
+    async def test_batch_films_limit(self, make_post_request):
+        response = await make_post_request('/film/_batch', {'ids': [str(i) for i in range(501)]})
+
+        assert response.status == 422
+
+    @pytest.mark.asyncio
+    async def test_films_cursor_pages(self, make_get_request, all_films, create_movie_index):
+        films, cursor = [], ''
+        while cursor is not None:
+            response = await make_get_request('/film', {'page[cursor]': cursor, 'page[size]': 2, 'sort': 'imdb_rating'})
+            assert response.status == 200
+            films.extend(response.body)
+            cursor = response.headers.get('X-Next-Page-Cursor')
+
+        assert films == all_films
+
+    @pytest.mark.asyncio
+    async def test_film_not_modified(self, make_get_request, new_hope_film):
+        response = await make_get_request('/film/ab2811a3-3295-4564-988d-1ebc2ee03ab6')
+        etag = response.headers['ETag']
+
+        assert response.status == 200
+        assert response.headers['Cache-Control']
+
+        response = await make_get_request('/film/ab2811a3-3295-4564-988d-1ebc2ee03ab6', headers={'If-None-Match': etag})
+
+        assert response.status == 304
+        assert response.headers['ETag'] == etag
+
+        response = await make_get_request('/film/ab2811a3-3295-4564-988d-1ebc2ee03ab6', headers={'If-None-Match': '"0"'})
+
+        assert response.status == 200
+        assert response.body == new_hope_film
@@ -1,3 +1,4 @@
+import asyncio
 import json
 import pytest
 
@@ -56,4 +57,19 @@ class TestGenreApi:
         response = await make_get_request('/genre/ba3f980c-645e-4fb3-afc1-d57d2b0f3d88')
         assert response.status == 404
 
+    @pytest.mark.asyncio
+    async def test_genres_from_resident_catalog(self, make_get_request, create_genre_index, redis_client, all_genres):
+        # каталог загружается при старте API, а индекс создан позже: сигнал ETL о загрузке перечитывает его
+        await redis_client.publish('cache_invalidation', json.dumps({'genre': []}))
+        await asyncio.sleep(1)
+        # жанры, закешированные предыдущими тестами; ответы API сигнал уже сделал устаревшими
+        genre_keys = await redis_client.keys('genre:id:*')
+        if genre_keys:
+            await redis_client.delete(*genre_keys)
+
+        response = await make_get_request('/genre/ba3f980c-645e-4fb3-afc1-d57d2b0f3d87')
 
+        assert response.status == 200
+        assert response.body == all_genres[1]
+        # жанр отдан из памяти процесса, в кеш редиса ничего не попало
+        assert not await redis_client.keys('genre:id:*')
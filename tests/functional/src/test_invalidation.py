@@ -0,0 +1,50 @@
+import asyncio
+import json
+
+import pytest
+
+INVALIDATION_CHANNEL = 'cache_invalidation'
+
+
+async def wait_for_status(make_get_request, method: str, status: int):
+    # сигнал о загрузке ETL воркеры API обрабатывают асинхронно
+    for _ in range(30):
+        response = await make_get_request(method)
+        if response.status == status:
+            return response
+        await asyncio.sleep(0.1)
+    return response
+
+
+class TestInvalidation:
+
+    @pytest.fixture
+    def all_films(self):
+        file = 'tests/functional/testdata/responses/all_films.json'
+        with open(file) as f:
+            return json.load(f)
+
+    @pytest.mark.asyncio
+    async def test_cached_film_until_invalidation(
+            self, make_get_request, redis_client, es_client, all_films, film_load_data, create_movie_index
+    ):
+        film_id = all_films[1]['id']
+        source = film_load_data[film_load_data.index({'create': {'_index': 'movies', '_id': film_id}}) + 1]
+        response = await make_get_request(f'/film/{film_id}')
+        assert response.status == 200
+
+        await es_client.delete(index='movies', id=film_id, refresh=True)
+        try:
+            # документа в эластике уже нет, но ETL ещё не сообщил о загрузке: ответ берётся из кеша
+            cached = await make_get_request(f'/film/{film_id}')
+            assert cached.status == 200
+            assert cached.body == response.body
+
+            await redis_client.publish(INVALIDATION_CHANNEL, json.dumps({'movies': [film_id]}))
+            response = await wait_for_status(make_get_request, f'/film/{film_id}', 404)
+            assert response.status == 404
+        finally:
+            await es_client.index(index='movies', id=film_id, body=source, refresh=True)
+            await redis_client.publish(INVALIDATION_CHANNEL, json.dumps({'movies': [film_id]}))
+        response = await wait_for_status(make_get_request, f'/film/{film_id}', 200)
+        assert response.status == 200
@@ -0,0 +1,32 @@
+import asyncio
+import json
+import uuid
+from datetime import datetime, timezone
+from email.utils import format_datetime
+
+import pytest
+
+INVALIDATION_CHANNEL = 'cache_invalidation'
+ETL_STATE_KEY = 'postgresql_films'
+
+
+class TestLastModified:
+
+    @pytest.mark.asyncio
+    async def test_last_modified_follows_etl_load(self, make_get_request, redis_client, create_movie_index):
+        loaded = datetime.now(timezone.utc).replace(microsecond=0)
+        await redis_client.hset(ETL_STATE_KEY, 'last_loaded', loaded.isoformat())
+        # сигнал о загрузке отправляется только после сохранения её времени
+        await redis_client.publish(INVALIDATION_CHANNEL, json.dumps({'movies': []}))
+        last_modified = format_datetime(loaded, usegmt=True)
+
+        for _ in range(30):
+            params = {'query': str(uuid.uuid4())}
+            response = await make_get_request('/film/search', params)
+            if response.headers.get('Last-Modified') == last_modified:
+                break
+            await asyncio.sleep(0.1)
+        assert response.headers.get('Last-Modified') == last_modified
+
+        response = await make_get_request('/film/search', params, headers={'If-Modified-Since': last_modified})
+        assert response.status == 304
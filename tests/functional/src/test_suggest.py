@@ -0,0 +1,22 @@
+import pytest
+
+
+class TestSuggestApi:
+
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize(('prefix', 'titles'), (
+            ('star', ['Star Wars: Episode IV - A New Hope', 'Star Wars: Dark Forces', 'Like a Star Shining in the Night']),
+            ('New Ho', ['Star Wars: Episode IV - A New Hope']),
+            ('zootopia', []),
+    ))
+    async def test_suggest_films(self, make_get_request, prefix, titles, create_movie_index):
+        response = await make_get_request('/suggest', {'prefix': prefix, 'size': 3})
+
+        assert response.status == 200
+        assert [film['title'] for film in response.body['films']] == titles
+
+    @pytest.mark.asyncio
+    async def test_suggest_empty_prefix(self, make_get_request):
+        response = await make_get_request('/suggest', {'prefix': ''})
+
+        assert response.status == 422
@@ -0,0 +1,9 @@
+import pytest
+
+from ..paths import SRC_DIR, prefer
+
+
+def pytest_collectstart(collector):
+    # модули API импортируются так же, как при запуске main.py из src
+    if isinstance(collector, pytest.Module):
+        prefer(SRC_DIR)
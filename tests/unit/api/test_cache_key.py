@@ -0,0 +1,53 @@
+import orjson
+import pytest
+
+from services.cache_key import canonical_query, list_cache_key
+
+QUERY = {
+    'query': {'bool': {'filter': [
+        {'terms': {'genre.id': ['a', 'b', 'c']}},
+        {'ids': {'values': ['1', '2']}},
+    ]}},
+    'sort': [{'imdb_rating': 'desc'}, {'title.raw': 'asc'}],
+    'size': 10,
+}
+
+
+def key(body, params=None) -> str:
+    return list_cache_key('movies', 1, body, params)
+
+
+class TestCacheKey:
+
+    def test_key_order_does_not_matter(self):
+        reordered = {'size': 10, 'sort': QUERY['sort'], 'query': QUERY['query']}
+
+        assert key(reordered) == key(QUERY)
+
+    def test_serialized_body_is_the_same_query(self):
+        assert key(orjson.dumps(QUERY)) == key(QUERY)
+        assert key(orjson.dumps(QUERY).decode()) == key(QUERY)
+
+    def test_terms_and_ids_are_unordered(self):
+        reordered = {**QUERY, 'query': {'bool': {'filter': [
+            {'terms': {'genre.id': ['c', 'a', 'b']}},
+            {'ids': {'values': ['2', '1']}},
+        ]}}}
+
+        assert key(reordered) == key(QUERY)
+
+    def test_sort_order_matters(self):
+        reordered = {**QUERY, 'sort': list(reversed(QUERY['sort']))}
+
+        assert key(reordered) != key(QUERY)
+
+    @pytest.mark.parametrize('value', (' star wars', 'star wars ', 'Star Wars', 'star  wars'))
+    def test_scalars_are_kept(self, value):
+        body = {'query': {'match': {'title': value}}}
+
+        assert key(body) != key({'query': {'match': {'title': 'star wars'}}})
+
+    def test_empty_params_are_omitted(self):
+        assert canonical_query(QUERY, {'page': None, 'genre': ''}) == canonical_query(QUERY, None)
+        assert canonical_query(QUERY, {'page': 2}) == canonical_query(QUERY, {'page': '2'})
+        assert key(QUERY, {'page': 2}) != key(QUERY, {'page': 3})
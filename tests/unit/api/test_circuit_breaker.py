@@ -0,0 +1,138 @@
+import asyncio
+import time
+
+import pytest
+
+from db import elastic
+from db.circuit_breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, CircuitOpenError
+from db.elastic import ElasticExecutor, ElasticUnavailable, set_route_budget, without_route_budget
+
+
+def make_breaker(reset_timeout: float = 0.05) -> CircuitBreaker:
+    return CircuitBreaker('test', window=4, min_calls=2, failure_rate=0.5, slow_call=1, reset_timeout=reset_timeout)
+
+
+def open_breaker(breaker: CircuitBreaker) -> None:
+    for _ in range(2):
+        breaker.before_call()
+        breaker.on_failure()
+
+
+class TestCircuitBreaker:
+
+    def test_opens_on_failures(self):
+        breaker = make_breaker(reset_timeout=60)
+        open_breaker(breaker)
+
+        assert breaker.state == OPEN
+        with pytest.raises(CircuitOpenError):
+            breaker.before_call()
+        assert breaker.retry_after() > 0
+
+    def test_slow_calls_are_failures(self):
+        breaker = make_breaker()
+        for _ in range(2):
+            breaker.before_call()
+            breaker.on_success(2)
+
+        assert breaker.state == OPEN
+
+    def test_only_one_probe(self):
+        breaker = make_breaker()
+        open_breaker(breaker)
+        time.sleep(0.06)
+
+        assert breaker.before_call() is True
+        assert breaker.state == HALF_OPEN
+        with pytest.raises(CircuitOpenError):
+            breaker.before_call()
+
+    def test_only_probe_closes_breaker(self):
+        breaker = make_breaker()
+        open_breaker(breaker)
+        time.sleep(0.06)
+        probe = breaker.before_call()
+
+        # запросы, отправленные до размыкания, завершаются во время пробы и на состояние не влияют
+        breaker.on_failure()
+        breaker.on_success(0.1)
+        assert breaker.state == HALF_OPEN
+
+        breaker.on_success(0.1, probe)
+        assert breaker.state == CLOSED
+
+    def test_failed_probe_reopens_breaker(self):
+        breaker = make_breaker()
+        open_breaker(breaker)
+        time.sleep(0.06)
+
+        breaker.on_failure(breaker.before_call())
+
+        assert breaker.state == OPEN
+
+    def test_cancelled_probe_releases_slot(self):
+        breaker = make_breaker()
+        open_breaker(breaker)
+        time.sleep(0.06)
+
+        breaker.on_cancel(breaker.before_call())
+
+        assert breaker.state == HALF_OPEN
+        assert breaker.before_call() is True
+
+
+class TestRouteBudget:
+
+    @pytest.fixture
+    def breaker(self, monkeypatch):
+        # размыкается с первого же неудачного запроса
+        breaker = CircuitBreaker('test', window=4, min_calls=1, failure_rate=0.5, slow_call=1, reset_timeout=60)
+        monkeypatch.setattr(elastic, 'breaker', breaker)
+        return breaker
+
+    @pytest.mark.asyncio
+    async def test_budget_timeout_does_not_open_breaker(self, breaker):
+        executor = ElasticExecutor(None, 'movies', None)
+
+        async def slow(timeout):
+            await asyncio.sleep(1)
+
+        async def route():
+            set_route_budget(0.05)
+            with pytest.raises(ElasticUnavailable):
+                await executor.call('search', slow)
+
+        await asyncio.ensure_future(route())
+
+        # время урезал бюджет маршрута, медленным эластик не считается
+        assert breaker.state == CLOSED
+
+    @pytest.mark.asyncio
+    async def test_timeout_opens_breaker(self, breaker, monkeypatch):
+        monkeypatch.setitem(elastic.TIMEOUTS, 'search', 0.05)
+        executor = ElasticExecutor(None, 'movies', None)
+
+        async def slow(timeout):
+            await asyncio.sleep(1)
+
+        with pytest.raises(ElasticUnavailable):
+            await asyncio.ensure_future(executor.call('search', slow))
+
+        assert breaker.state == OPEN
+
+    @pytest.mark.asyncio
+    async def test_background_task_has_no_route_budget(self):
+        async def deadline():
+            return elastic.deadline.get()
+
+        async def route():
+            set_route_budget(10)
+            return (
+                await asyncio.ensure_future(deadline()),
+                await asyncio.ensure_future(without_route_budget(deadline)()),
+            )
+
+        inherited, background = await asyncio.ensure_future(route())
+
+        assert inherited is not None
+        assert background is None
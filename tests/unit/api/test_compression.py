@@ -0,0 +1,50 @@
+import gzip
+
+import brotli
+import pytest
+import zstandard
+
+from services.compression import choose_encoding, compress
+from services.response_cache import CachedResponse, base_etag, make_etag, not_modified, variant_etag
+
+DECODERS = {
+    'gzip': gzip.decompress,
+    'br': brotli.decompress,
+    'zstd': lambda body: zstandard.ZstdDecompressor().decompress(body),
+}
+
+
+class TestCompression:
+
+    @pytest.mark.parametrize(('header', 'encoding'), (
+            ('gzip, deflate, br', 'br'),
+            ('gzip', 'gzip'),
+            ('br;q=0.5, gzip', 'gzip'),
+            ('*', 'zstd'),
+            ('gzip;q=0, identity', None),
+            ('identity', None),
+            (None, None),
+    ))
+    def test_choose_encoding(self, header, encoding):
+        assert choose_encoding(header) == encoding
+
+    @pytest.mark.parametrize('encoding', DECODERS)
+    def test_compress(self, encoding):
+        body = b'{"title": "Star Wars"}' * 100
+
+        assert DECODERS[encoding](compress(body, encoding)) == body
+
+    def test_variant_etag(self):
+        etag = make_etag(b'{}')
+
+        assert variant_etag(etag, 'gzip') == etag[:-1] + '-gzip"'
+        assert variant_etag(variant_etag(etag, 'gzip'), None) == etag
+        assert base_etag(variant_etag(etag, 'br')) == etag
+
+    def test_not_modified_with_any_variant(self):
+        cached = CachedResponse(make_etag(b'{}'), '', b'{}')
+
+        # копия в любой кодировке равнозначна: содержимое то же
+        assert not_modified({'if-none-match': variant_etag(cached.etag, 'gzip')}, cached)
+        assert not_modified({'if-none-match': f'W/{cached.etag}'}, cached)
+        assert not not_modified({'if-none-match': '"0"'}, cached)
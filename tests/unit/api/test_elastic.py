@@ -0,0 +1,60 @@
+import asyncio
+
+import pytest
+
+from core import config
+from db import elastic
+from db.elastic import ElasticExecutor, KeepAliveConnection, create_elastic, elastic_pool_stats
+
+
+class TestElasticPool:
+
+    @pytest.fixture
+    def client(self, monkeypatch):
+        monkeypatch.setattr(config, 'ELASTIC_HOSTS', ['es-1:9200', 'es-2:9200'])
+        client = create_elastic()
+        # асинхронный клиент заводит соединения при первом запросе
+        client.transport.set_connections(client.transport.hosts)
+        monkeypatch.setattr(elastic, 'es', client)
+        return client
+
+    def test_connections_keep_alive(self, client):
+        for connection in client.transport.connection_pool.connections:
+            assert isinstance(connection, KeepAliveConnection)
+            assert connection.keepalive_timeout == config.ELASTIC_KEEPALIVE_IN_SECONDS
+            assert connection.maxsize == config.ELASTIC_MAX_CONNECTIONS_PER_NODE
+
+    @pytest.mark.asyncio
+    async def test_in_use_connections(self, client):
+        executor = ElasticExecutor(None, 'movies', None)
+        started = asyncio.Event()
+        release = asyncio.Event()
+
+        async def request(timeout):
+            started.set()
+            await release.wait()
+            return {}
+
+        call = asyncio.ensure_future(executor.call('search', request))
+        await started.wait()
+
+        assert elastic_pool_stats() == {
+            'nodes': {'alive': 2, 'dead': 0},
+            'connections': {'in_use': 1, 'max': 2 * config.ELASTIC_MAX_CONNECTIONS_PER_NODE},
+        }
+
+        release.set()
+        await call
+        assert elastic_pool_stats()['connections']['in_use'] == 0
+
+    @pytest.mark.asyncio
+    async def test_failed_request_releases_connection(self, client):
+        executor = ElasticExecutor(None, 'movies', None)
+
+        async def request(timeout):
+            raise ValueError
+
+        with pytest.raises(ValueError):
+            await executor.call('search', request)
+
+        assert elastic_pool_stats()['connections']['in_use'] == 0
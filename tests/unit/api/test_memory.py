@@ -0,0 +1,133 @@
+import time
+import types
+
+import pytest
+from pydantic import BaseModel
+
+from db import memory
+from db.base import CacheEntry
+from db.memory import LocalCache, LocalCacheExecutor, TieredCacheExecutor
+
+
+class Item(BaseModel):
+    id: str
+
+
+class Clock:
+    """
+    Часы процесса, которые двигает тест
+    """
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self) -> float:
+        return self.now
+
+
+class CountingExecutor(LocalCacheExecutor):
+    """
+    Кеш второго уровня, который запоминает, какие id у него спрашивали
+    """
+
+    def __init__(self):
+        super().__init__(LocalCache(max_size=100, expire=60), Item)
+        self.requested = []
+
+    async def item_entries_from_cache(self, ids):
+        self.requested.extend(ids)
+        return await super().item_entries_from_cache(ids)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(memory, 'time', types.SimpleNamespace(monotonic=clock.monotonic, time=time.time))
+    return clock
+
+
+class TestLocalCache:
+
+    def test_least_recently_used_is_evicted(self):
+        cache = LocalCache(max_size=2, expire=60)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.get('a')
+        cache.set('c', 3)
+
+        assert cache.get('a') == 1
+        assert cache.get('b') is None
+        assert cache.get('c') == 3
+        assert cache.stats() == {'size': 2, 'max_size': 2, 'hits': 3, 'misses': 1}
+
+    def test_expired_value_is_kept_as_stale(self, clock):
+        cache = LocalCache(max_size=2, expire=10)
+        cache.set('a', 1)
+
+        clock.now += 9
+        assert cache.get('a') == 1
+
+        clock.now += 2
+        assert cache.get('a') is None
+        # устаревшее значение отдаётся, пока эластик недоступен
+        assert cache.get_stale('a') == 1
+        assert cache.get_stale('b') is None
+
+    def test_expire_of_one_record(self, clock):
+        cache = LocalCache(max_size=2, expire=60)
+        cache.set('a', 1, expire=5)
+
+        clock.now += 6
+        assert cache.get('a') is None
+
+    def test_jitter_spreads_expire(self, clock):
+        cache = LocalCache(max_size=100, expire=10, jitter=0.5)
+        for key in range(100):
+            cache.set(key, key)
+
+        clock.now += 7
+        alive = [key for key in range(100) if cache.get(key) is not None]
+
+        assert 0 < len(alive) < 100
+
+
+class TestTieredCache:
+
+    @pytest.fixture
+    def tiers(self):
+        return LocalCacheExecutor(LocalCache(max_size=100, expire=60), Item), CountingExecutor()
+
+    @pytest.mark.asyncio
+    async def test_remote_hit_fills_local(self, tiers):
+        local, remote = tiers
+        await remote.put_item_to_cache(Item(id='1'))
+        tiered = TieredCacheExecutor(local, remote)
+
+        assert await tiered.item_from_cache('1') == Item(id='1')
+        assert await local.item_from_cache('1') == Item(id='1')
+
+    @pytest.mark.asyncio
+    async def test_put_writes_both_tiers(self, tiers):
+        local, remote = tiers
+        tiered = TieredCacheExecutor(local, remote)
+
+        await tiered.put_item_to_cache(Item(id='1'))
+        await tiered.put_missing_to_cache(['2'])
+
+        for tier in tiers:
+            assert await tier.item_from_cache('1') == Item(id='1')
+            entry = await tier.item_entry_from_cache('2')
+            assert entry is not None and entry.value is None
+
+    @pytest.mark.asyncio
+    async def test_only_local_misses_go_to_remote(self, tiers):
+        local, remote = tiers
+        local.put_entry('1', CacheEntry(Item(id='1'), time.time() + 60))
+        await remote.put_item_to_cache(Item(id='2'))
+        tiered = TieredCacheExecutor(local, remote)
+
+        entries = await tiered.item_entries_from_cache(['1', '2', '3'])
+
+        assert {item_id: entry.value for item_id, entry in entries.items()} == {'1': Item(id='1'), '2': Item(id='2')}
+        assert remote.requested == ['2', '3']
+        assert await local.item_from_cache('2') == Item(id='2')
@@ -0,0 +1,89 @@
+import asyncio
+
+import pytest
+
+from services.single_flight import SingleFlight
+
+
+class Loader:
+    """
+    Загрузка, которая ждёт разрешения теста и считает вызовы
+    """
+
+    def __init__(self, error: Exception = None):
+        self.calls = 0
+        self.error = error
+        self.release = asyncio.Event()
+
+    async def __call__(self):
+        self.calls += 1
+        await self.release.wait()
+        if self.error:
+            raise self.error
+        return self.calls
+
+
+async def waiters(flight: SingleFlight, loader: Loader, count: int = 3):
+    calls = [asyncio.ensure_future(flight.do('key', loader)) for _ in range(count)]
+    await asyncio.sleep(0)
+    return calls
+
+
+class TestSingleFlight:
+
+    @pytest.mark.asyncio
+    async def test_concurrent_calls_share_one_load(self):
+        flight, loader = SingleFlight(), Loader()
+        calls = await waiters(flight, loader)
+
+        assert flight.in_flight() == 1
+        loader.release.set()
+
+        assert await asyncio.gather(*calls) == [1, 1, 1]
+        assert loader.calls == 1
+        assert flight.in_flight() == 0
+
+    @pytest.mark.asyncio
+    async def test_error_reaches_every_waiter(self):
+        flight, loader = SingleFlight(), Loader(error=KeyError('boom'))
+        calls = await waiters(flight, loader)
+        loader.release.set()
+
+        results = await asyncio.gather(*calls, return_exceptions=True)
+
+        assert all(result is loader.error for result in results)
+        assert loader.calls == 1
+
+    @pytest.mark.asyncio
+    async def test_key_is_loaded_again_after_error(self):
+        flight, loader = SingleFlight(), Loader(error=KeyError('boom'))
+        loader.release.set()
+        with pytest.raises(KeyError):
+            await flight.do('key', loader)
+
+        loader.error = None
+
+        assert await flight.do('key', loader) == 2
+
+    @pytest.mark.asyncio
+    async def test_cancelled_waiter_does_not_cancel_load(self):
+        flight, loader = SingleFlight(), Loader()
+        first, second = await waiters(flight, loader, count=2)
+
+        # запрос-инициатор отменён, например клиент закрыл соединение
+        first.cancel()
+        await asyncio.sleep(0)
+        loader.release.set()
+
+        assert await second == 1
+        assert first.cancelled()
+
+    @pytest.mark.asyncio
+    async def test_started_load_is_shared(self):
+        flight, loader = SingleFlight(), Loader()
+        background = flight.start('key', loader)
+        calls = await waiters(flight, loader, count=2)
+        loader.release.set()
+
+        assert await asyncio.gather(background, *calls) == [1, 1, 1]
+        assert loader.calls == 1
@@ -0,0 +1,24 @@
+import pytest
+
+from models.film import Person
+from services.suggest import films_count, normalize, suggest_keys
+
+from ..suggest_cases import FILMS_COUNT, WORD_STARTS
+
+
+class TestSuggestKeys:
+
+    @pytest.mark.parametrize(('text', 'inputs'), WORD_STARTS)
+    def test_same_word_starts_as_etl(self, text, inputs):
+        # эластик пропускает окончания через анализатор simple, индекс в памяти — через normalize
+        assert suggest_keys(text) == [normalize(item) for item in inputs]
+
+    @pytest.mark.parametrize(('films', 'count'), FILMS_COUNT)
+    def test_films_count(self, films, count):
+        actor, writer, director = films
+        person = Person(
+            id='1', full_name='George Lucas',
+            films_as_actor=actor, films_as_writer=writer, films_as_director=director,
+        )
+
+        assert films_count(person) == count
@@ -0,0 +1,135 @@
+import asyncio
+import time
+import types
+
+import pytest
+from pydantic import BaseModel
+
+from db import base
+from db.base import CacheEntry
+from db.memory import LocalCache, LocalCacheExecutor
+from services.service import Service
+
+NOW = 1000.0
+
+
+class Item(BaseModel):
+    id: str
+    version: int = 0
+
+
+class ItemService(Service):
+    model = Item
+    index = 'items'
+
+
+class Elastic:
+
+    def __init__(self):
+        self.calls = 0
+
+    async def get_from_elastic_by_id(self, item_id: str) -> Item:
+        self.calls += 1
+        return Item(id=item_id, version=self.calls)
+
+
+def uniform(value: float):
+    # обновление начинается за -log(1 - value) * delta * beta секунд до мягкого срока
+    return types.SimpleNamespace(random=lambda: value)
+
+
+class TestShouldRefresh:
+
+    @pytest.fixture(autouse=True)
+    def clock(self, monkeypatch):
+        monkeypatch.setattr(base, 'time', types.SimpleNamespace(time=lambda: NOW))
+
+    @pytest.mark.parametrize('value', (0.0, 0.5, 1 - 1e-12))
+    def test_without_delta_only_after_soft_expire(self, monkeypatch, value):
+        monkeypatch.setattr(base, 'random', uniform(value))
+
+        assert not CacheEntry('value', NOW + 0.001).should_refresh(beta=1.0)
+        assert CacheEntry('value', NOW).should_refresh(beta=1.0)
+
+    @pytest.mark.parametrize('value', (0.5, 1 - 1e-12))
+    def test_zero_beta_disables_early_refresh(self, monkeypatch, value):
+        monkeypatch.setattr(base, 'random', uniform(value))
+
+        assert not CacheEntry('value', NOW + 0.001, delta=10).should_refresh(beta=0.0)
+        assert CacheEntry('value', NOW, delta=10).should_refresh(beta=0.0)
+
+    def test_zero_random_never_refreshes_early(self, monkeypatch):
+        monkeypatch.setattr(base, 'random', uniform(0.0))
+
+        assert not CacheEntry('value', NOW + 0.001, delta=100).should_refresh(beta=10)
+
+    @pytest.mark.parametrize(('delta', 'beta', 'expected'), (
+            (1, 1, False),
+            (2, 1, True),
+            (1, 2, True),
+    ))
+    def test_earlier_for_expensive_values(self, monkeypatch, delta, beta, expected):
+        monkeypatch.setattr(base, 'random', uniform(0.5))
+
+        # -log(0.5) ≈ 0.69: обновление начинается за 0.69 * delta * beta секунд до мягкого срока
+        assert CacheEntry('value', NOW + 1, delta=delta).should_refresh(beta) is expected
+
+    def test_random_close_to_one(self, monkeypatch):
+        monkeypatch.setattr(base, 'random', uniform(1 - 1e-12))
+
+        # редкий ранний пересчёт далеко до срока: -log(1e-12) ≈ 27.6
+        assert CacheEntry('value', NOW + 27, delta=1).should_refresh(beta=1.0)
+        assert not CacheEntry('value', NOW + 28, delta=1).should_refresh(beta=1.0)
+
+
+class TestBackgroundRefresh:
+
+    @pytest.fixture
+    def service(self):
+        service = ItemService(None, None)
+        service.cache_executor = LocalCacheExecutor(LocalCache(max_size=10, expire=60), Item)
+        service.elastic_executor = Elastic()
+        return service
+
+    async def refreshed(self, service: ItemService) -> None:
+        while service.single_flight.in_flight():
+            await asyncio.sleep(0)
+
+    @pytest.mark.asyncio
+    async def test_stale_value_is_returned_and_refreshed(self, service):
+        service.cache_executor.put_entry('1', CacheEntry(Item(id='1'), time.time() - 1))
+
+        # отдаётся то, что есть в кеше, а обновление идёт в фоне
+        assert await service.get_by_id('1') == Item(id='1')
+        await self.refreshed(service)
+
+        assert service.elastic_executor.calls == 1
+        assert await service.get_by_id('1') == Item(id='1', version=1)
+
+    @pytest.mark.asyncio
+    async def test_fresh_value_is_not_refreshed(self, service):
+        service.cache_executor.put_entry('1', CacheEntry(Item(id='1'), time.time() + 60))
+
+        assert await service.get_by_id('1') == Item(id='1')
+        await self.refreshed(service)
+
+        assert service.elastic_executor.calls == 0
+
+    @pytest.mark.asyncio
+    async def test_no_refresh_while_elastic_is_unavailable(self, service, monkeypatch):
+        monkeypatch.setattr(ItemService, 'can_refresh', staticmethod(lambda: False))
+        service.cache_executor.put_entry('1', CacheEntry(Item(id='1'), time.time() - 1))
+
+        assert await service.get_by_id('1') == Item(id='1')
+        await self.refreshed(service)
+
+        assert service.elastic_executor.calls == 0
+
+    @pytest.mark.asyncio
+    async def test_concurrent_stale_reads_refresh_once(self, service):
+        service.cache_executor.put_entry('1', CacheEntry(Item(id='1'), time.time() - 1))
+
+        await asyncio.gather(*(service.get_by_id('1') for _ in range(5)))
+        await self.refreshed(service)
+
+        assert service.elastic_executor.calls == 1
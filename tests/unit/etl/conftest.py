@@ -0,0 +1,36 @@
+import importlib
+import sys
+import types
+from functools import wraps
+
+import pytest
+
+from ..paths import ETL_DIR, prefer
+
+
+def coroutine(func):
+    @wraps(func)
+    def inner(*args, **kwargs):
+        fn = func(*args, **kwargs)
+        next(fn)
+        return fn
+
+    return inner
+
+
+def load_etl() -> None:
+    # стадии берут декоратор coroutine из ETL.py, а он сам импортирует стадии:
+    # пока они загружаются, вместо ETL подставлен модуль с таким же декоратором
+    sys.modules['ETL'] = types.SimpleNamespace(coroutine=coroutine)
+    for module in ('extractor.psql_extractor', 'loader.es_loader', 'transformer.transormer'):
+        importlib.import_module(module)
+    del sys.modules['ETL']
+    importlib.import_module('ETL')
+
+
+def pytest_collectstart(collector):
+    # модули ETL импортируются так же, как при запуске ETL.py из postgres_to_es
+    if isinstance(collector, pytest.Module):
+        prefer(ETL_DIR)
+        if 'ETL' not in sys.modules:
+            load_etl()
@@ -0,0 +1,103 @@
+import json
+import threading
+import types
+
+from elasticsearch.serializer import JSONSerializer
+
+
+class Storage:
+
+    def __init__(self, state: dict = None, events: list = None):
+        self.state = state or {}
+        self.saved = []
+        self.events = events if events is not None else []
+
+    def save_state(self, state: dict):
+        self.saved.append(dict(state))
+        self.events.append('save')
+
+    def retrieve_state(self) -> dict:
+        return self.state
+
+
+class Notifier:
+
+    def __init__(self, events: list):
+        self.events = events
+
+    def notify(self, loaded):
+        self.events.append('notify')
+
+
+class Cursor:
+    """
+    Курсор Postgresql: результат запроса выбирает handler по тексту запроса и параметрам
+    """
+
+    def __init__(self, handler):
+        self.handler = handler
+        self.rows = []
+        self.itersize = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        pass
+
+    def execute(self, query, params=None):
+        self.rows = list(self.handler(query, params))
+
+    def fetchall(self):
+        rows, self.rows = self.rows, []
+        return rows
+
+    def fetchmany(self, size):
+        rows, self.rows = self.rows[:size], self.rows[size:]
+        return rows
+
+
+class Connection:
+
+    def __init__(self, handler):
+        self.handler = handler
+
+    def cursor(self, name=None):
+        return Cursor(self.handler)
+
+
+class Elastic:
+    """
+    Эластик для streaming_bulk: документы из rejected при первой отправке отклоняются с 429, документ bad — с 400
+    """
+    transport = types.SimpleNamespace(serializer=JSONSerializer())
+
+    def __init__(self, rejected=()):
+        self.rejected = set(rejected)
+        self.attempts = {}
+        self.lock = threading.Lock()
+        self.indices = types.SimpleNamespace(create=lambda **kwargs: None, put_mapping=lambda **kwargs: None)
+        self.cat = types.SimpleNamespace(thread_pool=lambda **kwargs: [])
+
+    def ping(self):
+        return True
+
+    def bulk(self, body, **kwargs):
+        lines = [json.loads(line) for line in body.strip().split('\n')] if isinstance(body, str) else body
+        items = []
+        for meta in lines[::2]:
+            doc_id = meta['index']['_id']
+            with self.lock:
+                attempt = self.attempts[doc_id] = self.attempts.get(doc_id, 0) + 1
+            if doc_id == 'bad':
+                status = 400
+            elif doc_id in self.rejected and attempt == 1:
+                status = 429
+            else:
+                status = 201
+            items.append({'index': {'_index': meta['index']['_index'], '_id': doc_id, 'status': status}})
+        return {'errors': any(item['index']['status'] >= 300 for item in items), 'items': items}
+
+
+def documents(*ids):
+    return [{'_index': 'movies', '_id': doc_id, 'id': doc_id} for doc_id in ids]
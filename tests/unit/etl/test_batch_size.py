@@ -0,0 +1,24 @@
+import pytest
+
+from batch_size import AIMD, BatchSizeController, BulkStats
+
+
+class TestBatchSize:
+
+    def test_aimd(self):
+        size = AIMD(100, 10, 130, step=20)
+
+        assert [size.update(False), size.update(False), size.update(True), size.update(True)] == [120, 130, 65, 32]
+        assert [size.update(True) for _ in range(3)][-1] == 10
+
+    @pytest.mark.parametrize(('stats', 'expected'), (
+            (BulkStats(requests=4, seconds=1), (110, 550)),
+            (BulkStats(requests=1, seconds=3), (50, 250)),
+            (BulkStats(requests=1, rejected=1), (50, 250)),
+            (BulkStats(requests=1, write_queue=51), (50, 250)),
+            (BulkStats(), (100, 500)),
+    ))
+    def test_controller(self, stats, expected):
+        controller = BatchSizeController(AIMD(100, 10, 300), AIMD(500, 50, 2000), 1, 50)
+
+        assert controller.update(stats) == expected
@@ -0,0 +1,45 @@
+import types
+from datetime import datetime, timezone
+
+import pytest
+
+from extractor.psql_extractor import PsqlExtractor
+from SQL_scripts import GET_UPDATED_FILMS_INFO
+
+from .fakes import Connection, Cursor, Storage
+
+
+class TestFetchInChunks:
+
+    @pytest.fixture
+    def extractor(self):
+        rows = [{'key': key} for key in (1, 1, 2, 2, 2, 3, 4, 4, 4, 4, 4, 5)]
+        return PsqlExtractor(Connection(lambda query, params: rows), 10, Storage(), chunk_size=3)
+
+    def test_rows_with_same_key_stay_in_one_chunk(self, extractor):
+        chunks = list(extractor.fetch_in_chunks('query', key='key'))
+
+        assert [[row['key'] for row in chunk] for chunk in chunks] == [[1, 1], [2, 2, 2], [3], [4, 4, 4, 4, 4], [5]]
+
+    def test_chunks_without_key(self, extractor):
+        chunks = list(extractor.fetch_in_chunks('query'))
+
+        assert [[row['key'] for row in chunk] for chunk in chunks] == [[1, 1, 2], [2, 2, 3], [4, 4, 4], [4, 4, 5]]
+
+    def test_films_checkpoint_follows_last_chunk(self):
+        films = [
+            {'film_id': str(i), 'last_update': datetime(2021, 1, 1 + i // 2, tzinfo=timezone.utc)} for i in range(5)
+        ]
+
+        def handler(query, params):
+            return films if query == GET_UPDATED_FILMS_INFO else []
+
+        sent = []
+        extractor = PsqlExtractor(Connection(handler), 10, Storage(), chunk_size=3)
+        extractor.extract_in_chunks(Cursor(handler), types.SimpleNamespace(send=sent.append), '1970-01-01')
+
+        film_chunks = [message for message in sent if message[2]]
+        for _, _, raw_films, checkpoint in film_chunks:
+            assert checkpoint == {'last_update': raw_films[-1]['last_update'].isoformat()}
+        # фильмы с одинаковым last_update не делятся между пачками
+        assert [len(message[2]) for message in film_chunks] == [2, 2, 1]
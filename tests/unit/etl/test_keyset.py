@@ -0,0 +1,62 @@
+import types
+from datetime import datetime, timezone
+
+import pytest
+
+from extractor.psql_extractor import NIL_UUID, PsqlExtractor
+
+from .fakes import Connection, Storage
+
+UPDATED_AT = datetime(2021, 1, 1, tzinfo=timezone.utc)
+
+
+class TestKeyset:
+
+    @pytest.fixture
+    def changed(self):
+        # изменённые строки по таблицам и фильмы, которые их затрагивают
+        return {'genre': [{'id': f'g{i}', 'updated_at': UPDATED_AT} for i in range(5)], 'person': [], 'film': []}
+
+    def handler(self, changed):
+        def inner(query, params):
+            for table, rows in changed.items():
+                if f'FROM content.{table}\n' in query and 'LIMIT' in query:
+                    return rows[:params[2]]
+            if 'LIMIT' in query:
+                return []
+            if 'genre_films' in query:
+                return [{'genre_id': genre_id} for genre_id in params[0]]
+            return [{'film_id': f'film{i}'} for i in range(7)]
+        return inner
+
+    def test_watermarks(self, changed):
+        storage = Storage()
+        sent = []
+        extractor = PsqlExtractor(Connection(self.handler(changed)), 4, storage, chunk_size=3, keyset=True)
+        state = {b'last_update': b'2020-05-05T00:00:00+00:00', b'film_watermark': b'2020-06-01T00:00:00+00:00|f1'}
+
+        extractor.extract_by_keyset(types.SimpleNamespace(send=sent.append), state, 4)
+
+        checkpoints = [message[3] for message in sent if message[3]]
+        # за запуск из таблицы читается не больше limit строк, отметка уходит с последней пачкой таблицы
+        assert checkpoints == [
+            {'genre_watermark': f'{UPDATED_AT.isoformat()}|g2', 'last_update': UPDATED_AT.isoformat()},
+            {'genre_watermark': f'{UPDATED_AT.isoformat()}|g3', 'last_update': UPDATED_AT.isoformat()},
+        ]
+        # у таблицы без изменений и без своей отметки она фиксируется сразу с общей last_update
+        assert {'person_watermark': f'2020-05-05T00:00:00+00:00|{NIL_UUID}'} in storage.saved
+        assert not any('film_watermark' in state for state in storage.saved)
+
+    def test_last_update_does_not_move_back(self, changed):
+        sent = []
+        extractor = PsqlExtractor(Connection(self.handler(changed)), 10, Storage(), keyset=True)
+        state = {b'last_update': b'2022-01-01T00:00:00+00:00', b'genre_watermark': b'2020-01-01T00:00:00+00:00|g'}
+
+        extractor.extract_by_keyset(types.SimpleNamespace(send=sent.append), state, 10)
+
+        assert sent[-1][3]['last_update'] == '2022-01-01T00:00:00+00:00'
+
+    def test_watermark_falls_back_to_last_update(self):
+        assert PsqlExtractor.watermark({b'last_update': b'2021-01-01'}, 'film') == ('2021-01-01', NIL_UUID)
+        assert PsqlExtractor.watermark({}, 'film') == ('1970-01-01', NIL_UUID)
+        assert PsqlExtractor.watermark({b'film_watermark': b'2021-01-02|f1'}, 'film') == ('2021-01-02', 'f1')
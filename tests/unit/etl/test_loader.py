@@ -0,0 +1,65 @@
+import pytest
+
+from loader.es_loader import ESLoader
+from models import BulkOptions
+
+from .fakes import Elastic, Notifier, Storage, documents
+
+
+class TestLoader:
+
+    @pytest.fixture(autouse=True)
+    def es_max_tries(self, monkeypatch):
+        # ожидание эластика в is_available_service настраивается из окружения ETL
+        monkeypatch.setenv('ES_MAX_TRIES', '1')
+
+    def test_rejected_documents_are_retried(self):
+        es = Elastic(rejected={'2', '5'})
+        storage = Storage()
+        loader = ESLoader(es, storage, bulk_options=BulkOptions(threads=2, chunk_size=2, initial_backoff=0))
+
+        loader.load().send((documents(*map(str, range(8))), {'last_update': '2021-01-01T00:00:00'}))
+
+        assert all(es.attempts[str(i)] == (2 if str(i) in {'2', '5'} else 1) for i in range(8))
+        assert not loader.failed
+        assert storage.saved[-1]['last_update'] == '2021-01-01T00:00:00'
+
+    def test_checkpoint_is_kept_after_rejections(self):
+        es = Elastic(rejected={'1'})
+        storage = Storage()
+        loader = ESLoader(es, storage, bulk_options=BulkOptions(chunk_size=2, max_retries=0))
+        load = loader.load()
+
+        load.send((documents('0', '1'), {'last_update': '2021-01-01T00:00:00'}))
+        load.send((documents('2', '3'), {'last_update': '2021-01-02T00:00:00'}))
+
+        assert loader.failed
+        assert all('last_update' not in state for state in storage.saved)
+        # пачки после неудачной не загружаются, иначе отметка перескочила бы незагруженные документы
+        assert '2' not in es.attempts
+        assert loader.take_stats().rejected == 1
+
+        loader.finish_run()
+
+        assert not loader.failed
+        assert storage.saved[-1] == {'can_start_ETL': 'True'}
+
+    def test_document_errors_do_not_hold_checkpoint(self):
+        storage = Storage()
+        loader = ESLoader(Elastic(), storage)
+
+        loader.load().send((documents('0', 'bad'), {'last_update': '2021-01-01T00:00:00'}))
+
+        assert not loader.failed
+        assert storage.saved[-1]['last_update'] == '2021-01-01T00:00:00'
+
+    def test_state_is_saved_before_notification(self):
+        events = []
+        storage = Storage(events=events)
+        loader = ESLoader(Elastic(), storage, notifier=Notifier(events))
+
+        loader.load().send((documents('0'), {'last_update': '2021-01-01T00:00:00'}))
+
+        # API, получив сигнал, должно прочитать уже новое время загрузки
+        assert events == ['save', 'notify']
+        assert 'last_loaded' in storage.saved[-1]
@@ -0,0 +1,84 @@
+from queue import Queue
+
+import pytest
+
+import ETL
+from batch_size import BulkStats
+from ETL import coroutine
+
+
+class StopRuns(Exception):
+    pass
+
+
+class TestPipeline:
+
+    def test_stage_worker_recovers(self):
+        queue, received = Queue(), []
+
+        @coroutine
+        def stage():
+            while (item := (yield)) is not None:
+                if item == 'boom':
+                    raise KeyError(item)
+                received.append(item)
+
+        worker = ETL.StageWorker(queue, stage)
+        worker.start()
+        for item in (1, 'boom', 2):
+            queue.put(item)
+        queue.join()
+
+        assert received == [1]
+        assert isinstance(worker.error, KeyError)
+
+        worker.restart()
+        queue.put(3)
+        queue.join()
+
+        assert received == [1, 3]
+        assert worker.error is None
+
+    def test_run_continues_after_stage_error(self):
+        loaded = []
+
+        class Extractor:
+            runs = 0
+
+            def extract(self, transformer, limit):
+                self.runs += 1
+                if self.runs == 3:
+                    raise StopRuns
+                for i in range(4):
+                    transformer.send((self.runs, i))
+                return True
+
+        class Transformer:
+            @coroutine
+            def transform(self, loader):
+                while (item := (yield)) is not None:
+                    if item == (1, 1):
+                        raise KeyError('boom')
+                    loader.send(item)
+
+        class Loader:
+            finished = 0
+
+            @coroutine
+            def load(self):
+                while (item := (yield)) is not None:
+                    loaded.append(item)
+
+            def finish_run(self):
+                self.finished += 1
+
+            def take_stats(self):
+                return BulkStats()
+
+        loader = Loader()
+        with pytest.raises(StopRuns):
+            ETL.ETL(Extractor(), Transformer(), loader, limit=10, periodic=0, queue_size=2).run()
+
+        # пачки после ошибки первого запуска пропущены, второй запуск после перезапуска стадии загрузил всё
+        assert loaded == [(1, 0), (2, 0), (2, 1), (2, 2), (2, 3)]
+        assert loader.finished == 2
@@ -0,0 +1,26 @@
+import pytest
+
+from models import PersonMap
+from transformer.transormer import films_count, suggest_field
+
+from ..suggest_cases import FILMS_COUNT, WORD_STARTS
+
+
+class TestSuggestField:
+
+    @pytest.mark.parametrize(('text', 'inputs'), WORD_STARTS)
+    def test_word_starts(self, text, inputs):
+        assert suggest_field(text, 10) == {'input': inputs, 'weight': 10}
+
+    def test_negative_weight(self):
+        assert suggest_field('Star Wars', -1)['weight'] == 0
+
+    @pytest.mark.parametrize(('films', 'count'), FILMS_COUNT)
+    def test_films_count(self, films, count):
+        actor, writer, director = films
+        person = PersonMap(
+            _index='person', _id='1', id='1', full_name='George Lucas',
+            films_as_actor=actor, films_as_writer=writer, films_as_director=director,
+        )
+
+        assert films_count(person) == count
@@ -0,0 +1,33 @@
+import os
+import sys
+from types import ModuleType
+from typing import Dict
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+SRC_DIR = os.path.join(ROOT_DIR, 'src')
+ETL_DIR = os.path.join(ROOT_DIR, 'postgres_to_es')
+
+# модули, которые есть и у API, и у ETL
+SHARED_MODULES = {'models'}
+
+# отложенные модули из SHARED_MODULES: каталог -> загруженные из него модули
+stashed: Dict[str, Dict[str, ModuleType]] = {}
+
+
+def owner(module: ModuleType) -> str:
+    path = os.path.abspath(getattr(module, '__file__', None) or '')
+    return SRC_DIR if path.startswith(SRC_DIR + os.sep) else ETL_DIR
+
+
+def prefer(directory: str) -> None:
+    """
+    Ставит каталог первым в пути импорта, как при запуске API или ETL из него. Одноимённые модули
+    другого каталога откладываются, а не выгружаются: классы из них остаются теми же при возврате
+    """
+    if directory in sys.path:
+        sys.path.remove(directory)
+    sys.path.insert(0, directory)
+    for name, module in list(sys.modules.items()):
+        if name.split('.')[0] in SHARED_MODULES and owner(module) != directory:
+            stashed.setdefault(owner(module), {})[name] = sys.modules.pop(name)
+    sys.modules.update(stashed.pop(directory, {}))
@@ -0,0 +1,24 @@
+# подсказки строятся и в ETL (completion-поле), и в API (индекс префиксов в памяти):
+# обе копии проверяются на одних и тех же случаях
+
+# текст -> окончания с начала каждого слова, как они попадают в completion-поле
+WORD_STARTS = (
+    ('Star Wars', ['Star Wars', 'Wars']),
+    ('Star Wars - Episode I', ['Star Wars - Episode I', 'Wars - Episode I', 'Episode I', 'I']),
+    ('The Lord of the Rings: The Return of the King', [
+        'The Lord of the Rings: The Return of the King',
+        'Lord of the Rings: The Return of the King',
+        'of the Rings: The Return of the King',
+        'the Rings: The Return of the King',
+        'Rings: The Return of the King',
+        'The Return of the King',
+    ]),
+)
+
+# фильмы персоны по ролям -> сколько разных фильмов
+FILMS_COUNT = (
+    ((None, None, None), 0),
+    (('a', None, None), 1),
+    (('a, b', 'b', None), 2),
+    (('a, b, c', 'c,a', ' d '), 4),
+)